@@ -0,0 +1,108 @@
+import argparse
+from collections import Counter
+from lib.packet_trace import Event, load_trace
+
+
+def load_traces(paths):
+    """Merge the traces of several processes (client and server, workers).
+    Their monotonic timestamps share the clock of the machine, so events of
+    the same machine can be ordered together. Sessions are renumbered"""
+    sessions = []
+    events = []
+    for path in paths:
+        trace_sessions, trace_events = load_trace(path)
+        first_session = len(sessions)
+        sessions.extend({"trace": path, **info} for info in trace_sessions)
+        events.extend(
+            (timestamp, first_session + session_id, event, seq_number, base)
+            for timestamp, session_id, event, seq_number, base in trace_events
+        )
+    events.sort(key=lambda event: event[0])
+    return sessions, events
+
+
+def print_timeline(events, start_time):
+    for timestamp, session_id, event, seq_number, base in events:
+        print(
+            f"{timestamp - start_time:12.6f} s{session_id:<4} {event.name:<18} "
+            f"seq={seq_number} base={base}"
+        )
+
+
+def summarize(info, events):
+    counts = Counter(event for _, _, event, _, _ in events)
+    duration = events[-1][0] - events[0][0]
+    description = ", ".join(
+        f"{key}={value}" for key, value in info.items() if key != "trace"
+    )
+    lines = [f"{description} ({info['trace']})", f"  duration={duration:.6f}s"]
+
+    if counts[Event.SEND]:
+        sent = counts[Event.SEND] + counts[Event.RETRANSMIT]
+        max_in_flight = max(
+            seq_number - base + 1
+            for _, _, event, seq_number, base in events
+            if event == Event.SEND
+        )
+        lines.append(
+            f"  sent={sent} new={counts[Event.SEND]} "
+            f"retransmitted={counts[Event.RETRANSMIT]} "
+            f"({counts[Event.RETRANSMIT] / sent:.1%}) "
+            f"timeouts={counts[Event.TIMEOUT]} "
+            f"fast_retransmits={counts[Event.FAST_RETRANSMIT]} "
+            f"max_in_flight={max_in_flight}"
+        )
+        lines.append(
+            f"  acks={counts[Event.ACK]} duplicate_acks={counts[Event.DUPLICATE_ACK]}"
+        )
+        if duration > 0:
+            lines.append(f"  packets_per_second={counts[Event.SEND] / duration:.1f}")
+
+    received = (
+        counts[Event.DATA]
+        + counts[Event.DATA_OUT_OF_ORDER]
+        + counts[Event.DATA_DUPLICATE]
+    )
+    if received:
+        lines.append(
+            f"  received={received} in_order={counts[Event.DATA]} "
+            f"out_of_order={counts[Event.DATA_OUT_OF_ORDER]} "
+            f"duplicates={counts[Event.DATA_DUPLICATE]} "
+            f"acks_sent={counts[Event.ACK_SENT]}"
+        )
+        if duration > 0:
+            delivered = counts[Event.DATA] + counts[Event.DATA_OUT_OF_ORDER]
+            lines.append(f"  packets_per_second={delivered / duration:.1f}")
+
+    if not counts[Event.CLOSE]:
+        lines.append("  no CLOSE: the session didn't finish or the trace was cut")
+    return "\n".join(lines)
+
+
+parser = argparse.ArgumentParser(
+    description="Summarize packet traces recorded with --trace"
+)
+parser.add_argument("traces", nargs="+", help="trace files")
+parser.add_argument(
+    "--timeline", action="store_true", help="print every event in time order"
+)
+parser.add_argument(
+    "--session", type=int, action="append", help="only show this session (repeatable)"
+)
+args = parser.parse_args()
+
+sessions, events = load_traces(args.traces)
+if args.session:
+    events = [event for event in events if event[1] in args.session]
+if not events:
+    print("No events")
+    exit(0)
+
+if args.timeline:
+    print_timeline(events, events[0][0])
+
+events_by_session = {}
+for event in events:
+    events_by_session.setdefault(event[1], []).append(event)
+for session_id, session_events in sorted(events_by_session.items()):
+    print(f"Session {session_id}: {summarize(sessions[session_id], session_events)}")
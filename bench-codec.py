@@ -0,0 +1,128 @@
+import argparse
+from enum import Enum
+import timeit
+from lib.packet_codec import *
+
+LEGACY_TYPE_SIZE = 1
+LEGACY_HEADER_SIZE = LEGACY_TYPE_SIZE + SEQ_NUMBER_SIZE
+
+
+# Las funciones que reemplazo el codec, tal como estaban, para comparar
+class LegacyType(Enum):
+    DOWNLOAD = 0
+    UPLOAD = 1
+    ACK = 2
+    DATA = 3
+    CLOSE = 4
+    ERROR = 5
+    SACK = 6
+    PROBE = 7
+    DATA_COMPRESSED = 8
+
+
+LEGACY_DATA_TYPE_BYTES = LegacyType.DATA.value.to_bytes(LEGACY_TYPE_SIZE, "big")
+
+
+def legacy_get_header(packet):
+    type = LegacyType(int.from_bytes(packet[:LEGACY_TYPE_SIZE], "big"))
+    seq_number = int.from_bytes(packet[LEGACY_TYPE_SIZE:LEGACY_HEADER_SIZE], "big")
+
+    return type, seq_number
+
+
+def legacy_seq_number_to_bytes(seq_number):
+    return (seq_number % SEQ_NUMBER_SPACE).to_bytes(SEQ_NUMBER_SIZE, "big")
+
+
+def legacy_data_header(seq_number):
+    return LEGACY_DATA_TYPE_BYTES + legacy_seq_number_to_bytes(seq_number)
+
+
+def legacy_ack_packet(seq_number):
+    return LegacyType.ACK.value.to_bytes(
+        LEGACY_TYPE_SIZE, "big"
+    ) + legacy_seq_number_to_bytes(seq_number)
+
+
+def legacy_sack_packet(base, bitmap):
+    return (
+        LegacyType.SACK.value.to_bytes(LEGACY_TYPE_SIZE, "big")
+        + legacy_seq_number_to_bytes(base)
+        + bitmap
+    )
+
+
+def legacy_receive(packet):
+    """What the receive loop does with the header of each DATA packet"""
+    packet_type, seq_number = legacy_get_header(packet)
+    return packet_type == LegacyType.ACK or packet_type == LegacyType.DATA_COMPRESSED
+
+
+def codec_receive(packet):
+    packet_type, seq_number = decode_header(packet)
+    return packet_type == ACK_TYPE or packet_type == DATA_COMPRESSED_TYPE
+
+
+def run(statement, namespace, number, repeat):
+    times = timeit.repeat(statement, globals=namespace, number=number, repeat=repeat)
+    return min(times) / number * 1e9
+
+
+parser = argparse.ArgumentParser(
+    description="Compare the packet codec with the header functions it replaced"
+)
+parser.add_argument(
+    "-n", "--number", type=int, default=200000, help="calls per measurement"
+)
+parser.add_argument(
+    "-r", "--repeat", type=int, default=5, help="measurements, the best one is kept"
+)
+args = parser.parse_args()
+
+# Los paquetes se reciben como memoryviews de un buffer reusado
+seq_number = 123456
+legacy_buffer = bytearray(LEGACY_HEADER_SIZE + 4096)
+legacy_buffer[:LEGACY_HEADER_SIZE] = legacy_data_header(seq_number)
+codec_buffer = bytearray(HEADER_SIZE + 4096)
+codec_buffer[:HEADER_SIZE] = encode_header(DATA_TYPE, seq_number)
+namespace = {
+    **globals(),
+    "legacy_packet": memoryview(legacy_buffer),
+    "codec_packet": memoryview(codec_buffer),
+    "bitmap": bytes(4),
+}
+benchmarks = [
+    (
+        "decode header",
+        "legacy_get_header(legacy_packet)",
+        "decode_header(codec_packet)",
+    ),
+    (
+        "receive loop header",
+        "legacy_receive(legacy_packet)",
+        "codec_receive(codec_packet)",
+    ),
+    (
+        "DATA header",
+        "legacy_data_header(seq_number)",
+        "encode_header(DATA_TYPE, seq_number)",
+    ),
+    (
+        "ACK packet",
+        "legacy_ack_packet(seq_number)",
+        "encode_header(ACK_TYPE, seq_number)",
+    ),
+    (
+        "SACK packet",
+        "legacy_sack_packet(seq_number, bitmap)",
+        "encode_packet(SACK_TYPE, seq_number, bitmap)",
+    ),
+]
+print(f"{'':<22}{'legacy':>12}{'codec':>12}{'speedup':>10}")
+for name, legacy, codec in benchmarks:
+    legacy_time = run(legacy, namespace, args.number, args.repeat)
+    codec_time = run(codec, namespace, args.number, args.repeat)
+    print(
+        f"{name:<22}{legacy_time:>10.1f}ns{codec_time:>10.1f}ns"
+        f"{legacy_time / codec_time:>9.2f}x"
+    )
@@ -2,41 +2,188 @@ from lib.argument_parser import *
 from pathlib import Path
 from socket import *
 from lib.rdt_shared import *
+from lib.ack_policy import AckPolicy
+from lib.content_index import new_content_hasher
+from lib.file_sink import SyncPolicy
+from lib.packet_trace import PacketTrace
+from lib.pmtu import probe_path_mtu
+from lib.resume import get_partial_file
+from lib.rdt_sr import recv_file_sr
+from lib.rdt_sw import recv_file_sw
+from lib.transfer_params import *
+from lib.transfer_stats import TransferStats
+import threading
 import time
 
+
+def download(udp_socket, params):
+    """Download the file, or the range of one stream, and return the type of
+    the server's response to the handshake"""
+    response_type, _, response_payload = send_handshake(
+        udp_socket,
+        Type.DOWNLOAD,
+        (args.host, args.port),
+        build_request_payload(args.name, params),
+        args.verbose,
+    )
+    if response_type != Type.ACK:
+        return response_type
+
+    # Server nos devolvió el ACK con los parametros aceptados, y podemos continuar normalmente
+    requested_offset = params.offset
+    params = TransferParams.decode(response_payload, params)
+    verbose_print(f"Transfer params: {params}", args.verbose)
+    if params.resume and params.offset:
+        verbose_print(f"Resuming download from byte {params.offset}", True)
+    elif requested_offset:
+        verbose_print(
+            "The partial file doesn't match the server's, downloading from the start",
+            True,
+        )
+
+    # Si el server conoce el hash del archivo lo verificamos mientras llega
+    hasher = None
+    if params.content_hash and params.is_whole_file():
+        hasher = new_content_hasher()
+
+    transfer_stats = TransferStats()
+    trace = None
+    if packet_trace is not None:
+        trace = packet_trace.session(
+            {
+                "file": args.name,
+                "type": "download",
+                "protocol": params.protocol,
+                "stream": params.stream,
+            }
+        )
+    if params.protocol == PROTOCOL_SR:
+        udp_socket.settimeout(RECEIVER_TIMEOUT_SR)
+        if params.stream == 0:
+            verbose_print(f"Download using SELECTIVE REPEAT started", True)
+        completed = recv_file_sr(
+            udp_socket,
+            filepath,
+            args.verbose,
+            window_size=params.window_size,
+            sack=not args.plain_ack,
+            payload_size=params.payload_size,
+            sync_policy=sync_policy,
+            offset=params.offset,
+            length=params.length,
+            compression=params.compression,
+            hasher=hasher,
+            stats=transfer_stats,
+            trace=trace,
+            ack_policy=ack_policy,
+        )
+    else:
+        udp_socket.settimeout(RECEIVER_TIMEOUT_SW)
+        if params.stream == 0:
+            verbose_print(f"Download using STOP AND WAIT started", True)
+        completed = recv_file_sw(
+            udp_socket,
+            filepath,
+            args.verbose,
+            payload_size=params.payload_size,
+            sync_policy=sync_policy,
+            offset=params.offset,
+            length=params.length,
+            compression=params.compression,
+            hasher=hasher,
+            stats=transfer_stats,
+            trace=trace,
+        )
+    prefix = f"Stream {params.stream} " if params.streams > 1 else ""
+    verbose_print(f"{prefix}Transfer stats: {transfer_stats}", True)
+
+    if not completed:
+        # Lo recibido en orden quedo escrito y --resume sigue desde ahi, salvo
+        # en las descargas en paralelo, que no se pueden reanudar
+        hint = ""
+        if params.streams == 1:
+            hint = ", run it again with --resume to continue it"
+        verbose_print(
+            f"ERROR: The {prefix.lower()}download was interrupted{hint}", True
+        )
+        return Type.ERROR
+    if hasher is not None:
+        if hasher.hexdigest() != params.content_hash:
+            verbose_print(
+                "ERROR: The downloaded file doesn't match its content hash", True
+            )
+            return Type.ERROR
+        verbose_print("Content hash verified", args.verbose)
+    return response_type
+
+
+def download_stream(params, results):
+    # Cada stream es una sesion aparte, con su propio socket
+    udp_socket = socket(AF_INET, SOCK_DGRAM)
+    udp_socket.settimeout(HANDSHAKE_TIMEOUT)
+    results[params.stream] = download(udp_socket, params)
+    udp_socket.close()
+
+
 argsparser = ArgumentParser(ParserType.DOWNLOAD)
 args = argsparser.get_args(ParserType.DOWNLOAD)
-
-if args.protocol:
-    from lib.rdt_sr import recv_file_sr
-else:
-    from lib.rdt_sw import recv_file_sw
+filepath = args.dst + "/" + args.name
+sync_policy = SyncPolicy(args.sync_bytes, args.sync_interval)
+ack_policy = AckPolicy(
+    args.ack_every, args.ack_delay / 1000 if args.ack_delay is not None else None
+)
+packet_trace = PacketTrace() if args.trace else None
 
 verbose_print(f"Establishing connection to server...", True)
 
 udp_socket = socket(AF_INET, SOCK_DGRAM)
 udp_socket.settimeout(HANDSHAKE_TIMEOUT)
 
-response_type, _ = send_handshake(
-    udp_socket, Type.DOWNLOAD, (args.host, args.port), args.name, args.verbose
+params = TransferParams(
+    PROTOCOL_SR if args.protocol else PROTOCOL_SW, args.payload_size, args.window
 )
+params.compression = args.compress
+# Somos el receptor: el server suma al timeout lo que demoramos los ACK
+if params.protocol == PROTOCOL_SR and not args.plain_ack:
+    params.ack_delay = ack_policy.max_delay()
+if args.pmtu:
+    probed_payload_size = probe_path_mtu(
+        udp_socket, (args.host, args.port), args.verbose
+    )
+    if probed_payload_size is not None:
+        params.payload_size = min(params.payload_size, probed_payload_size)
+if args.resume:
+    # Le pasamos al server cuanto tenemos para que siga desde ahi
+    params.resume = True
+    params.offset, params.checksum = get_partial_file(filepath)
 
-if response_type == Type.ACK:
-    # Server nos devolvió el ACK, y podemos continuar normalmente
-    start_time = time.time()
-    if args.protocol:
-        udp_socket.settimeout(RECEIVER_TIMEOUT_SR)
-        verbose_print(f"Download using SELECTIVE REPEAT started", True)
-        recv_file_sr(udp_socket, args.dst + "/" + args.name, args.verbose)
-    else:
-        udp_socket.settimeout(RECEIVER_TIMEOUT_SW)
-        verbose_print(f"Download using STOP AND WAIT started", True)
-        recv_file_sw(udp_socket, args.dst + "/" + args.name, args.verbose)
+start_time = time.time()
+if args.streams > 1:
+    # Cada stream descarga un rango del archivo y lo escribe en su lugar
+    udp_socket.close()
+    results = [None] * args.streams
+    threads = []
+    for stream in range(args.streams):
+        stream_params = params.copy()
+        stream_params.stream = stream
+        stream_params.streams = args.streams
+        thread = threading.Thread(target=download_stream, args=(stream_params, results))
+        thread.start()
+        threads.append(thread)
+    for thread in threads:
+        thread.join()
+    response_type = Type.ACK if all(r == Type.ACK for r in results) else Type.ERROR
+else:
+    response_type = download(udp_socket, params)
+    udp_socket.close()
 
+if response_type == Type.ACK:
     end_time = time.time()
     verbose_print(f"Download time: {end_time - start_time}", True)
 
+if packet_trace is not None:
+    packet_trace.dump(args.trace)
+
 if response_type == Type.ERROR:
     # Hubo algún error
-    udp_socket.close()
     exit(1)
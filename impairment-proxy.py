@@ -0,0 +1,31 @@
+import argparse
+from lib.impairment_proxy import (
+    ImpairmentProxy,
+    add_impairment_arguments,
+    get_link_profile,
+)
+
+parser = argparse.ArgumentParser(
+    description="UDP proxy that impairs the traffic between clients and the server "
+    "(the same impairments in both directions)"
+)
+parser.add_argument(
+    "-H", "--host", default="127.0.0.1", help="address the proxy listens on"
+)
+parser.add_argument("-p", "--port", type=int, default=8081, help="proxy port")
+parser.add_argument("--server-host", default="127.0.0.1", help="server IP address")
+parser.add_argument("--server-port", type=int, default=8080, help="server port")
+add_impairment_arguments(parser)
+args = parser.parse_args()
+
+profile = get_link_profile(args)
+proxy = ImpairmentProxy(
+    (args.host, args.port), (args.server_host, args.server_port), profile, args.seed
+)
+print(f"Proxying {proxy.address} -> {proxy.server_address}: {profile}")
+try:
+    proxy.serve_forever()
+except KeyboardInterrupt:
+    print(f"Proxy stats: {proxy}")
+finally:
+    proxy.close()
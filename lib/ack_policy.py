@@ -0,0 +1,53 @@
+# Demora de un ACK pedido solo por cantidad: tiene que quedar por debajo del
+# RTO minimo del emisor para no provocar retransmisiones espurias
+DEFAULT_ACK_DELAY = 0.005
+# Una espera de 0 no bloquea en algunos sockets, asi que esperamos al menos esto
+MIN_ACK_WAIT = 0.0005
+
+
+class AckPolicy:
+    """When the selective repeat receiver acknowledges DATA that arrived in
+    order.
+
+    The ACK waits until ack_every packets are pending or ack_delay seconds
+    passed since the first of them, whichever comes first. SACKs are
+    cumulative, so one acknowledges every pending packet. Packets out of
+    order, duplicates and packets that fill a gap are acknowledged at once,
+    so the sender still detects losses right away. With neither set every
+    packet is acknowledged as it arrives.
+    """
+
+    def __init__(self, ack_every=None, ack_delay=None):
+        if ack_every is not None and ack_every <= 1:
+            # Confirmar cada paquete es no demorar ninguno
+            ack_every, ack_delay = None, None
+        self.ack_every = ack_every
+        if ack_every and ack_delay is None:
+            # Sin demora los ultimos paquetes del archivo esperarian su ACK
+            # hasta que el emisor los retransmita
+            ack_delay = DEFAULT_ACK_DELAY
+        self.ack_delay = ack_delay
+
+    def is_enabled(self):
+        return bool(self.ack_every) or bool(self.ack_delay)
+
+    def max_delay(self):
+        """Longest an in-order packet waits for its ACK, which the sender adds
+        to its timeout"""
+        return self.ack_delay if self.is_enabled() else 0
+
+    def should_ack(self, pending, first_pending_time, now):
+        if not self.is_enabled():
+            return True
+        if self.ack_every and pending >= self.ack_every:
+            return True
+        return now - first_pending_time >= self.ack_delay
+
+    def wait(self, first_pending_time, now):
+        """Seconds until the pending ACK is due"""
+        return max(MIN_ACK_WAIT, first_pending_time + self.ack_delay - now)
+
+    def __str__(self):
+        if not self.is_enabled():
+            return "immediate"
+        return f"every={self.ack_every or '-'} delay={self.ack_delay * 1000:.1f}ms"
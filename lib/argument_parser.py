@@ -2,9 +2,16 @@ import argparse
 from enum import Enum
 import ipaddress
 from pathlib import Path
+from lib.compression import CODECS, ZlibCodec
+from lib.congestion_control import CONGESTION_CONTROLS, CongestionControl
+from lib.rdt_shared import PAYLOAD_SIZE, WINDOW_SIZE
+from lib.session_loop import DEFAULT_MAX_SESSIONS
+from lib.transfer_params import MAX_STREAMS
 
 DEFAULT_HOST = "localhost"
 DEFAULT_PORT = 8080
+DEFAULT_CHUNK_CACHE_MB = 64
+SIZE_UNITS = {"K": 1 << 10, "M": 1 << 20, "G": 1 << 30}
 
 
 class ParserType(Enum):
@@ -73,25 +80,172 @@ class ArgumentParser:
             "--protocol",
             action="store_true",
             default=False,
-            help="error recovery protocol",
+            help="error recovery protocol (server: default for clients that don't negotiate it)",
         )
+        self.parser.add_argument(
+            "--plain-ack",
+            action="store_true",
+            default=False,
+            help="acknowledge each packet instead of sending SACKs (selective repeat)",
+        )
+        self.parser.add_argument(
+            "--cc",
+            metavar="",
+            choices=CONGESTION_CONTROLS.keys(),
+            default=CongestionControl.name,
+            help="congestion control algorithm: reno, delay or none (selective repeat)",
+        )
+        self.parser.add_argument(
+            "--cwnd-log",
+            metavar="",
+            help="write the congestion window history to this CSV file",
+        )
+        self.parser.add_argument(
+            "--trace",
+            metavar="",
+            help="record a binary trace of the packet events to this file (see analyze-trace.py)",
+        )
+        self.parser.add_argument(
+            "--window",
+            metavar="",
+            type=int,
+            default=WINDOW_SIZE,
+            help="window size in packets (server: maximum accepted)",
+        )
+        self.parser.add_argument(
+            "--payload-size",
+            metavar="",
+            type=int,
+            default=PAYLOAD_SIZE,
+            help="payload size in bytes (server: maximum accepted)",
+        )
+        # El que recibe archivos decide cuando bajarlos a disco
+        if self.type != ParserType.UPLOAD:
+            self.parser.add_argument(
+                "--sync-bytes",
+                metavar="",
+                type=int,
+                default=None,
+                help="fsync received data every this many bytes (default: only the OS flushes)",
+            )
+            self.parser.add_argument(
+                "--sync-interval",
+                metavar="",
+                type=float,
+                default=None,
+                help="fsync received data every this many seconds",
+            )
+            self.parser.add_argument(
+                "--ack-every",
+                metavar="",
+                type=int,
+                default=None,
+                help="acknowledge in-order packets once this many arrived (selective repeat with SACKs)",
+            )
+            self.parser.add_argument(
+                "--ack-delay",
+                metavar="",
+                type=float,
+                default=None,
+                help="milliseconds an in-order packet can wait for its ACK (default: 5 with --ack-every)",
+            )
 
     def add_client_arguments(self):
         """Add client-specific arguments"""
         # File options
         if self.type == ParserType.UPLOAD:
             self.parser.add_argument("-s", "--src", metavar="", help="source file path")
+            self.parser.add_argument(
+                "--dedup",
+                action="store_true",
+                default=False,
+                help="send the file's content hash so the server can skip the transfer if it already stores it",
+            )
+            self.parser.add_argument(
+                "--fast-open",
+                action="store_true",
+                default=False,
+                help="send the first bytes of the file in the UPLOAD request",
+            )
         else:
             self.parser.add_argument(
                 "-d", "--dst", metavar="", help="destination file path"
             )
 
         self.parser.add_argument("-n", "--name", metavar="", help="file name")
+        self.parser.add_argument(
+            "--pmtu",
+            action="store_true",
+            default=False,
+            help="probe the path MTU to pick a payload size that avoids IP fragmentation",
+        )
+        self.parser.add_argument(
+            "--resume",
+            action="store_true",
+            default=False,
+            help="continue an interrupted transfer from the partial file",
+        )
+        self.parser.add_argument(
+            "--streams",
+            metavar="",
+            type=int,
+            default=1,
+            help="number of parallel sessions, each transferring a range of the file",
+        )
+        self.parser.add_argument(
+            "--compress",
+            metavar="",
+            nargs="?",
+            choices=CODECS.keys(),
+            const=ZlibCodec.name,
+            default="",
+            help=f"compress the data with a codec: {', '.join(CODECS)} (default: zlib)",
+        )
 
     def add_server_arguments(self):
         """Add server-specific arguments"""
         # Server-specific options can be added here
         self.parser.add_argument("-s", "--storage", metavar="", help="storage dir path")
+        self.parser.add_argument(
+            "--event-loop",
+            action="store_true",
+            default=False,
+            help="serve every session from a single event loop instead of a thread pool",
+        )
+        self.parser.add_argument(
+            "--max-sessions",
+            metavar="",
+            type=int,
+            default=DEFAULT_MAX_SESSIONS,
+            help="maximum concurrent sessions in event loop mode",
+        )
+        self.parser.add_argument(
+            "--workers",
+            metavar="",
+            type=int,
+            default=1,
+            help="number of server processes sharing the port (SO_REUSEPORT)",
+        )
+        self.parser.add_argument(
+            "--chunk-cache",
+            metavar="",
+            type=int,
+            default=DEFAULT_CHUNK_CACHE_MB,
+            help="MiB of compressed chunks shared by the sessions of each worker (0 disables it)",
+        )
+        self.parser.add_argument(
+            "--fanout",
+            action="store_true",
+            default=False,
+            help="serve concurrent downloads of the same file from one broadcast session",
+        )
+        self.parser.add_argument(
+            "--stats-port",
+            metavar="",
+            type=int,
+            default=0,
+            help="serve the stats over HTTP on this local port, one port per worker",
+        )
 
     def get_args(self, app):
 
@@ -101,6 +255,16 @@ class ArgumentParser:
         if not is_valid_port(self.args.port):
             self.parser.exit(1, message="ERROR: The port is not valid\n")
 
+        if app != ParserType.SERVER:
+            if not 1 <= self.args.streams <= MAX_STREAMS:
+                self.parser.exit(
+                    1, message=f"ERROR: The number of streams must be 1 to {MAX_STREAMS}\n"
+                )
+            if self.args.streams > 1 and self.args.resume:
+                self.parser.exit(
+                    1, message="ERROR: A multi-stream transfer can't be resumed\n"
+                )
+
         if app == ParserType.SERVER:
             if not Path(self.args.storage).exists():
                 self.parser.exit(
@@ -116,13 +280,22 @@ class ArgumentParser:
                 self.parser.exit(
                     1, message=f"ERROR: The file {self.args.name} doesn't exist\n"
                 )
+            if self.args.fast_open and (self.args.resume or self.args.streams > 1):
+                self.parser.exit(
+                    1,
+                    message="ERROR: A fast-open upload can't be resumed nor split in streams\n",
+                )
 
         else:
             if not Path(self.args.dst).exists():
                 self.parser.exit(
                     1, message="ERROR: The destination file path doesn't exist\n"
                 )
-            if Path(self.args.dst + "/" + self.args.name).exists():
+            # Con --resume el archivo existente es la descarga parcial a continuar
+            if (
+                Path(self.args.dst + "/" + self.args.name).exists()
+                and not self.args.resume
+            ):
                 self.parser.exit(
                     1,
                     message=f"ERROR: A file named {self.args.name} already exists\n",
@@ -146,4 +319,15 @@ def is_valid_port(port):
     return 1023 < port <= 65535
 
 
+def parse_size(size):
+    """'512K', '10M' or a plain number of bytes"""
+    if size[-1].upper() in SIZE_UNITS:
+        return int(float(size[:-1]) * SIZE_UNITS[size[-1].upper()])
+    return int(size)
+
+
+def parse_list(value, parse=str):
+    return [parse(item) for item in value.split(",") if item]
+
+
 # Recheck
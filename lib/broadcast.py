@@ -0,0 +1,161 @@
+import os
+import threading
+import time
+from lib.rdt_shared import *
+from lib.chunk_cache import get_file_version
+from lib.file_chunks import FileChunks
+from lib.timer_queue import TimerQueue
+
+# Cada cuanto el broadcast revisa si se sumaron receptores nuevos
+BROADCAST_POLL_INTERVAL = 0.05
+
+
+class MemberChunks:
+    """A member's handle on the chunks of a broadcast: the chunks belong to
+    the broadcast, so releasing or closing them here does nothing"""
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.file = chunks.file
+        self.payload_size = chunks.payload_size
+
+    def chunk_offset(self, index):
+        return self.chunks.chunk_offset(index)
+
+    def get(self, index):
+        return self.chunks.get(index)
+
+    def is_compressed(self, index):
+        return False
+
+    def release(self, index):
+        pass
+
+    def close(self):
+        pass
+
+
+class BroadcastSession:
+    """Downloads of the same file to several receivers over one socket.
+
+    The file is mapped once and every member's sender takes its chunks from
+    that map. Each member is a regular sender task (see run_task) with its
+    own window, timers and congestion control, so only the packets a
+    receiver lost are resent to it and a slow receiver falls behind without
+    holding back the rest. The broadcast itself is a task too: it routes
+    each packet to the member it comes from and wakes each member when its
+    own wait expires. Members can join while it runs and it ends when the
+    last one finishes, then it calls on_close(broadcast) if given.
+    """
+
+    def __init__(
+        self,
+        udp_socket,
+        filepath,
+        payload_size,
+        verbose,
+        on_close=None,
+        clock=time.monotonic,
+    ):
+        self.udp_socket = udp_socket
+        self.clock = clock
+        self.on_close = on_close
+        self.filepath = filepath
+        self.verbose = verbose
+        self.file = open(filepath, "rb")
+        self.version = get_file_version(os.fstat(self.file.fileno()))
+        self.chunks = FileChunks(self.file, payload_size)
+        self.lock = threading.Lock()
+        # Receptores que se sumaron y todavia no arrancaron: address -> task
+        self.new_members = {}
+        self.members = {}
+        self.timers = TimerQueue()
+        self.closed = False
+
+    def add_member(self, client_address, create_task):
+        """Add a receiver, create_task(udp_socket, chunks) builds its sender
+        task. Return
+        False if the broadcast already ended or the file changed since it
+        started, then the receiver needs a new broadcast"""
+        try:
+            if get_file_version(os.stat(self.filepath)) != self.version:
+                return False
+        except OSError:
+            return False
+        with self.lock:
+            if self.closed:
+                return False
+            # Un pedido repetido: su sender ya esta reenviando la respuesta
+            if client_address in self.members or client_address in self.new_members:
+                return True
+            self.new_members[client_address] = create_task(
+                self.udp_socket, MemberChunks(self.chunks)
+            )
+        return True
+
+    def start_new_members(self):
+        with self.lock:
+            new_members = self.new_members
+            self.new_members = {}
+        for client_address, task in new_members.items():
+            verbose_print(
+                f"{client_address} joined the broadcast of {self.filepath}",
+                self.verbose,
+            )
+            self.members[client_address] = task
+            self.resume(client_address, None, first=True)
+
+    def resume(self, client_address, received, first=False):
+        task = self.members[client_address]
+        try:
+            wait = next(task) if first else task.send(received)
+        except StopIteration:
+            self.remove_member(client_address)
+            return
+        except Exception as error:
+            # Un receptor que falla no corta el broadcast de los demas
+            verbose_print(f"Broadcast to {client_address} failed: {error}", True)
+            self.remove_member(client_address)
+            return
+        self.timers.schedule(client_address, self.clock() + wait)
+
+    def remove_member(self, client_address):
+        del self.members[client_address]
+        self.timers.cancel(client_address)
+
+    def task(self):
+        try:
+            while True:
+                self.start_new_members()
+                if not self.members:
+                    with self.lock:
+                        if not self.new_members:
+                            self.closed = True
+                            return
+                    continue
+
+                received = yield min(
+                    self.timers.time_until_next(
+                        self.clock(), BROADCAST_POLL_INTERVAL
+                    ),
+                    BROADCAST_POLL_INTERVAL,
+                )
+                if received is not None and received[1] in self.members:
+                    self.resume(received[1], received)
+
+                for client_address in self.timers.pop_expired(self.clock()):
+                    if client_address in self.members:
+                        self.resume(client_address, None)
+        finally:
+            with self.lock:
+                self.closed = True
+                tasks = list(self.members.values()) + list(self.new_members.values())
+            # Cerrar los senders suelta sus vistas del archivo antes de cerrarlo
+            for task in tasks:
+                task.close()
+            self.members.clear()
+            self.new_members.clear()
+            self.chunks.close()
+            self.file.close()
+            if self.on_close is not None:
+                self.on_close(self)
@@ -0,0 +1,91 @@
+from collections import OrderedDict
+import threading
+
+# Memoria aproximada de una entrada ademas de su valor (clave, nodo del dict)
+ENTRY_OVERHEAD = 128
+
+
+def get_file_version(stat):
+    """Identity of a file and of its current contents, from its stat"""
+    return (stat.st_dev, stat.st_ino), (stat.st_size, stat.st_mtime_ns)
+
+
+class ChunkCache:
+    """Encoded chunks shared by every session of a server process, with LRU
+    eviction once they take more than max_bytes.
+
+    Keys start with the identity and version of the file the chunk comes
+    from, so chunks of a file that changed are never served: when a session
+    opens a file whose version differs from the one cached, the old chunks
+    are dropped right away instead of waiting to be evicted.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.size = 0
+        # file id -> (version, claves cacheadas de esa version)
+        self.files = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def open_file(self, stat):
+        """Return the key prefix for chunks of the file as it is now"""
+        file_id, version = get_file_version(stat)
+        with self.lock:
+            cached_version, keys = self.files.get(file_id, (version, set()))
+            if cached_version != version:
+                for key in list(keys):
+                    self.remove(key)
+                self.invalidations += 1
+                keys = set()
+            self.files[file_id] = (version, keys)
+        return file_id, version
+
+    def get(self, key):
+        with self.lock:
+            value = self.entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        entry_size = len(value) + ENTRY_OVERHEAD
+        if entry_size > self.max_bytes:
+            return
+        file_id, version = key[0]
+        with self.lock:
+            cached_version, keys = self.files.get(file_id, (None, None))
+            # El archivo cambio mientras se codificaba el chunk
+            if cached_version != version or key in self.entries:
+                return
+            self.entries[key] = value
+            keys.add(key)
+            self.size += entry_size
+            while self.size > self.max_bytes:
+                self.remove(next(iter(self.entries)))
+                self.evictions += 1
+
+    def remove(self, key):
+        value = self.entries.pop(key, None)
+        if value is None:
+            return
+        self.size -= len(value) + ENTRY_OVERHEAD
+        _, keys = self.files[key[0][0]]
+        keys.discard(key)
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                "chunk_cache_hits": self.hits,
+                "chunk_cache_misses": self.misses,
+                "chunk_cache_evictions": self.evictions,
+                "chunk_cache_invalidations": self.invalidations,
+                "chunk_cache_bytes": self.size,
+            }
@@ -0,0 +1,277 @@
+from concurrent.futures import ThreadPoolExecutor, wait
+import os
+import threading
+import zlib
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import lz4.block
+except ImportError:
+    lz4 = None
+
+ZLIB_LEVEL = 1
+ZSTD_LEVEL = 3
+
+# Despues de tantos chunks incompresibles seguidos solo se prueba comprimir
+# uno de cada INCOMPRESSIBLE_SAMPLE_INTERVAL, el resto se manda crudo
+INCOMPRESSIBLE_STREAK = 8
+INCOMPRESSIBLE_SAMPLE_INTERVAL = 32
+
+# Chunks que se comprimen por adelantado cuando no hay una window que lo defina
+COMPRESSION_LOOKAHEAD = 4
+
+
+class ZlibCodec:
+    """Raw deflate: no zlib header nor checksum, UDP already checks the packet"""
+
+    name = "zlib"
+
+    def compress(self, data):
+        compressor = zlib.compressobj(ZLIB_LEVEL, zlib.DEFLATED, -zlib.MAX_WBITS)
+        return compressor.compress(data) + compressor.flush()
+
+    def decompress(self, data, max_size):
+        decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+        try:
+            chunk = decompressor.decompress(data, max_size)
+        except zlib.error as e:
+            raise ValueError(f"Invalid {self.name} chunk: {e}")
+        if not decompressor.eof or decompressor.unconsumed_tail:
+            raise ValueError(f"Invalid {self.name} chunk")
+        return chunk
+
+
+class ZstdCodec:
+    name = "zstd"
+
+    def compress(self, data):
+        # Los compresores de zstandard no se pueden compartir entre threads
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+
+    def decompress(self, data, max_size):
+        try:
+            chunk = zstandard.ZstdDecompressor().decompress(
+                data, max_output_size=max_size
+            )
+        except zstandard.ZstdError as e:
+            raise ValueError(f"Invalid {self.name} chunk: {e}")
+        if len(chunk) > max_size:
+            raise ValueError(f"Invalid {self.name} chunk")
+        return chunk
+
+
+class Lz4Codec:
+    name = "lz4"
+
+    def compress(self, data):
+        return lz4.block.compress(data, store_size=False)
+
+    def decompress(self, data, max_size):
+        try:
+            return lz4.block.decompress(data, uncompressed_size=max_size)
+        except lz4.block.LZ4BlockError as e:
+            raise ValueError(f"Invalid {self.name} chunk: {e}")
+
+
+# Solo los codecs cuyas librerias estan instaladas
+CODECS = {ZlibCodec.name: ZlibCodec}
+if zstandard is not None:
+    CODECS[ZstdCodec.name] = ZstdCodec
+if lz4 is not None:
+    CODECS[Lz4Codec.name] = Lz4Codec
+
+
+def get_codec(name):
+    """Codec for a negotiated compression, None if the transfer isn't compressed"""
+    if not name:
+        return None
+    return CODECS[name]()
+
+
+def decompress_chunk(codec, payload, max_size):
+    """Payload of a compressed DATA packet, None if it can't be decompressed"""
+    if codec is None:
+        return None
+    try:
+        return codec.decompress(payload, max_size)
+    except ValueError:
+        return None
+
+
+executor = None
+executor_lock = threading.Lock()
+
+
+def get_executor():
+    # Un solo pool por proceso para todas las sesiones. Los codecs liberan el
+    # GIL mientras comprimen, asi que los threads corren en paralelo al envio
+    global executor
+    with executor_lock:
+        if executor is None:
+            executor = ThreadPoolExecutor(
+                max_workers=os.cpu_count() or 1, thread_name_prefix="compression"
+            )
+        return executor
+
+
+def compress_if_smaller(codec, data):
+    compressed = codec.compress(data)
+    if len(compressed) < len(data):
+        return compressed
+    return None
+
+
+class CompressedChunks:
+    """Chunks of a FileChunks as they go on the wire, compressed or raw.
+
+    A thread pool compresses the chunks up to lookahead chunks ahead of the
+    one the sender asks for, so compressing never blocks the send loop: a
+    chunk whose compression hasn't finished when it's needed is sent raw.
+    So are chunks that don't shrink, and after a streak of those (media
+    files) only a sample of the chunks is tried. The choice made for a chunk
+    is kept until release() so its retransmissions reuse it.
+
+    With a ChunkCache the results are shared with the other sessions sending
+    the same file, which then skip compressing those chunks.
+    """
+
+    def __init__(self, chunks, codec, lookahead=COMPRESSION_LOOKAHEAD, cache=None):
+        self.chunks = chunks
+        self.codec = codec
+        self.lookahead = lookahead
+        self.executor = get_executor()
+        self.cache = cache
+        if cache is not None:
+            self.cache_prefix = cache.open_file(os.fstat(chunks.file.fileno()))
+        # index -> future con el chunk comprimido, o None si no achica
+        self.pending = {}
+        # index -> resultado sacado del cache, con el mismo formato
+        self.ready = {}
+        # index -> chunk comprimido, o None si se manda crudo
+        self.compressed = {}
+        # Futures descartados que todavia corren, con una vista del archivo
+        self.discarded = []
+        self.submitted_index = 0
+        self.released_index = 0
+        self.incompressible_streak = 0
+        self.raw_bytes = 0
+        self.sent_bytes = 0
+        self.n_compressed = 0
+        self.n_raw = 0
+        self.n_late = 0
+        self.n_cached = 0
+
+    def cache_key(self, index, data):
+        # El largo distingue el ultimo chunk de un rango del chunk completo
+        return (
+            self.cache_prefix,
+            self.chunks.chunk_offset(index),
+            len(data),
+            self.codec.name,
+        )
+
+    def submit_ahead(self, index):
+        self.submitted_index = max(self.submitted_index, index)
+        while self.submitted_index < index + self.lookahead:
+            data = self.chunks.get(self.submitted_index)
+            if not data:
+                break
+            if (
+                self.incompressible_streak < INCOMPRESSIBLE_STREAK
+                or self.submitted_index % INCOMPRESSIBLE_SAMPLE_INTERVAL == 0
+            ):
+                self.submit(self.submitted_index, data)
+            self.submitted_index += 1
+
+    def submit(self, index, data):
+        if self.cache is not None:
+            cached = self.cache.get(self.cache_key(index, data))
+            if cached is not None:
+                # Un chunk incompresible se cachea vacio
+                self.ready[index] = cached or None
+                return
+        self.pending[index] = self.executor.submit(compress_if_smaller, self.codec, data)
+
+    def count_result(self, compressed):
+        if compressed is None:
+            self.incompressible_streak += 1
+            self.n_raw += 1
+        else:
+            self.incompressible_streak = 0
+            self.n_compressed += 1
+
+    def get(self, index):
+        """Return what is sent for the chunk at index, empty past the end"""
+        if index in self.compressed:
+            return self.compressed[index] or self.chunks.get(index)
+
+        self.submit_ahead(index)
+        data = self.chunks.get(index)
+        if not data:
+            return data
+        future = self.pending.pop(index, None)
+        compressed = None
+        if index in self.ready:
+            compressed = self.ready.pop(index)
+            self.count_result(compressed)
+            self.n_cached += 1
+        elif future is None:
+            self.n_raw += 1
+        elif not future.done():
+            # No esperamos: mandarlo crudo es mas rapido que frenar el envio
+            self.discard(future)
+            self.n_late += 1
+        else:
+            compressed = future.result()
+            self.count_result(compressed)
+            if self.cache is not None:
+                self.cache.put(self.cache_key(index, data), compressed or b"")
+
+        self.compressed[index] = compressed
+        self.raw_bytes += len(data)
+        self.sent_bytes += len(compressed) if compressed else len(data)
+        return compressed or data
+
+    def discard(self, future):
+        if future.cancel() or future.done():
+            return
+        self.discarded = [f for f in self.discarded if not f.done()]
+        self.discarded.append(future)
+
+    def is_compressed(self, index):
+        return self.compressed.get(index) is not None
+
+    def release(self, index):
+        """Forget every chunk before index, they won't be sent again"""
+        for released_index in range(self.released_index, index):
+            self.compressed.pop(released_index, None)
+            self.ready.pop(released_index, None)
+            future = self.pending.pop(released_index, None)
+            if future is not None:
+                self.discard(future)
+        self.released_index = max(self.released_index, index)
+        self.chunks.release(index)
+
+    def close(self):
+        # Los chunks que se estan comprimiendo tienen vistas del archivo
+        for future in self.pending.values():
+            self.discard(future)
+        wait(self.discarded)
+        self.pending.clear()
+        self.ready.clear()
+        self.discarded.clear()
+        self.compressed.clear()
+        self.chunks.close()
+
+    def __str__(self):
+        ratio = self.sent_bytes / self.raw_bytes if self.raw_bytes else 1
+        return (
+            f"codec={self.codec.name} raw_bytes={self.raw_bytes} "
+            f"sent_bytes={self.sent_bytes} ratio={ratio:.2f} "
+            f"compressed={self.n_compressed} raw={self.n_raw} late={self.n_late} "
+            f"cached={self.n_cached}"
+        )
@@ -0,0 +1,132 @@
+import time
+
+INITIAL_CWND = 4
+MIN_CWND = 1
+
+# Umbrales del control basado en delay (en paquetes encolados, como TCP Vegas)
+DELAY_ALPHA = 2
+DELAY_BETA = 4
+
+
+class CongestionControl:
+    """Congestion window in packets, separate from the flow control window.
+
+    Grows with slow start until ssthresh and then linearly (additive increase),
+    and shrinks multiplicatively on loss. Subclasses change how the window
+    grows once an RTT sample is known. With record_history every change is
+    recorded in history, to dump it; otherwise nothing is kept.
+    """
+
+    name = "reno"
+
+    def __init__(self, max_cwnd, clock=time.monotonic, record_history=False):
+        self.clock = clock
+        self.max_cwnd = max_cwnd
+        self.cwnd = min(INITIAL_CWND, max_cwnd)
+        self.ssthresh = max_cwnd
+        self.start_time = clock()
+        # Una transferencia larga cambia la cwnd millones de veces
+        self.history = [] if record_history else None
+        self.record()
+
+    def window(self):
+        """Number of packets that may be in flight"""
+        return max(MIN_CWND, int(self.cwnd))
+
+    def record(self):
+        if self.history is None:
+            return
+        self.history.append(
+            (self.clock() - self.start_time, self.cwnd, self.ssthresh)
+        )
+
+    def set_cwnd(self, cwnd):
+        cwnd = min(max(cwnd, MIN_CWND), self.max_cwnd)
+        changed = int(cwnd) != int(self.cwnd)
+        self.cwnd = cwnd
+        if changed:
+            self.record()
+
+    def on_ack(self, n_acked, rtt):
+        if self.cwnd < self.ssthresh:
+            # slow start: +1 por cada paquete ACKeado
+            self.set_cwnd(self.cwnd + n_acked)
+        else:
+            # congestion avoidance: +1 por RTT
+            self.set_cwnd(self.cwnd + n_acked / self.cwnd)
+
+    def on_loss(self):
+        """Loss detected by SACK: halve the window"""
+        self.ssthresh = max(self.cwnd / 2, 2 * MIN_CWND)
+        self.set_cwnd(self.ssthresh)
+
+    def on_timeout(self):
+        """Retransmission timeout: restart from slow start"""
+        self.ssthresh = max(self.cwnd / 2, 2 * MIN_CWND)
+        self.set_cwnd(MIN_CWND)
+
+    def dump(self, path):
+        with open(path, "w") as file:
+            file.write("time,cwnd,ssthresh\n")
+            for elapsed, cwnd, ssthresh in self.history or ():
+                file.write(f"{elapsed:.6f},{cwnd:.2f},{ssthresh:.2f}\n")
+
+    def __str__(self):
+        return f"{self.name} cwnd={self.cwnd:.2f} ssthresh={self.ssthresh:.2f}"
+
+
+class DelayBasedCongestionControl(CongestionControl):
+    """Vegas-like variant: compares the expected and actual throughput to
+    estimate how many packets are queued in the path, and keeps that number
+    between DELAY_ALPHA and DELAY_BETA instead of growing until a loss."""
+
+    name = "delay"
+
+    def __init__(self, max_cwnd, clock=time.monotonic, record_history=False):
+        super().__init__(max_cwnd, clock, record_history)
+        self.base_rtt = None
+
+    def on_ack(self, n_acked, rtt):
+        if rtt.srtt is None:
+            return super().on_ack(n_acked, rtt)
+
+        if self.base_rtt is None or rtt.srtt < self.base_rtt:
+            self.base_rtt = rtt.srtt
+        queued = self.cwnd * (1 - self.base_rtt / max(rtt.srtt, 1e-9))
+
+        if self.cwnd < self.ssthresh:
+            if queued > DELAY_ALPHA:
+                # salimos de slow start antes de llenar la cola
+                self.ssthresh = self.cwnd
+            else:
+                self.set_cwnd(self.cwnd + n_acked)
+        elif queued < DELAY_ALPHA:
+            self.set_cwnd(self.cwnd + n_acked / self.cwnd)
+        elif queued > DELAY_BETA:
+            self.set_cwnd(self.cwnd - n_acked / self.cwnd)
+
+
+class FixedWindow(CongestionControl):
+    """Always uses the whole flow control window (previous behavior)"""
+
+    name = "none"
+
+    def __init__(self, max_cwnd, clock=time.monotonic, record_history=False):
+        super().__init__(max_cwnd, clock, record_history)
+        self.set_cwnd(max_cwnd)
+
+    def on_ack(self, n_acked, rtt):
+        pass
+
+    def on_loss(self):
+        pass
+
+    def on_timeout(self):
+        pass
+
+
+CONGESTION_CONTROLS = {
+    CongestionControl.name: CongestionControl,
+    DelayBasedCongestionControl.name: DelayBasedCongestionControl,
+    FixedWindow.name: FixedWindow,
+}
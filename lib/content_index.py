@@ -0,0 +1,222 @@
+import fcntl
+import hashlib
+import json
+import os
+import shutil
+import threading
+
+HASH_BLOCK_SIZE = 1024 * 1024
+# Indice guardado en el storage, para no volver a hashear lo que no cambio
+INDEX_FILENAME = ".content-index.json"
+# Los workers del server comparten el indice guardado: uno a la vez lo escribe
+INDEX_LOCK_FILENAME = ".content-index.lock"
+# ioctl de Linux que clona un archivo compartiendo sus bloques (reflink)
+FICLONE = 0x40049409
+
+
+def new_content_hasher():
+    return hashlib.sha256()
+
+
+def file_content_hash(filepath):
+    """Hash of the file contents, read in a single streaming pass"""
+    hasher = new_content_hasher()
+    with open(filepath, "rb") as file:
+        while block := file.read(HASH_BLOCK_SIZE):
+            hasher.update(block)
+    return hasher.hexdigest()
+
+
+def clone_or_copy(source_path, target_path):
+    """Copy a file, sharing its blocks (a reflink) where the filesystem can.
+    Never a hardlink: the copy is another inode, so truncating one name can't
+    truncate the other while it is mapped by a session that serves it"""
+    with open(source_path, "rb") as source, open(target_path, "wb") as target:
+        try:
+            fcntl.ioctl(target.fileno(), FICLONE, source.fileno())
+            return
+        except OSError:
+            # Sin reflink (ext4, otro sistema de archivos): se copia entero
+            pass
+    shutil.copyfile(source_path, target_path)
+
+
+class ContentIndex:
+    """Content hash of every file in the storage dir, to find stored copies.
+
+    Entries remember the inode, size and mtime of the file when it was hashed
+    and are dropped when the file changes or disappears, so files edited
+    outside the server are never matched by a stale hash.
+
+    The index is saved in the storage dir and loaded at startup, so a file is
+    hashed once and not on every start. The first lookup starts a thread
+    that hashes the files the index doesn't know yet. Lookups never wait for
+    it: until it gets to a file, that file has no hash.
+
+    The workers of the server share the saved index through a lock file.
+    The first one to build it hashes the storage while the others wait for
+    the lock, then they load what it saved instead of hashing it again.
+    Saves merge the saved index with this one, so no worker drops what
+    another added.
+    """
+
+    def __init__(self, storage_dir):
+        self.storage_dir = storage_dir
+        self.index_path = os.path.join(storage_dir, INDEX_FILENAME)
+        self.lock_path = os.path.join(storage_dir, INDEX_LOCK_FILENAME)
+        self.lock = threading.Lock()
+        # path -> (hash, size, mtime, inode)
+        self.entries = {}
+        # hash -> paths con ese contenido
+        self.paths_by_hash = {}
+        self.build_thread = None
+
+    def load(self):
+        """Load the saved index, return how many of its entries are current"""
+        try:
+            with open(self.index_path) as file:
+                saved = json.load(file)
+            with self.lock:
+                for filename, (content_hash, size, mtime, inode) in saved.items():
+                    path = os.path.join(self.storage_dir, filename)
+                    # Lo que ya tenemos es igual o mas nuevo que lo guardado
+                    if path in self.entries:
+                        continue
+                    self.entries[path] = (content_hash, size, mtime, inode)
+                    self.paths_by_hash.setdefault(content_hash, set()).add(path)
+                    if not self.is_current(path):
+                        self.remove_entry(path)
+        except (OSError, ValueError, TypeError, AttributeError):
+            # Sin indice guardado, o uno ilegible: los archivos se hashean de nuevo
+            pass
+        return len(self.entries)
+
+    def lock_saved_index(self, blocking):
+        """Take the lock of the saved index and return its file, closing it
+        releases the lock. None if another worker holds it and blocking is
+        False, or if the storage is read-only"""
+        try:
+            lock_file = open(self.lock_path, "a")
+        except OSError:
+            return None
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+        except OSError:
+            lock_file.close()
+            return None
+        return lock_file
+
+    def save(self):
+        """Merge the saved index with this one and save the result. If another
+        worker holds the lock (building the index can take long) the save is
+        skipped, the entries are saved with the next one"""
+        lock_file = self.lock_saved_index(blocking=False)
+        if lock_file is None:
+            return
+        with lock_file:
+            self.load()
+            self.write()
+
+    def write(self):
+        with self.lock:
+            saved = {
+                os.path.basename(path): entry for path, entry in self.entries.items()
+            }
+            # Se escribe aparte y se reemplaza, para no dejar un indice a medias
+            temp_path = f"{self.index_path}.{os.getpid()}"
+            try:
+                with open(temp_path, "w") as file:
+                    json.dump(saved, file)
+                os.replace(temp_path, self.index_path)
+            except OSError:
+                # Un storage de solo lectura mantiene el indice en memoria
+                pass
+
+    def build(self):
+        """Hash the stored files the index doesn't know yet"""
+        # Si otro worker lo esta construyendo esperamos y usamos lo que guardo
+        lock_file = self.lock_saved_index(blocking=True)
+        try:
+            self.load()
+            for entry in os.scandir(self.storage_dir):
+                if not entry.is_file() or entry.name in (
+                    INDEX_FILENAME,
+                    INDEX_LOCK_FILENAME,
+                ):
+                    continue
+                if self.lookup(entry.path) is None:
+                    try:
+                        self.add(entry.path, file_content_hash(entry.path), save=False)
+                    except OSError:
+                        # Se borro mientras lo leiamos
+                        continue
+            self.write()
+        finally:
+            if lock_file is not None:
+                lock_file.close()
+        return len(self.entries)
+
+    def start_build(self):
+        """Build the index in a thread, the first time it's needed"""
+        with self.lock:
+            if self.build_thread is not None:
+                return
+            self.build_thread = threading.Thread(target=self.build, daemon=True)
+        self.build_thread.start()
+
+    def add(self, path, content_hash, save=True):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return
+        with self.lock:
+            self.remove_entry(path)
+            self.entries[path] = (
+                content_hash,
+                stat.st_size,
+                stat.st_mtime_ns,
+                stat.st_ino,
+            )
+            self.paths_by_hash.setdefault(content_hash, set()).add(path)
+        if save:
+            self.save()
+
+    def remove_entry(self, path):
+        if path not in self.entries:
+            return
+        content_hash = self.entries.pop(path)[0]
+        self.paths_by_hash[content_hash].discard(path)
+        if not self.paths_by_hash[content_hash]:
+            del self.paths_by_hash[content_hash]
+
+    def is_current(self, path):
+        _, size, mtime, inode = self.entries[path]
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return False
+        return (stat.st_size, stat.st_mtime_ns, stat.st_ino) == (size, mtime, inode)
+
+    def lookup(self, path):
+        with self.lock:
+            if path not in self.entries:
+                return None
+            if not self.is_current(path):
+                self.remove_entry(path)
+                return None
+            return self.entries[path][0]
+
+    def get_hash(self, path):
+        """Hash of a stored file, None if not indexed yet or changed since"""
+        self.start_build()
+        return self.lookup(path)
+
+    def find(self, content_hash):
+        """A stored file with this content, or None"""
+        self.start_build()
+        with self.lock:
+            for path in list(self.paths_by_hash.get(content_hash, ())):
+                if self.is_current(path):
+                    return path
+                self.remove_entry(path)
+            return None
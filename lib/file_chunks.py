@@ -0,0 +1,77 @@
+import mmap
+
+
+class FileChunks:
+    """The chunks of payload_size bytes a sender sends, addressed by index.
+
+    Chunks cover length bytes from start_offset (the rest of the file if
+    length is None), the range a resumed transfer or a stream sends. Regular
+    files are memory-mapped and a chunk is a zero-copy slice of the map, so
+    sending or retransmitting a packet needs nothing but its index. Inputs
+    that can't be mapped (empty files, pipes, special files) are read
+    sequentially and each chunk is kept until release().
+
+    A mapped file must not be truncated while it is sent: reading a page past
+    its new end raises SIGBUS and kills the process. The server never writes
+    to a stored file, it replaces it, but a file truncated from outside the
+    server while it is served still takes the server down.
+    """
+
+    def __init__(self, file, payload_size, start_offset=0, length=None):
+        self.file = file
+        self.payload_size = payload_size
+        self.start_offset = start_offset
+        self.end_offset = None if length is None else start_offset + length
+        self.map = None
+        self.view = None
+        # Solo para la lectura secuencial: chunks leidos que siguen en vuelo
+        self.cached = {}
+        self.next_index = 0
+        self.released_index = 0
+        try:
+            self.map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            self.view = memoryview(self.map)
+        except (ValueError, OSError):
+            if start_offset:
+                file.seek(start_offset)
+
+    def is_mapped(self):
+        return self.map is not None
+
+    def chunk_offset(self, index):
+        return self.start_offset + index * self.payload_size
+
+    def get(self, index):
+        """Return the chunk at index, empty past the end of the file"""
+        if self.view is not None:
+            offset = self.chunk_offset(index)
+            end = offset + self.payload_size
+            if self.end_offset is not None:
+                end = min(end, self.end_offset)
+            return self.view[offset:end]
+
+        if index not in self.cached:
+            if index != self.next_index:
+                raise ValueError(f"Chunk #{index} can't be read out of order")
+            size = self.payload_size
+            if self.end_offset is not None:
+                offset = self.chunk_offset(index)
+                size = max(0, min(size, self.end_offset - offset))
+            self.cached[index] = self.file.read(size)
+            self.next_index += 1
+        return self.cached[index]
+
+    def is_compressed(self, index):
+        return False
+
+    def release(self, index):
+        """Forget every chunk before index, they won't be sent again"""
+        for cached_index in range(self.released_index, index):
+            self.cached.pop(cached_index, None)
+        self.released_index = max(self.released_index, index)
+
+    def close(self):
+        if self.view is not None:
+            self.view.release()
+            self.map.close()
+        self.cached.clear()
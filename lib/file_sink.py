@@ -0,0 +1,143 @@
+import os
+import time
+
+# El archivo destino se reserva en el disco de a bloques de este tamaño
+PREALLOCATE_SIZE = 4 * 1024 * 1024
+
+
+class SyncPolicy:
+    """When the receiver forces written data to disk with fsync.
+
+    Data is synced after sync_bytes bytes or sync_interval seconds since the
+    last sync, whichever comes first, and when the file is closed. With
+    neither set the data is left to the OS page cache.
+    """
+
+    def __init__(self, sync_bytes=None, sync_interval=None):
+        self.sync_bytes = sync_bytes
+        self.sync_interval = sync_interval
+
+    def is_enabled(self):
+        return bool(self.sync_bytes) or bool(self.sync_interval)
+
+    def should_sync(self, unsynced_bytes, last_sync_time, now):
+        if self.sync_bytes and unsynced_bytes >= self.sync_bytes:
+            return True
+        if self.sync_interval and now - last_sync_time >= self.sync_interval:
+            return True
+        return False
+
+
+class FileSink:
+    """Writes received chunks straight at their offset in the file.
+
+    Chunks can arrive in any order and are never buffered, so the receiver's
+    memory doesn't grow with the window. The file is extended ahead of the
+    writes and truncated to the received data when closed. Chunks start at
+    start_offset: whatever the file had after it is discarded.
+
+    With a length the sink only owns that byte range of a file other sinks
+    (the other streams of the transfer) are also writing, so it never
+    truncates the file nor extends it past the range.
+
+    A hasher is fed the chunks in file order: in-order chunks straight from
+    the packet, and chunks that arrived early are read back from the file
+    once the gap before them is filled.
+    """
+
+    def __init__(
+        self,
+        filepath,
+        payload_size,
+        sync_policy=None,
+        start_offset=0,
+        length=None,
+        hasher=None,
+    ):
+        self.fd = os.open(filepath, os.O_RDWR | os.O_CREAT, 0o644)
+        self.payload_size = payload_size
+        self.sync_policy = sync_policy if sync_policy is not None else SyncPolicy()
+        self.start_offset = start_offset
+        self.range_end = None if length is None else start_offset + length
+        if self.range_end is None:
+            os.ftruncate(self.fd, start_offset)
+        self.allocated_size = self.start_offset
+        # Fin del dato escrito mas lejano
+        self.end_offset = self.start_offset
+        self.unsynced_bytes = 0
+        self.last_sync_time = time.monotonic()
+        self.hasher = hasher
+        self.hashed_chunks = 0
+        # Chunks escritos antes que los anteriores, con su largo
+        self.unhashed_chunks = {}
+
+    def preallocate(self, offset):
+        if offset <= self.allocated_size:
+            return
+        new_size = max(offset, self.allocated_size + PREALLOCATE_SIZE)
+        if self.range_end is not None:
+            new_size = max(offset, min(new_size, self.range_end))
+        if hasattr(os, "posix_fallocate"):
+            try:
+                os.posix_fallocate(
+                    self.fd, self.allocated_size, new_size - self.allocated_size
+                )
+            except OSError:
+                # El sistema de archivos no lo soporta, el archivo crece al escribir
+                return
+        self.allocated_size = new_size
+
+    def write(self, index, payload):
+        offset = self.start_offset + index * self.payload_size
+        self.preallocate(offset + len(payload))
+        if hasattr(os, "pwrite"):
+            os.pwrite(self.fd, payload, offset)
+        else:
+            os.lseek(self.fd, offset, os.SEEK_SET)
+            os.write(self.fd, payload)
+        self.end_offset = max(self.end_offset, offset + len(payload))
+        if self.hasher is not None:
+            self.hash_in_order(index, payload)
+
+        self.unsynced_bytes += len(payload)
+        now = time.monotonic()
+        if self.sync_policy.should_sync(self.unsynced_bytes, self.last_sync_time, now):
+            self.sync(now)
+
+    def hash_in_order(self, index, payload):
+        if index > self.hashed_chunks:
+            self.unhashed_chunks[index] = len(payload)
+            return
+        if index < self.hashed_chunks:
+            return
+
+        self.hasher.update(payload)
+        self.hashed_chunks += 1
+        while self.hashed_chunks in self.unhashed_chunks:
+            size = self.unhashed_chunks.pop(self.hashed_chunks)
+            offset = self.start_offset + self.hashed_chunks * self.payload_size
+            if hasattr(os, "pread"):
+                self.hasher.update(os.pread(self.fd, size, offset))
+            else:
+                os.lseek(self.fd, offset, os.SEEK_SET)
+                self.hasher.update(os.read(self.fd, size))
+            self.hashed_chunks += 1
+
+    def sync(self, now):
+        os.fsync(self.fd)
+        self.unsynced_bytes = 0
+        self.last_sync_time = now
+
+    def close(self, n_complete_chunks=None):
+        """Truncate the file to the data written and close it. If the transfer
+        was cut, only the first n_complete_chunks chunks are kept"""
+        if self.range_end is None:
+            size = self.end_offset
+            if n_complete_chunks is not None:
+                size = min(
+                    size, self.start_offset + n_complete_chunks * self.payload_size
+                )
+            os.ftruncate(self.fd, size)
+        if self.sync_policy.is_enabled():
+            self.sync(time.monotonic())
+        os.close(self.fd)
@@ -0,0 +1,377 @@
+import heapq
+import itertools
+import random
+import selectors
+from socket import *
+import time
+
+MAX_DATAGRAM_SIZE = 65535
+# Un paquete reordenado se demora esto ademas de su delay normal
+DEFAULT_REORDER_DELAY = 0.005
+# Bytes que puede encolar el link cuando hay un limite de bandwidth
+DEFAULT_QUEUE_SIZE = 256 * 1024
+# Los sockets de un cliente que no manda ni recibe nada se cierran
+PROXY_IDLE_TIMEOUT = 60
+# Cada cuanto el proxy se despierta aunque no haya nada que hacer
+PROXY_POLL_INTERVAL = 0.1
+
+
+class LinkProfile:
+    """Impairments of one direction of the proxy: loss, duplicate and
+    reorder are probabilities, times are in seconds and rate in bytes per
+    second (None for no limit). burst is the mean number of packets lost in
+    a row, 1 for independent losses"""
+
+    def __init__(
+        self,
+        loss=0.0,
+        burst=1.0,
+        delay=0.0,
+        jitter=0.0,
+        reorder=0.0,
+        reorder_delay=DEFAULT_REORDER_DELAY,
+        duplicate=0.0,
+        rate=None,
+        queue_size=DEFAULT_QUEUE_SIZE,
+    ):
+        self.loss = loss
+        self.burst = burst
+        self.delay = delay
+        self.jitter = jitter
+        self.reorder = reorder
+        self.reorder_delay = reorder_delay
+        self.duplicate = duplicate
+        self.rate = rate
+        self.queue_size = queue_size
+
+    def as_dict(self):
+        return dict(vars(self))
+
+    def __str__(self):
+        return " ".join(f"{key}={value}" for key, value in vars(self).items())
+
+
+class BernoulliLoss:
+    """Every packet is lost with the same probability, independently"""
+
+    def __init__(self, loss):
+        self.loss = loss
+
+    def is_lost(self, rng):
+        return self.loss > 0 and rng.random() < self.loss
+
+
+class GilbertElliottLoss:
+    """Two-state Markov chain: every packet is lost in the bad state and none
+    in the good one. The chain leaves the bad state with probability
+    1 / burst, so losses come in bursts of burst packets on average, and
+    enters it often enough for loss to be the overall loss rate."""
+
+    def __init__(self, loss, burst):
+        self.leave_bad = 1 / burst
+        self.enter_bad = loss * self.leave_bad / (1 - loss) if loss < 1 else 1.0
+        self.bad = False
+
+    def is_lost(self, rng):
+        if self.bad:
+            self.bad = rng.random() >= self.leave_bad
+        else:
+            self.bad = rng.random() < self.enter_bad
+        return self.bad
+
+
+def get_loss_model(profile):
+    if profile.burst > 1 and profile.loss > 0:
+        return GilbertElliottLoss(profile.loss, profile.burst)
+    return BernoulliLoss(profile.loss)
+
+
+class Link:
+    """One direction of the proxy, decides when each packet is delivered.
+
+    With a rate the packets are serialized one after the other, like on a
+    real link, and a packet that finds more than queue_size bytes waiting
+    is dropped. Delay and jitter are added once the packet leaves the link.
+    """
+
+    def __init__(self, profile: LinkProfile, rng: random.Random):
+        self.profile = profile
+        self.random = rng
+        # Cada link tiene su modelo: el de rafagas guarda en que estado esta
+        self.loss_model = get_loss_model(profile)
+        # Momento en que el link termina de transmitir lo que tiene encolado
+        self.free_at = 0.0
+        self.packets = 0
+        self.lost = 0
+        self.queue_drops = 0
+        self.duplicated = 0
+        self.reordered = 0
+
+    def delivery_times(self, now, size):
+        """Return when each copy of a packet arrives, empty if it's dropped"""
+        profile = self.profile
+        self.packets += 1
+        if self.loss_model.is_lost(self.random):
+            self.lost += 1
+            return []
+
+        departure = now
+        if profile.rate:
+            backlog = max(self.free_at - now, 0) * profile.rate
+            if backlog + size > profile.queue_size:
+                self.queue_drops += 1
+                return []
+            departure = max(now, self.free_at) + size / profile.rate
+            self.free_at = departure
+
+        copies = 1
+        if profile.duplicate and self.random.random() < profile.duplicate:
+            self.duplicated += 1
+            copies = 2
+        times = []
+        for _ in range(copies):
+            delay = profile.delay
+            if profile.jitter:
+                delay = max(delay + self.random.uniform(-1, 1) * profile.jitter, 0)
+            if profile.reorder and self.random.random() < profile.reorder:
+                self.reordered += 1
+                delay += profile.reorder_delay
+            times.append(departure + delay)
+        return times
+
+    def snapshot(self):
+        return {
+            "packets": self.packets,
+            "lost": self.lost,
+            "queue_drops": self.queue_drops,
+            "duplicated": self.duplicated,
+            "reordered": self.reordered,
+        }
+
+
+class ImpairmentProxy:
+    """UDP proxy between clients and a server that impairs the packets of
+    both directions, a stand-in for netem/Mininet on loopback.
+
+    The server answers every request from a new session socket, so the proxy
+    works like a NAT: each client gets its own upstream socket towards the
+    server, and each server address that talks to it gets its own socket
+    towards the client. The client sees one address per server session,
+    as it would without the proxy, and nothing depends on the protocol.
+    """
+
+    def __init__(self, listen_address, server_address, profile, seed=None):
+        self.server_address = server_address
+        self.random = random.Random(seed)
+        self.uplink = Link(profile, self.random)
+        self.downlink = Link(profile, self.random)
+        self.selector = selectors.DefaultSelector()
+        self.listen_socket = self.open_socket(listen_address, ("listen", None, None))
+        self.address = self.listen_socket.getsockname()
+        # client address -> socket hacia el server
+        self.upstreams = {}
+        # (client address, server address) -> socket hacia el cliente
+        self.downstreams = {}
+        self.last_seen = {}
+        # (delivery time, orden, socket, paquete, destino)
+        self.pending = []
+        self.order = itertools.count()
+        self.running = False
+
+    def open_socket(self, address, route):
+        udp_socket = socket(AF_INET, SOCK_DGRAM)
+        udp_socket.bind(address)
+        udp_socket.setblocking(False)
+        self.selector.register(udp_socket, selectors.EVENT_READ, route)
+        return udp_socket
+
+    def upstream(self, client_address):
+        upstream = self.upstreams.get(client_address)
+        if upstream is None:
+            upstream = self.open_socket(
+                (self.address[0], 0), ("upstream", client_address, None)
+            )
+            self.upstreams[client_address] = upstream
+        return upstream
+
+    def downstream(self, client_address, server_address):
+        if server_address == self.server_address:
+            return self.listen_socket
+        key = (client_address, server_address)
+        downstream = self.downstreams.get(key)
+        if downstream is None:
+            downstream = self.open_socket(
+                (self.address[0], 0), ("downstream", client_address, server_address)
+            )
+            self.downstreams[key] = downstream
+        return downstream
+
+    def forward(self, link, now, udp_socket, packet, destination):
+        for delivery_time in link.delivery_times(now, len(packet)):
+            heapq.heappush(
+                self.pending,
+                (delivery_time, next(self.order), udp_socket, packet, destination),
+            )
+
+    def on_packet(self, route, packet, source, now):
+        kind, client_address, server_address = route
+        if kind == "listen":
+            # Pedido nuevo de un cliente: va al puerto del server
+            client_address, server_address = source, self.server_address
+        elif kind == "downstream":
+            if source != client_address:
+                return
+        else:
+            # Respuesta del server, sale por el socket que corresponde a su
+            # direccion para que el cliente le conteste ahi
+            self.last_seen[client_address] = now
+            self.forward(
+                self.downlink,
+                now,
+                self.downstream(client_address, source),
+                packet,
+                client_address,
+            )
+            return
+        self.last_seen[client_address] = now
+        self.forward(
+            self.uplink, now, self.upstream(client_address), packet, server_address
+        )
+
+    def deliver_due(self, now):
+        while self.pending and self.pending[0][0] <= now:
+            _, _, udp_socket, packet, destination = heapq.heappop(self.pending)
+            try:
+                udp_socket.sendto(packet, destination)
+            except OSError:
+                # El socket se cerro o el buffer esta lleno: otra perdida mas
+                pass
+
+    def close_idle_clients(self, now):
+        idle = [
+            client_address
+            for client_address, last_seen in self.last_seen.items()
+            if now - last_seen > PROXY_IDLE_TIMEOUT
+        ]
+        for client_address in idle:
+            del self.last_seen[client_address]
+            sockets = [self.upstreams.pop(client_address, None)]
+            for key in [key for key in self.downstreams if key[0] == client_address]:
+                sockets.append(self.downstreams.pop(key))
+            for udp_socket in sockets:
+                if udp_socket is not None:
+                    self.selector.unregister(udp_socket)
+                    udp_socket.close()
+        if idle:
+            # Lo que quedaba por entregar desde esos sockets se pierde
+            self.pending = [entry for entry in self.pending if entry[2].fileno() != -1]
+            heapq.heapify(self.pending)
+
+    def serve_forever(self):
+        self.running = True
+        last_sweep = time.monotonic()
+        while self.running:
+            now = time.monotonic()
+            timeout = PROXY_POLL_INTERVAL
+            if self.pending:
+                timeout = min(max(self.pending[0][0] - now, 0), timeout)
+            for key, _ in self.selector.select(timeout):
+                while True:
+                    try:
+                        packet, source = key.fileobj.recvfrom(MAX_DATAGRAM_SIZE)
+                    except (BlockingIOError, InterruptedError):
+                        break
+                    except OSError:
+                        # ICMP de un puerto cerrado, por ejemplo
+                        continue
+                    self.on_packet(key.data, packet, source, time.monotonic())
+            now = time.monotonic()
+            self.deliver_due(now)
+            if now - last_sweep > PROXY_POLL_INTERVAL:
+                self.close_idle_clients(now)
+                last_sweep = now
+
+    def stop(self):
+        self.running = False
+
+    def close(self):
+        for key in list(self.selector.get_map().values()):
+            key.fileobj.close()
+        self.selector.close()
+
+    def snapshot(self):
+        return {
+            "uplink": self.uplink.snapshot(),
+            "downlink": self.downlink.snapshot(),
+        }
+
+    def __str__(self):
+        return " ".join(
+            f"{direction}_{field}={value}"
+            for direction, snapshot in self.snapshot().items()
+            for field, value in snapshot.items()
+        )
+
+
+def add_impairment_arguments(parser):
+    parser.add_argument(
+        "--loss", type=float, default=0.0, help="probability of dropping a packet"
+    )
+    parser.add_argument(
+        "--burst",
+        type=float,
+        default=1.0,
+        help="mean number of packets lost in a row (Gilbert-Elliott), "
+        "1 for independent losses",
+    )
+    parser.add_argument(
+        "--delay", type=float, default=0.0, help="one-way delay in milliseconds"
+    )
+    parser.add_argument(
+        "--jitter",
+        type=float,
+        default=0.0,
+        help="maximum random variation of the delay in milliseconds",
+    )
+    parser.add_argument(
+        "--reorder",
+        type=float,
+        default=0.0,
+        help="probability of holding a packet back so later ones overtake it",
+    )
+    parser.add_argument(
+        "--reorder-delay",
+        type=float,
+        default=DEFAULT_REORDER_DELAY * 1000,
+        help="how long a reordered packet is held back, in milliseconds",
+    )
+    parser.add_argument(
+        "--duplicate",
+        type=float,
+        default=0.0,
+        help="probability of duplicating a packet",
+    )
+    parser.add_argument(
+        "--rate", type=float, default=None, help="bandwidth limit in Mbit/s"
+    )
+    parser.add_argument(
+        "--queue-size",
+        type=int,
+        default=DEFAULT_QUEUE_SIZE,
+        help="bytes queued by the bandwidth limit before it drops packets",
+    )
+    parser.add_argument("--seed", type=int, default=None, help="random seed")
+
+
+def get_link_profile(args):
+    return LinkProfile(
+        loss=args.loss,
+        burst=args.burst,
+        delay=args.delay / 1000,
+        jitter=args.jitter / 1000,
+        reorder=args.reorder,
+        reorder_delay=args.reorder_delay / 1000,
+        duplicate=args.duplicate,
+        rate=args.rate * 1e6 / 8 if args.rate else None,
+        queue_size=args.queue_size,
+    )
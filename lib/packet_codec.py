@@ -0,0 +1,63 @@
+from enum import IntEnum
+import struct
+
+# Cambia con cualquier cambio del formato de los paquetes
+PROTOCOL_VERSION = 1
+# version, tipo, numero de secuencia
+HEADER = struct.Struct(">BBI")
+HEADER_SIZE = HEADER.size
+SEQ_NUMBER_SIZE = 4
+SEQ_NUMBER_SPACE = 1 << (8 * SEQ_NUMBER_SIZE)
+SEQ_NUMBER_MASK = SEQ_NUMBER_SPACE - 1
+
+
+class Type(IntEnum):
+    DOWNLOAD = 0
+    UPLOAD = 1
+    ACK = 2
+    DATA = 3
+    CLOSE = 4
+    ERROR = 5
+    SACK = 6
+    PROBE = 7
+    # DATA cuyo payload viaja comprimido con el codec negociado
+    DATA_COMPRESSED = 8
+
+
+# Leer un miembro de un Enum cuesta mucho mas que una global, asi que los
+# loops de envio y recepcion comparan contra estos ints
+DOWNLOAD_TYPE = Type.DOWNLOAD.value
+UPLOAD_TYPE = Type.UPLOAD.value
+ACK_TYPE = Type.ACK.value
+DATA_TYPE = Type.DATA.value
+CLOSE_TYPE = Type.CLOSE.value
+ERROR_TYPE = Type.ERROR.value
+SACK_TYPE = Type.SACK.value
+PROBE_TYPE = Type.PROBE.value
+DATA_COMPRESSED_TYPE = Type.DATA_COMPRESSED.value
+# Tipo de los paquetes de otra version o mal formados: no coincide con ningun
+# Type, asi que las tareas los ignoran como a cualquier paquete inesperado
+INVALID_TYPE = -1
+
+
+def encode_header(packet_type, seq_number):
+    # Los numeros de secuencia internos no tienen limite, en el paquete
+    # viajan modulo SEQ_NUMBER_SPACE
+    return HEADER.pack(PROTOCOL_VERSION, packet_type, seq_number & SEQ_NUMBER_MASK)
+
+
+def encode_packet(packet_type, seq_number, payload=b""):
+    return encode_header(packet_type, seq_number) + payload
+
+
+def decode_header(packet):
+    """Return the type and seq number of a packet, reading them in place. The
+    type is an int, INVALID_TYPE for packets of another version or too short"""
+    try:
+        version, packet_type, seq_number = HEADER.unpack_from(packet)
+    except struct.error:
+        return INVALID_TYPE, 0
+    if version != PROTOCOL_VERSION:
+        return INVALID_TYPE, seq_number
+    return packet_type, seq_number
+
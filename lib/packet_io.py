@@ -0,0 +1,85 @@
+import selectors
+import socket as socket_module
+import time
+
+# Datagramas que se leen de un socket por cada vez que el selector lo marca listo
+MAX_PACKETS_PER_WAKEUP = 64
+
+MSG_DONTWAIT = getattr(socket_module, "MSG_DONTWAIT", None)
+HAS_SENDMSG = hasattr(socket_module.socket, "sendmsg")
+
+
+class PacketBuffer:
+    """Preallocated receive buffer.
+
+    Received packets are memoryviews into the buffer, so they are only valid
+    until the next receive. Whoever needs to keep a payload must copy it.
+    """
+
+    def __init__(self, size):
+        self.buffer = bytearray(size)
+        self.view = memoryview(self.buffer)
+
+    def receive_nowait(self, udp_socket):
+        """Return (packet, address) if a datagram is already queued, else None"""
+        try:
+            n_bytes, address = udp_socket.recvfrom_into(self.buffer, 0, MSG_DONTWAIT)
+        except (BlockingIOError, InterruptedError):
+            return None
+        return self.view[:n_bytes], address
+
+
+class PacketReceiver:
+    """Receives from a socket into a PacketBuffer.
+
+    Queued datagrams are read with a single non-blocking recvfrom_into and we
+    only wait on a selector when the socket is empty, so a burst of packets
+    costs one syscall each instead of a poll plus a read.
+    """
+
+    def __init__(self, udp_socket, size):
+        self.udp_socket = udp_socket
+        self.packet_buffer = PacketBuffer(size)
+        self.selector = None
+        if MSG_DONTWAIT is not None:
+            self.udp_socket.settimeout(None)
+            self.selector = selectors.DefaultSelector()
+            self.selector.register(udp_socket, selectors.EVENT_READ)
+
+    def receive(self, wait):
+        """Return (packet, address), or None if nothing arrived within wait seconds"""
+        if self.selector is None:
+            # Sin MSG_DONTWAIT usamos el timeout del socket
+            self.udp_socket.settimeout(wait)
+            try:
+                n_bytes, address = self.udp_socket.recvfrom_into(
+                    self.packet_buffer.buffer
+                )
+            except socket_module.timeout:
+                return None
+            return self.packet_buffer.view[:n_bytes], address
+
+        deadline = None if wait is None else time.monotonic() + wait
+        while True:
+            received = self.packet_buffer.receive_nowait(self.udp_socket)
+            if received is not None:
+                return received
+
+            remaining = None
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+            self.selector.select(remaining)
+
+    def close(self):
+        if self.selector is not None:
+            self.selector.close()
+
+
+def send_packet(udp_socket, address, header, payload):
+    """Send header and payload as one datagram without concatenating them"""
+    if HAS_SENDMSG:
+        udp_socket.sendmsg([header, payload], (), 0, address)
+    else:
+        udp_socket.sendto(header + payload, address)
@@ -0,0 +1,112 @@
+from enum import IntEnum
+from functools import partial
+import itertools
+import json
+import struct
+import threading
+import time
+
+TRACE_MAGIC = b"RDTT"
+TRACE_VERSION = 1
+# magic, version, cantidad de eventos, largo del JSON con las sesiones
+TRACE_HEADER = struct.Struct("<4sBII")
+# timestamp monotonic, sesion, evento, numero de secuencia, base de la window
+TRACE_EVENT = struct.Struct("<dIBQQ")
+
+# Eventos que guarda el ring buffer, los mas viejos se pisan (~7.6MB)
+DEFAULT_TRACE_EVENTS = 1 << 18
+
+
+class Event(IntEnum):
+    # Emisor
+    SEND = 0
+    RETRANSMIT = 1
+    TIMEOUT = 2
+    FAST_RETRANSMIT = 3
+    ACK = 4
+    DUPLICATE_ACK = 5
+    # Receptor
+    DATA = 6
+    DATA_OUT_OF_ORDER = 7
+    DATA_DUPLICATE = 8
+    ACK_SENT = 9
+    # Los dos: el emisor manda el CLOSE y el receptor lo recibe
+    CLOSE = 10
+
+
+class PacketTrace:
+    """In-memory ring buffer of fixed-size binary packet events.
+
+    Recording an event is one struct.pack_into into a preallocated buffer,
+    with no formatting nor I/O, so tracing barely changes the timing of the
+    protocol. Once the buffer is full the oldest events are overwritten.
+    Tasks get a recorder from session() and skip tracing when they have none.
+    """
+
+    def __init__(self, capacity=DEFAULT_TRACE_EVENTS, clock=time.monotonic):
+        self.capacity = capacity
+        self.clock = clock
+        self.buffer = bytearray(capacity * TRACE_EVENT.size)
+        # next() de un count es atomico con el GIL: cada evento tiene su lugar
+        # sin pagar un lock por evento
+        self.counter = itertools.count()
+        self.lock = threading.Lock()
+        self.sessions = []
+
+    def session(self, info):
+        """Register a session described by info, return its recorder:
+        recorder(event, seq_number, base)"""
+        with self.lock:
+            session_id = len(self.sessions)
+            self.sessions.append(info)
+        return partial(self.record, session_id)
+
+    def record(self, session_id, event, seq_number, base):
+        TRACE_EVENT.pack_into(
+            self.buffer,
+            next(self.counter) % self.capacity * TRACE_EVENT.size,
+            self.clock(),
+            session_id,
+            event,
+            seq_number,
+            base,
+        )
+
+    def dump(self, path):
+        """Write the events still in the buffer, oldest first. Meant for when
+        the traced sessions are over: events recorded meanwhile may be lost"""
+        # Leer el count consume un lugar, que queda fuera de este dump
+        count = next(self.counter)
+        with self.lock:
+            sessions = json.dumps(self.sessions).encode()
+        n_events = min(count, self.capacity)
+        start = (count - n_events) % self.capacity * TRACE_EVENT.size
+        end = start + n_events * TRACE_EVENT.size
+        with open(path, "wb") as file:
+            file.write(
+                TRACE_HEADER.pack(TRACE_MAGIC, TRACE_VERSION, n_events, len(sessions))
+            )
+            file.write(sessions)
+            # Si el buffer dio la vuelta, lo mas viejo esta despues de start
+            file.write(self.buffer[start : min(end, len(self.buffer))])
+            file.write(self.buffer[: max(end - len(self.buffer), 0)])
+
+
+def load_trace(path):
+    """Return the sessions of a trace and its events as
+    (timestamp, session_id, event, seq_number, base) tuples"""
+    with open(path, "rb") as file:
+        data = file.read()
+    magic, version, n_events, sessions_size = TRACE_HEADER.unpack_from(data)
+    if magic != TRACE_MAGIC or version != TRACE_VERSION:
+        raise ValueError(f"{path} is not a version {TRACE_VERSION} packet trace")
+    offset = TRACE_HEADER.size
+    sessions = json.loads(data[offset : offset + sessions_size])
+    offset += sessions_size
+    events = [
+        (timestamp, session_id, Event(event), seq_number, base)
+        for timestamp, session_id, event, seq_number, base in TRACE_EVENT.iter_unpack(
+            data[offset : offset + n_events * TRACE_EVENT.size]
+        )
+    ]
+    return sessions, events
@@ -0,0 +1,60 @@
+import threading
+import time
+from lib.rdt_shared import SESSION_IDLE_TIMEOUT
+
+
+class ParallelUpload:
+    """An upload whose byte ranges arrive over several sessions (streams).
+
+    Stream 0 starts it and the other streams can only join it from the same
+    client host, for the same file size and number of streams, and each one
+    only once, so a request can't write into a file it didn't start. Every
+    stream writes its range to the partial file, which is moved into place
+    when the last stream finishes.
+    """
+
+    def __init__(self, client_host, file_size, streams):
+        self.client_host = client_host
+        self.file_size = file_size
+        self.streams = streams
+        self.lock = threading.Lock()
+        self.joined = {0}
+        self.finished = set()
+        self.failed = False
+        self.last_activity = time.monotonic()
+
+    def join(self, client_host, params):
+        """Add the stream of params, return False if it isn't part of this
+        upload or the upload already failed"""
+        with self.lock:
+            if (
+                self.failed
+                or client_host != self.client_host
+                or params.file_size != self.file_size
+                or params.streams != self.streams
+                or params.stream in self.joined
+            ):
+                return False
+            self.joined.add(params.stream)
+            self.last_activity = time.monotonic()
+            return True
+
+    def finish(self, stream, completed):
+        """Record the end of a stream. Return True when the upload is over:
+        every stream finished, or one failed and none is still running"""
+        with self.lock:
+            self.finished.add(stream)
+            self.failed = self.failed or not completed
+            self.last_activity = time.monotonic()
+            if self.failed:
+                return self.finished == self.joined
+            return len(self.finished) == self.streams
+
+    def is_stale(self):
+        """Whether the client stopped before opening all the streams: none is
+        running and none joined for a while"""
+        with self.lock:
+            return (
+                self.finished == self.joined
+                and time.monotonic() - self.last_activity > SESSION_IDLE_TIMEOUT
+            )
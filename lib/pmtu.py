@@ -0,0 +1,65 @@
+import sys
+from lib.rdt_shared import *
+
+# Opciones de Linux que el modulo socket no siempre exporta
+IP_MTU_DISCOVER = 10
+IP_PMTUDISC_WANT = 1
+IP_PMTUDISC_DO = 2
+
+IP_UDP_HEADERS_SIZE = 28
+COMMON_MTUS = [9000, 4352, 1500, 1492, 1400, 1280, 576]
+
+PROBE_TIMEOUT = 0.1
+PROBE_TRIES = 3
+
+
+def get_candidate_payload_sizes():
+    sizes = [PAYLOAD_SIZE]
+    for mtu in COMMON_MTUS:
+        payload_size = mtu - IP_UDP_HEADERS_SIZE - HEADER_SIZE
+        if payload_size < sizes[-1]:
+            sizes.append(payload_size)
+    return sizes
+
+
+def send_probe(udp_socket, server_address, payload_size):
+    probe_packet = encode_packet(PROBE_TYPE, payload_size, bytes(payload_size))
+
+    n_tries = 0
+    while n_tries < PROBE_TRIES:
+        n_tries += 1
+        try:
+            udp_socket.sendto(probe_packet, server_address)
+        except OSError:
+            # EMSGSIZE: el kernel ya sabe que el paquete no entra sin fragmentar
+            return False
+        try:
+            response, _ = udp_socket.recvfrom(PACKET_SIZE)
+            response_type, response_seq_number = decode_header(response)
+            if response_type == PROBE_TYPE and response_seq_number == payload_size:
+                return True
+        except timeout:
+            continue
+
+    return False
+
+
+def probe_path_mtu(udp_socket, server_address, verbose):
+    """Return the largest payload size that reaches the server without IP
+    fragmentation, or None if the path MTU can't be probed"""
+    if not sys.platform.startswith("linux"):
+        return None
+
+    previous_timeout = udp_socket.gettimeout()
+    udp_socket.settimeout(PROBE_TIMEOUT)
+    # Con DF activado los paquetes que no entran en el MTU se descartan
+    udp_socket.setsockopt(IPPROTO_IP, IP_MTU_DISCOVER, IP_PMTUDISC_DO)
+    try:
+        for payload_size in get_candidate_payload_sizes():
+            verbose_print(f"Probing payload size {payload_size}", verbose)
+            if send_probe(udp_socket, server_address, payload_size):
+                return payload_size
+        return None
+    finally:
+        udp_socket.setsockopt(IPPROTO_IP, IP_MTU_DISCOVER, IP_PMTUDISC_WANT)
+        udp_socket.settimeout(previous_timeout)
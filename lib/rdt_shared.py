@@ -1,12 +1,12 @@
-from enum import Enum
 from socket import *
 from datetime import datetime
+import threading
+import time
+from lib.packet_codec import *
+from lib.packet_io import PacketReceiver, send_packet
 
-TYPE_SIZE = 1
-SEQ_NUMBER_SIZE = 2
 PAYLOAD_SIZE = 4096
-HEADER_SIZE = TYPE_SIZE + SEQ_NUMBER_SIZE
-PACKET_SIZE = TYPE_SIZE + SEQ_NUMBER_SIZE + PAYLOAD_SIZE
+PACKET_SIZE = HEADER_SIZE + PAYLOAD_SIZE
 
 SENDER_TIMEOUT_SW = 0.05
 RECEIVER_TIMEOUT_SW = 0.05
@@ -16,19 +16,35 @@ RECEIVER_TIMEOUT_SR = 0.05
 
 HANDSHAKE_TIMEOUT = 0.15
 
+# Un receptor que no recibe nada durante este tiempo abandona la sesion
+SESSION_IDLE_TIMEOUT = 30
+
 WINDOW_SIZE = 32
 
+# Lo que el kernel le cuenta a cada datagrama en el buffer de recepcion ademas
+# de sus bytes (el sk_buff y su skb_shared_info)
+SKB_OVERHEAD = 768
+# Tamaños de buffer recortados de los que ya avisamos, para no repetirlo por sesion
+capped_buffer_sizes = set()
+
+# Paquetes recibidos por encima de un hueco antes de reenviarlo sin esperar al timer
+SACK_REORDER_THRESHOLD = 3
+
 
 MAX_TRIES = 15
+# Cuando se manda el CLOSE todos los datos ya fueron confirmados, asi que si
+# su ACK se pierde no hace falta insistir: el receptor ya termino o termina solo
+CLOSE_TRIES = 3
 
 
-class Type(Enum):
-    DOWNLOAD = 0
-    UPLOAD = 1
-    ACK = 2
-    DATA = 3
-    CLOSE = 4
-    ERROR = 5
+DATA_TYPES = frozenset((DATA_TYPE, DATA_COMPRESSED_TYPE))
+
+# Payload del ACK con el que el cliente confirma los parametros del handshake
+HANDSHAKE_CONFIRMATION = b"\x01"
+# Payload del ACK con el que el server avisa que todavia prepara la sesion
+HANDSHAKE_PENDING = b"\x02"
+# Cada cuanto una sesion que se prepara en un thread revisa si termino
+PREPARE_POLL_INTERVAL = 0.01
 
 
 def verbose_print(msg, verbose):
@@ -37,11 +53,28 @@ def verbose_print(msg, verbose):
         print(f"[{timestamp}] - {msg}")
 
 
-def get_header(packet):
-    type = Type(int.from_bytes(packet[:TYPE_SIZE], "big"))
-    seq_number = int.from_bytes(packet[TYPE_SIZE:HEADER_SIZE], "big")
+def set_receive_buffer(udp_socket, size, verbose):
+    """Ask for a receive buffer of size bytes and return the size the socket
+    got, warning if the kernel capped it"""
+    udp_socket.setsockopt(SOL_SOCKET, SO_RCVBUF, size)
+    # Linux reserva el doble de lo pedido, salvo que net.core.rmem_max lo recorte
+    actual_size = udp_socket.getsockopt(SOL_SOCKET, SO_RCVBUF)
+    if actual_size < size and size not in capped_buffer_sizes:
+        capped_buffer_sizes.add(size)
+        verbose_print(
+            f"WARNING: The receive buffer was capped at {actual_size} bytes, "
+            f"{size} are needed (raise net.core.rmem_max)",
+            verbose,
+        )
+    return actual_size
+
 
-    return type, seq_number
+def unwrap_seq_number(seq_number, reference):
+    """Map a received seq number to the full seq number closest to reference"""
+    diff = (seq_number - reference) % SEQ_NUMBER_SPACE
+    if diff >= SEQ_NUMBER_SPACE // 2:
+        diff -= SEQ_NUMBER_SPACE
+    return reference + diff
 
 
 def get_payload(packet):
@@ -51,124 +84,203 @@ def get_payload(packet):
 
 
 def send_ack(seq_number, socket, address, verbose):
-    ack_packet = Type.ACK.value.to_bytes(TYPE_SIZE, "big") + seq_number.to_bytes(
-        SEQ_NUMBER_SIZE, "big"
-    )
-    verbose_print(f"Sent ACK #{seq_number}", verbose)
+    ack_packet = encode_header(ACK_TYPE, seq_number)
+    if verbose:
+        verbose_print(f"Sent ACK #{seq_number}", verbose)
     socket.sendto(ack_packet, address)
 
 
+def send_handshake_confirmation(seq_number, socket, address, verbose):
+    # Lleva payload para que el emisor no la tome por el ACK de DATA #0 si el
+    # server reenvia su ACK cuando la transferencia ya empezo
+    confirmation_packet = encode_packet(ACK_TYPE, seq_number, HANDSHAKE_CONFIRMATION)
+    if verbose:
+        verbose_print(f"Sent handshake confirmation #{seq_number}", verbose)
+    socket.sendto(confirmation_packet, address)
+
+
+def send_handshake_pending(seq_number, socket, address, verbose):
+    pending_packet = encode_packet(ACK_TYPE, seq_number, HANDSHAKE_PENDING)
+    if verbose:
+        verbose_print(f"Sent handshake pending #{seq_number}", verbose)
+    socket.sendto(pending_packet, address)
+
+
+def send_sack(base, bitmap, socket, address, verbose):
+    # ACK acumulativo: todo lo anterior a base ya llego. El bitmap indica
+    # que paquetes por encima de base + 1 llegaron fuera de orden
+    sack_packet = encode_packet(SACK_TYPE, base, bitmap)
+    if verbose:
+        verbose_print(f"Sent SACK #{base}", verbose)
+    socket.sendto(sack_packet, address)
+
+
 def send_error(seq_number, socket, address, error_msg):
-    error_packet = (
-        Type.ERROR.value.to_bytes(TYPE_SIZE, "big")
-        + seq_number.to_bytes(SEQ_NUMBER_SIZE, "big")
-        + error_msg.encode()
-    )
-    socket.sendto(error_packet, address)
+    socket.sendto(encode_packet(ERROR_TYPE, seq_number, error_msg.encode()), address)
 
 
-def send_data(seq_number, socket, address, data, verbose):
-    verbose_print(f"Sent packet #{seq_number}", verbose)
-    data_packet = (
-        Type.DATA.value.to_bytes(TYPE_SIZE, "big")
-        + seq_number.to_bytes(SEQ_NUMBER_SIZE, "big")
-        + data
+def send_data(seq_number, socket, address, data, verbose, compressed=False):
+    # Los mensajes por paquete solo se arman con -v, para no frenar el envio
+    if verbose:
+        verbose_print(f"Sent packet #{seq_number}", verbose)
+    # El payload se manda tal cual, sin copiarlo para pegarle el header
+    header = encode_header(
+        DATA_COMPRESSED_TYPE if compressed else DATA_TYPE, seq_number
     )
     try:
-        socket.sendto(data_packet, address)
+        send_packet(socket, address, header, data)
     except:
         return
 
 
-def send_close(seq_number, socket, address, verbose):
+def run_task(task, socket):
+    """Run a protocol task on a blocking socket.
+
+    Tasks are generators that yield how long they want to wait for a packet
+    and receive (packet, address), or None if the wait timed out. This lets
+    the same protocol code run blocking here or multiplexed by an event loop.
+
+    Packets are memoryviews into a buffer that is reused on every receive.
+    """
+    previous_timeout = socket.gettimeout()
+    receiver = PacketReceiver(socket, PACKET_SIZE)
+    try:
+        wait = next(task)
+        while True:
+            wait = task.send(receiver.receive(wait))
+    except StopIteration as stop:
+        return stop.value
+    finally:
+        receiver.close()
+        socket.settimeout(previous_timeout)
+
+
+def prepare_session_task(function, udp_socket, client_address, seq_number, verbose):
+    """Run function on a thread and return its result, so slow work before
+    the handshake (checksums, copies) doesn't block other sessions. Until it
+    finishes the client is told the server is still preparing the session,
+    so it keeps waiting instead of giving up"""
+    result = {}
+
+    def run():
+        try:
+            result["value"] = function()
+        except Exception as error:
+            result["error"] = error
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    # Lo que termina rapido no necesita avisar
+    next_pending_time = time.monotonic() + HANDSHAKE_TIMEOUT / 2
+    while thread.is_alive():
+        if time.monotonic() >= next_pending_time:
+            send_handshake_pending(seq_number, udp_socket, client_address, verbose)
+            next_pending_time += HANDSHAKE_TIMEOUT / 2
+        # Los pedidos repetidos del cliente llegan al socket del server, no a este
+        yield PREPARE_POLL_INTERVAL
+    if "error" in result:
+        raise result["error"]
+    return result["value"]
+
+
+def send_close_task(seq_number, socket, address, wait, verbose):
     verbose_print("Sent CLOSE packet", verbose)
-    close_packet = Type.CLOSE.value.to_bytes(TYPE_SIZE, "big") + seq_number.to_bytes(
-        SEQ_NUMBER_SIZE, "big"
-    )
+    close_packet = encode_header(CLOSE_TYPE, seq_number)
 
     n_tries = 0
-    while n_tries < MAX_TRIES:
+    while n_tries < CLOSE_TRIES:
         n_tries += 1
-        try:
-            socket.sendto(close_packet, address)
-            response_from_server, server_address = socket.recvfrom(PACKET_SIZE)
-            response_type, _ = get_header(response_from_server)
+        socket.sendto(close_packet, address)
+        received = yield wait
+        if received is None:
+            continue
+        response_from_server, server_address = received
+        response_type, response_seq_number = decode_header(response_from_server)
+
+        # Si nos devuelven el ACK del CLOSE, con su numero de secuencia (no un
+        # ACK atrasado de DATA), el receptor ya termino
+        if response_type == ACK_TYPE and response_seq_number == (
+            seq_number & SEQ_NUMBER_MASK
+        ):
+            return response_type, server_address
 
-            # Si nos devuelven ACK, recibieron el CLOSE
-            if response_type == Type.ACK:
-                return response_type, server_address
 
-            raise TimeoutError
-        except timeout:
-            continue
+def send_close(seq_number, socket, address, verbose):
+    return run_task(
+        send_close_task(seq_number, socket, address, socket.gettimeout(), verbose),
+        socket,
+    )
 
 
 def receive_ack(socket):
     response_from_receiver, _ = socket.recvfrom(PACKET_SIZE)
-    return get_header(response_from_receiver)
+    return decode_header(response_from_receiver)
 
 
 def received_expected_ack(
     received_type, received_seq_number, expected_seq_number, verbose
 ):
-    if received_type == Type.ACK and received_seq_number == expected_seq_number:
-        verbose_print(f"Received expected ACK #{received_seq_number}", verbose)
+    if received_type == ACK_TYPE and received_seq_number == expected_seq_number:
+        if verbose:
+            verbose_print(f"Received expected ACK #{received_seq_number}", verbose)
         return True
-    verbose_print(
-        f"Received unexpected ACK #{received_seq_number}, resending previous packet #{expected_seq_number}",
-        verbose,
-    )
+    if verbose:
+        verbose_print(
+            f"Received unexpected ACK #{received_seq_number}, resending previous packet #{expected_seq_number}",
+            verbose,
+        )
     return False
 
 
 def received_expected_data(
     received_type, received_seq_number, expected_seq_number, verbose
 ):
-    if received_type == Type.DATA:
+    if received_type in DATA_TYPES:
         if received_seq_number == expected_seq_number:
-            verbose_print(
-                f"Received packet #{received_seq_number} correctly", verbose)
+            if verbose:
+                verbose_print(
+                    f"Received packet #{received_seq_number} correctly", verbose)
             return True
-        verbose_print(
-            f"Received packet #{received_seq_number} but expected #{expected_seq_number}",
-            verbose,
-        )
+        if verbose:
+            verbose_print(
+                f"Received packet #{received_seq_number} but expected #{expected_seq_number}",
+                verbose,
+            )
     return False
 
 
 def send_handshake(
-    udp_socket, connection_type: Type, address_to_connect, filename, verbose
+    udp_socket, connection_type: Type, address_to_connect, request_payload, verbose
 ):
     # Intentamos hacerle llegar el paquete DOWNLOAD/UPLOAD al server
-    response_type, server_address = establish_connection(
-        udp_socket, connection_type, address_to_connect, filename, verbose
+    response_type, server_address, response_payload = establish_connection(
+        udp_socket, connection_type, address_to_connect, request_payload, verbose
     )
 
-    # Si el server nos responde con un ACK
+    # Si el server nos responde con un ACK, en su payload vienen los parametros aceptados
     if response_type == Type.ACK:
+        # en el caso de DOWNLOAD le confirmamos los parametros para que empiece a
+        # mandar DATA. Si este ACK se pierde el server reenvia el suyo y el
+        # receptor lo vuelve a confirmar
+        if connection_type == Type.DOWNLOAD:
+            send_handshake_confirmation(0, udp_socket, server_address, verbose)
+
         # en el caso de UPLOAD, ya empezamos a enviar DATA
         # y el server ya deberia estar escuchando en ese socket
-        if connection_type == Type.UPLOAD:
-            return response_type, server_address
+        return response_type, server_address, response_payload
 
-    # Si el server nos responde directamente con DATA
-    elif response_type == Type.DATA:
-        # en el caso de DOWNLOAD significa que salio todo bien y ya estamos recibiendo DATA
-        if connection_type == Type.DOWNLOAD:
-            return Type.ACK, server_address
-    else:
-        # Si el server nos responde con un ERROR
-        return Type.ERROR, server_address
+    # Si el server nos responde con un ERROR
+    return Type.ERROR, server_address, b""
 
 
-def recv_handshake(
+def recv_handshake_task(
     udp_socket, connection_type: Type, address_to_connect, packet_to_send, verbose
 ):
-    packet_to_send_type, _ = get_header(packet_to_send)
+    packet_to_send_type, _ = decode_header(packet_to_send)
 
     # En el caso de UPLOAD enviamos ACK/ERROR
     if connection_type == Type.UPLOAD:
-        response_type = receive_connection(
+        response_type = yield from receive_connection_task(
             packet_to_send, udp_socket, address_to_connect, Type.DATA, verbose
         )
 
@@ -178,15 +290,19 @@ def recv_handshake(
 
         return Type.ERROR
 
-    # En el caso de DOWNLOAD, si esta todo bien y no hay que mandar ERROR
-    # empezamos a mandar la data directamente al cliente, lo que implicitamente
-    # le avisa que esta todo bien
+    # En el caso de DOWNLOAD mandamos el ACK con los parametros aceptados y
+    # esperamos que el cliente los confirme antes de empezar a mandar DATA
     elif packet_to_send_type == Type.ACK:
-        return Type.ACK
+        response_type = yield from receive_connection_task(
+            packet_to_send, udp_socket, address_to_connect, Type.ACK, verbose
+        )
+
+        if response_type == Type.ACK:
+            return Type.ACK
 
     # Si al contrario hay que mandar un ERROR, simplemente lo hacemos y esperamos un ACK
     elif packet_to_send_type == Type.ERROR:
-        response_type = receive_connection(
+        response_type = yield from receive_connection_task(
             packet_to_send, udp_socket, address_to_connect, Type.ACK, verbose
         )
 
@@ -196,15 +312,22 @@ def recv_handshake(
     return Type.ERROR
 
 
+def recv_handshake(
+    udp_socket, connection_type: Type, address_to_connect, packet_to_send, verbose
+):
+    return run_task(
+        recv_handshake_task(
+            udp_socket, connection_type, address_to_connect, packet_to_send, verbose
+        ),
+        udp_socket,
+    )
+
+
 def establish_connection(
-    udp_socket, connection_type: Type, address_to_connect, filename, verbose
+    udp_socket, connection_type: Type, address_to_connect, request_payload, verbose
 ):
     initial_seq = 0
-    initial_packet = (
-        connection_type.value.to_bytes(TYPE_SIZE, "big")
-        + initial_seq.to_bytes(SEQ_NUMBER_SIZE, "big")
-        + filename.encode()
-    )
+    initial_packet = encode_packet(connection_type, initial_seq, request_payload)
 
     n_tries = 0
     while n_tries < MAX_TRIES:
@@ -213,21 +336,24 @@ def establish_connection(
             udp_socket.sendto(initial_packet, address_to_connect)
             response_from_server, server_address = udp_socket.recvfrom(
                 PACKET_SIZE)
-            response_type, _ = get_header(response_from_server)
+            response_type, _ = decode_header(response_from_server)
+
+            # El server todavia prepara la sesion: esperamos sin gastar intentos
+            if response_type == Type.ACK and (
+                get_payload(response_from_server) == HANDSHAKE_PENDING
+            ):
+                n_tries = 0
+                continue
 
             # Si el servidor devuelve ERROR en cualquier caso imprimimos el mismo
             if response_type == Type.ERROR:
                 error_msg = get_payload(response_from_server).decode()
                 verbose_print(f"ERROR: {error_msg}", verbose)
-                return response_type, server_address
+                return response_type, server_address, b""
 
-            # Si el servidor devuelve ACK y estamos en UPLOAD, significa que esta todo bien
-            if connection_type == Type.UPLOAD and response_type == Type.ACK:
-                return response_type, server_address
-
-            # Si el servidor devuelve DATA y estamos en DOWNLOAD, significa que esta todo bien
-            if connection_type == Type.DOWNLOAD and response_type == Type.DATA:
-                return response_type, server_address
+            # Si el servidor devuelve ACK significa que esta todo bien
+            if response_type == Type.ACK:
+                return response_type, server_address, get_payload(response_from_server)
 
             raise TimeoutError
         except timeout:
@@ -235,27 +361,39 @@ def establish_connection(
 
     verbose_print(
         f"ERROR: Failed to establish connection with the server", verbose)
-    return Type.ERROR, "server_address"
+    return Type.ERROR, "server_address", b""
 
 
-def receive_connection(
+def receive_connection_task(
     packet_to_send, udp_socket, address_to_connect, type_to_expect, verbose
 ):
     n_tries = 0
     while n_tries < MAX_TRIES:
         n_tries += 1
-        try:
-            # El packet que enviamos va a ser de tipo ACK/ERROR
-            udp_socket.sendto(packet_to_send, address_to_connect)
-            response_from_server, _ = udp_socket.recvfrom(PACKET_SIZE)
-            response_type, _ = get_header(response_from_server)
-
-            # El paquete que vamos a esperar va a ser ACK/DATA dependiendo del caso
-            if response_type == type_to_expect:
-                return response_type
-
-            raise TimeoutError
-        except timeout:
+        # El packet que enviamos va a ser de tipo ACK/ERROR
+        udp_socket.sendto(packet_to_send, address_to_connect)
+        received = yield HANDSHAKE_TIMEOUT
+        if received is None:
             continue
+        response_from_server, _ = received
+        response_type, _ = decode_header(response_from_server)
+        # Un DATA comprimido tambien confirma el handshake
+        if response_type in DATA_TYPES:
+            response_type = Type.DATA
+
+        # El paquete que vamos a esperar va a ser ACK/DATA dependiendo del caso
+        if response_type == type_to_expect:
+            return response_type
 
     return Type.ERROR
+
+
+def receive_connection(
+    packet_to_send, udp_socket, address_to_connect, type_to_expect, verbose
+):
+    return run_task(
+        receive_connection_task(
+            packet_to_send, udp_socket, address_to_connect, type_to_expect, verbose
+        ),
+        udp_socket,
+    )
@@ -1,175 +1,549 @@
 from lib.rdt_shared import *
+from lib.ack_policy import AckPolicy
+from lib.compression import CompressedChunks, decompress_chunk, get_codec
+from lib.congestion_control import CongestionControl
+from lib.file_chunks import FileChunks
+from lib.file_sink import FileSink
+from lib.packet_trace import Event
+from lib.rtt_estimator import RttEstimator
+from lib.sliding_window import SlidingWindow
+from lib.timer_queue import TimerQueue
+from lib.transfer_stats import TransferStats
 import time
 
 
-def received_ack_is_within_window(received_type, received_seq_number, base):
-    if received_type == Type.ACK:
-        if base <= received_seq_number < base + WINDOW_SIZE:
+def received_ack_is_within_window(received_type, received_seq_number, window):
+    if received_type == ACK_TYPE:
+        if window.contains(received_seq_number):
             return True
     return False
 
 
-def advance_windows(acked_window: list[bool], buffer_window, timer_window, verbose):
-    pos = 0
+def advance_windows(window: SlidingWindow, verbose):
     verbose_print("Advancing buffered packets window...", verbose)
+    return window.advance()
 
-    while len(acked_window) > 0 and acked_window[0] == True:
-        acked_window.pop(0)
-        buffer_window.pop(0)
-        timer_window.pop(0)
-        pos += 1
 
-    acked_window.extend([False] * pos)
+def resend_packet(
+    seq_number, timers: TimerQueue, window: SlidingWindow, sent_times, deadline, chunks, socket, address, verbose, stats, trace
+):
+    timers.schedule(seq_number, deadline)
+    stats.on_retransmit()
+    if trace is not None:
+        trace(Event.RETRANSMIT, seq_number, window.base)
+    # Un paquete retransmitido no sirve como muestra de RTT (Karn)
+    sent_times[seq_number % window.capacity] = None
+    send_data(
+        seq_number,
+        socket,
+        address,
+        chunks.get(seq_number),
+        verbose,
+        chunks.is_compressed(seq_number),
+    )
 
-    return pos
 
+def check_for_timeouts_and_resend(
+    timers: TimerQueue, window: SlidingWindow, sent_times, rtt, chunks, socket, address, verbose, stats, trace, clock
+):
+    now = clock()
+    expired = timers.pop_expired(now)
+    if not expired:
+        return False
 
-def advance_recved_window(recved_window: list[bool], buffer_window, file, verbose):
-    pos = 0
-    verbose_print("Avancing buffered packets received window...", verbose)
+    verbose_print(f"{len(expired)} sent packets timed out", verbose)
+    # Como en TCP, solo hacemos backoff cuando vence el paquete mas viejo sin ACK
+    base_timed_out = window.base in expired
+    if base_timed_out:
+        rtt.on_timeout()
+    for seq_number in expired:
+        if trace is not None:
+            trace(Event.TIMEOUT, seq_number, window.base)
+        resend_packet(seq_number, timers, window, sent_times,
+                      now + rtt.timeout(), chunks, socket, address, verbose, stats, trace)
 
-    while len(recved_window) > 0 and recved_window[0] == True:
-        recved_window.pop(0)
-        buffered_data = buffer_window.pop(0)
-        verbose_print(
-            f"Writing to file buffered packet #{buffered_data[0]}", verbose)
-        file.write(buffered_data[1])
-        file.flush()
-        pos += 1
+    return base_timed_out
 
-    recved_window.extend([False] * pos)
-    buffer_window.extend([(0, (0).to_bytes(1, "big"))] * pos)
 
-    return pos
+def get_sacked_seq_numbers(cumulative_seq_number, bitmap, window: SlidingWindow, packet_counter):
+    """Return the in-flight seq numbers acknowledged by a SACK, in order"""
+    sacked = list(
+        range(window.base, min(cumulative_seq_number, packet_counter)))
 
+    # El bit i corresponde al paquete cumulative_seq_number + 1 + i
+    bits = int.from_bytes(bitmap, "little")
+    while bits:
+        lowest_bit = bits & -bits
+        seq_number = cumulative_seq_number + lowest_bit.bit_length()
+        if not window.contains(seq_number) or seq_number >= packet_counter:
+            break
+        sacked.append(seq_number)
+        bits ^= lowest_bit
+
+    return sacked
 
-def check_for_timeouts_and_resend(
-    acked_window, buffer_window, timer_window, socket, address, verbose
-):
-    verbose_print(f"Checking for timeouts for sent packets...", verbose)
-
-    pos = 0
-    for acked in acked_window:
-        if len(buffer_window) > pos and len(timer_window) > pos:
-            if acked == False and timer_window[pos] < time.time():
-                timer_window[pos] = time.time(
-                ) + (SENDER_TIMEOUT_SR / 2) + round(pos * 0.001, 2)
-                send_data(
-                    buffer_window[pos][0],
-                    socket,
-                    address,
-                    buffer_window[pos][1],
-                    verbose,
-                )
-            pos += 1
 
+def build_sack_bitmap(window: SlidingWindow, highest_seq_number):
+    """Bitmap of the packets received above window.base + 1"""
+    bits = 0
+    for i in range(1, highest_seq_number - window.base + 1):
+        if window.is_marked(window.base + i):
+            bits |= 1 << (i - 1)
 
-def send_file_sr(udp_socket: socket, filepath, receiver_address, verbose):
-    base = 0
+    return bits.to_bytes((highest_seq_number - window.base + 7) // 8, "little")
+
+
+def send_file_sr_task(
+    udp_socket: socket,
+    filepath,
+    receiver_address,
+    verbose,
+    rtt=None,
+    window_size=WINDOW_SIZE,
+    congestion_control=None,
+    payload_size=PAYLOAD_SIZE,
+    offset=0,
+    length=None,
+    compression="",
+    chunk_cache=None,
+    chunks=None,
+    stats=None,
+    trace=None,
+    clock=time.monotonic,
+):
+    if rtt is None:
+        rtt = RttEstimator(SENDER_TIMEOUT_SR)
+    if stats is None:
+        stats = TransferStats(clock)
+    if congestion_control is None:
+        congestion_control = CongestionControl(window_size, clock)
     packet_counter = 0
-    acked_window = [False] * WINDOW_SIZE
-    buffer_window = []
-    timer_window = []
+    window = SlidingWindow(window_size)
+    # Momento del primer envio de cada paquete, None si fue retransmitido
+    sent_times = [None] * window_size
+    timers = TimerQueue()
+    # Hasta donde ya se buscaron huecos para retransmision rapida
+    fast_retransmit_seq_number = 0
+    # Las perdidas de paquetes enviados antes de este numero ya achicaron la cwnd
+    recovery_seq_number = 0
+
+    # Los paquetes en vuelo no guardan su payload: se vuelve a tomar del
+    # archivo por numero de secuencia cada vez que hay que reenviarlo. Un
+    # broadcast nos pasa sus chunks, compartidos con los demas receptores
+    file = None
+    if chunks is None:
+        file = open(filepath, "rb")
+        chunks = FileChunks(file, payload_size, offset, length)
+    if compression:
+        # Se comprime una window por adelantado, lo que puede estar en vuelo
+        chunks = CompressedChunks(
+            chunks, get_codec(compression), window_size, chunk_cache
+        )
+    data_read = chunks.get(packet_counter)
+    last_ack_time = clock()
+    completed = True
 
-    file = open(filepath, "rb")
-    data_read = file.read(PAYLOAD_SIZE)
+    while data_read or window.base < packet_counter:
+        # Los timers vencidos se revisan en cada vuelta, aunque sigan llegando ACKs
+        if check_for_timeouts_and_resend(
+                timers, window, sent_times, rtt, chunks, udp_socket, receiver_address, verbose, stats, trace, clock):
+            congestion_control.on_timeout()
+            recovery_seq_number = packet_counter
 
-    while (
-        data_read or len(buffer_window) > 0
-    ):  # Falta ver bien esta condicion para el caso en que leimos todo el archivo y queden aun unACKed en la window
-        if packet_counter < base + WINDOW_SIZE and data_read:
+        # Hay lugar tanto en la window de control de flujo como en la cwnd
+        in_flight = packet_counter - window.base
+        if in_flight < congestion_control.window() and data_read:
             # packet gets sent
-            send_data(packet_counter, udp_socket,
-                      receiver_address, data_read, verbose)
-            # guardo data en buffer window
-            # guardo timer en timer_window
-            buffer_window.append((packet_counter, data_read))
-            timer_window.append(time.time() + (SENDER_TIMEOUT_SR / 2))
+            send_data(packet_counter, udp_socket, receiver_address, data_read,
+                      verbose, chunks.is_compressed(packet_counter))
+            stats.on_send(len(data_read), in_flight + 1)
+            if trace is not None:
+                trace(Event.SEND, packet_counter, window.base)
+            # agendo su timer
+            now = clock()
+            sent_times[packet_counter % window_size] = now
+            timers.schedule(packet_counter, now + rtt.timeout())
             packet_counter += 1
-            data_read = file.read(PAYLOAD_SIZE)
+            data_read = chunks.get(packet_counter)
+            continue
+
+        # Esperamos un ACK como mucho hasta que venza el proximo timer
+        received = yield timers.time_until_next(clock(), rtt.timeout())
+        if received is None:
+            # Si el receptor desaparece no retransmitimos para siempre
+            if clock() - last_ack_time > SESSION_IDLE_TIMEOUT:
+                verbose_print("Session timed out waiting for ACKs", verbose)
+                completed = False
+                break
+            # los timers vencidos se reenvian al principio de la vuelta
+            continue
+
+        last_ack_time = clock()
+        response_type, response_seq_number = decode_header(received[0])
+        response_payload = get_payload(received[0])
+        response_seq_number = unwrap_seq_number(
+            response_seq_number, window.base)
+
+        if response_type == SACK_TYPE:
+            if verbose:
+                verbose_print(f"Received SACK #{response_seq_number}", verbose)
+            acked = get_sacked_seq_numbers(
+                response_seq_number, response_payload, window, packet_counter)
+        # Los ACK con payload son del handshake (el ACK del server o la
+        # confirmacion del cliente), no de DATA
+        elif received_ack_is_within_window(response_type, response_seq_number, window) \
+                and response_seq_number < packet_counter and not response_payload:
+            if verbose:
+                verbose_print(
+                    f"Received expected ACK #{response_seq_number}", verbose)
+            acked = [response_seq_number]
         else:
-            try:
-                # Leo del socket:
-                response_type, response_seq_number = receive_ack(udp_socket)
+            continue
+
+        newly_acked = [seq for seq in acked if not window.is_marked(seq)]
+        if not newly_acked:
+            stats.duplicate_acks += 1
+            if trace is not None:
+                trace(Event.DUPLICATE_ACK, response_seq_number, window.base)
+            continue
+        if trace is not None:
+            trace(Event.ACK, response_seq_number, window.base)
+
+        # Tomamos la muestra de RTT del ultimo paquete nunca retransmitido
+        now = clock()
+        for seq_number in reversed(newly_acked):
+            if sent_times[seq_number % window_size] is not None:
+                rtt_sample = now - sent_times[seq_number % window_size]
+                rtt.add_sample(rtt_sample)
+                stats.on_rtt_sample(rtt_sample)
+                break
 
-                # Si lo que llego es tipo ACK y es ACK que esperabamos, enviamos el siguiente:
-                if received_ack_is_within_window(response_type, response_seq_number, base):
+        for seq_number in newly_acked:
+            window.mark(seq_number)
+            timers.cancel(seq_number)
+        congestion_control.on_ack(len(newly_acked), rtt)
+
+        # Con SACK sabemos que los huecos debajo del mayor paquete recibido
+        # se perdieron, asi que los reenviamos sin esperar a su timer
+        if response_type == SACK_TYPE:
+            fast_retransmit_seq_number = max(
+                fast_retransmit_seq_number, window.base)
+            while fast_retransmit_seq_number <= acked[-1] - SACK_REORDER_THRESHOLD:
+                seq_number = fast_retransmit_seq_number
+                if not window.is_marked(seq_number) and sent_times[seq_number % window_size] is not None:
                     verbose_print(
-                        f"Received expected ACK #{response_seq_number}", verbose)
-                    acked_window[response_seq_number - base] = True
+                        f"Fast retransmit of packet #{seq_number}", verbose)
+                    if trace is not None:
+                        trace(Event.FAST_RETRANSMIT, seq_number, window.base)
+                    # Una sola reduccion de la cwnd por window con perdidas
+                    if seq_number >= recovery_seq_number:
+                        congestion_control.on_loss()
+                        recovery_seq_number = packet_counter
+                    resend_packet(seq_number, timers, window, sent_times,
+                                  now + rtt.timeout(), chunks, udp_socket, receiver_address, verbose, stats, trace)
+                fast_retransmit_seq_number += 1
+
+        # si se ACKeo el unACKED mas chico
+        if window.is_marked(window.base):
+            # se avanza la window hasta el siguiente unACKED mas chico
+            advance_windows(window, verbose)
+            chunks.release(window.base)
+
+    stats.finish()
+    # Sin vistas vivas del archivo para poder cerrarlo
+    data_read = None
+    chunks.close()
+    verbose_print(f"RTT estimate: {rtt}", verbose)
+    verbose_print(f"Congestion window: {congestion_control}", verbose)
+    if compression:
+        verbose_print(f"Compression: {chunks}", verbose)
+    if file is not None:
+        file.close()
+    if not completed:
+        return False
+    if trace is not None:
+        trace(Event.CLOSE, packet_counter, window.base)
+    yield from send_close_task(
+        packet_counter, udp_socket, receiver_address, rtt.timeout(), verbose
+    )
+    return True
 
-                    # si era el unACKED mas chico
-                    if response_seq_number == base:
-                        # se avanza la window hasta el siguiente unACKED mas chico
-                        base += advance_windows(acked_window,
-                                                buffer_window, timer_window, verbose)
 
-            except timeout:
-                # check timers and resend packets if needed
-                check_for_timeouts_and_resend(
-                    acked_window, buffer_window, timer_window, udp_socket, receiver_address, verbose)
-                # time.sleep(SENDER_TIMEOUT_SR)
+def send_file_sr(
+    udp_socket: socket,
+    filepath,
+    receiver_address,
+    verbose,
+    rtt=None,
+    window_size=WINDOW_SIZE,
+    congestion_control=None,
+    payload_size=PAYLOAD_SIZE,
+    offset=0,
+    length=None,
+    compression="",
+    chunk_cache=None,
+    chunks=None,
+    stats=None,
+    trace=None,
+):
+    return run_task(
+        send_file_sr_task(
+            udp_socket,
+            filepath,
+            receiver_address,
+            verbose,
+            rtt,
+            window_size,
+            congestion_control,
+            payload_size,
+            offset,
+            length,
+            compression,
+            chunk_cache,
+            chunks,
+            stats,
+            trace,
+        ),
+        udp_socket,
+    )
+
 
-    send_close(packet_counter, udp_socket, receiver_address, verbose)
-    file.close()
+def recv_file_sr_task(
+    udp_socket,
+    filepath,
+    verbose,
+    window_size=WINDOW_SIZE,
+    sack=True,
+    payload_size=PAYLOAD_SIZE,
+    sync_policy=None,
+    offset=0,
+    length=None,
+    hasher=None,
+    compression="",
+    stats=None,
+    trace=None,
+    sink=None,
+    clock=time.monotonic,
+    ack_policy=None,
+):
+    if stats is None:
+        stats = TransferStats(clock)
+    if ack_policy is None:
+        ack_policy = AckPolicy()
+    # La window solo registra que paquetes llegaron, los payloads se escriben
+    # en el archivo apenas llegan, asi que la memoria no depende de su tamaño
+    window = SlidingWindow(window_size)
+    # El buffer del socket tiene que poder contener una window entera,
+    # sino el kernel descarta paquetes con windows grandes
+    set_receive_buffer(
+        udp_socket, window_size * (PACKET_SIZE + SKB_OVERHEAD), verbose
+    )
+    # Como los chunks del emisor, el sink puede venir armado (el simulador)
+    if sink is None:
+        sink = FileSink(
+            filepath, payload_size, sync_policy, offset, length, hasher
+        )
+    completed = False
+    try:
+        completed = yield from recv_packets_sr(
+            udp_socket,
+            window,
+            sink,
+            verbose,
+            sack,
+            get_codec(compression),
+            stats,
+            trace,
+            clock,
+            ack_policy,
+        )
+    finally:
+        stats.finish()
+        # Si la transferencia se corto solo nos quedamos con lo recibido en orden
+        sink.close(None if completed else window.base)
+    return completed
 
 
-def recv_file_sr(udp_socket, filepath, verbose):
-    response_type = Type.ACK
-    base = 0
-    recved_window = [False] * WINDOW_SIZE
-    buffer_window = [(0, (0).to_bytes(1, "big"))] * WINDOW_SIZE
-    file = open(filepath, "ab")
+def recv_packets_sr(
+    udp_socket, window: SlidingWindow, sink: FileSink, verbose, sack, codec, stats, trace, clock, ack_policy: AckPolicy
+):
+    """Receive DATA until CLOSE, return False if the sender went away"""
+    response_type = ACK_TYPE
+    # Mayor numero de secuencia recibido, para armar el bitmap del SACK
+    highest_seq_number = -1
+    last_packet_time = clock()
+    # Paquetes en orden que esperan su SACK, y cuando llego el primero. Nunca
+    # mas de media window, para que el emisor no se quede sin lugar
+    pending_acks = 0
+    first_pending_time = 0
+    max_pending_acks = max(1, window.capacity // 2)
 
     # Mientras el tipo no sea CLOSE
-    while response_type != Type.CLOSE:
-        try:
-            # Leo del socket:
-            response_from_server, server_address = udp_socket.recvfrom(
-                PACKET_SIZE)
-            response_type, response_seq_number = get_header(
-                response_from_server)
-
-        except timeout:
+    while response_type != CLOSE_TYPE:
+        # Leo del socket:
+        wait = RECEIVER_TIMEOUT_SR
+        if pending_acks:
+            wait = min(wait, ack_policy.wait(first_pending_time, clock()))
+        received = yield wait
+        if received is None:
+            if pending_acks and ack_policy.should_ack(
+                pending_acks, first_pending_time, clock()
+            ):
+                pending_acks = 0
+                send_sack(window.base, build_sack_bitmap(window, highest_seq_number),
+                          udp_socket, server_address, verbose)
+                stats.on_ack_sent()
+                if trace is not None:
+                    trace(Event.ACK_SENT, window.base, window.base)
+            # Si el emisor desaparece no esperamos el CLOSE para siempre
+            if clock() - last_packet_time > SESSION_IDLE_TIMEOUT:
+                verbose_print("Session timed out waiting for packets", verbose)
+                return False
             continue
 
-        if response_type != Type.DATA:
+        last_packet_time = clock()
+        response_from_server, server_address = received
+        response_type, response_seq_number = decode_header(response_from_server)
+        response_seq_number = unwrap_seq_number(response_seq_number, window.base)
+
+        # Si el server reenvia el ACK del handshake es porque no le llego
+        # nuestra confirmacion, asi que la reenviamos
+        if response_type == ACK_TYPE:
+            send_handshake_confirmation(
+                response_seq_number, udp_socket, server_address, verbose
+            )
+            stats.on_ack_sent()
             continue
 
+        if response_type not in DATA_TYPES:
+            continue
+
+        # Los paquetes fuera de orden, duplicados o que llenan un hueco se
+        # confirman enseguida, para no demorar la deteccion de perdidas
+        ack_now = True
+
         # If a packet n is received and its within the window:
-        if base <= response_seq_number < base + WINDOW_SIZE:
-            send_ack(response_seq_number, udp_socket, server_address, verbose)
-            if response_seq_number == base:
-                # Es el que esperabamos y lo escribimos a archivo, mandamos ACK de su numero de secuencia y aumentamos counter
-                verbose_print(
-                    f"Received packet #{response_seq_number} in-order", verbose
-                )
-                recved_window[0] = True
+        if window.contains(response_seq_number):
+            if not window.is_marked(response_seq_number):
                 payload = get_payload(response_from_server)
-                buffer_window[response_seq_number - base] = (
-                    response_seq_number,
-                    payload,
-                )
-
-                base += advance_recved_window(
-                    recved_window, buffer_window, file, verbose
-                )
+                wire_size = len(payload)
+                if response_type == DATA_COMPRESSED_TYPE:
+                    payload = decompress_chunk(codec, payload, sink.payload_size)
+                    if payload is None:
+                        # Lo tratamos como perdido, el emisor lo va a reenviar
+                        verbose_print(
+                            f"Dropped undecodable packet #{response_seq_number}",
+                            verbose,
+                        )
+                        continue
+                # Se escribe en su posicion del archivo, llegue en orden o no
+                sink.write(response_seq_number, payload)
+                stats.on_receive(wire_size, response_seq_number == window.base)
+                if trace is not None:
+                    trace(
+                        Event.DATA
+                        if response_seq_number == window.base
+                        else Event.DATA_OUT_OF_ORDER,
+                        response_seq_number,
+                        window.base,
+                    )
+                window.mark(response_seq_number)
+                highest_seq_number = max(
+                    highest_seq_number, response_seq_number)
             else:
+                stats.on_duplicate()
+                if trace is not None:
+                    trace(Event.DATA_DUPLICATE, response_seq_number, window.base)
+
+            if response_seq_number == window.base:
+                # Es el que esperabamos, avanzamos la window hasta el proximo hueco
+                if verbose:
+                    verbose_print(
+                        f"Received packet #{response_seq_number} in-order", verbose
+                    )
+                advanced = advance_windows(window, verbose)
+                ack_now = advanced > 1 or highest_seq_number >= window.base
+            elif verbose:
                 verbose_print(
                     f"Received packet #{response_seq_number} out-of-order", verbose
                 )
-                recved_window[response_seq_number - base] = True
-                payload = get_payload(response_from_server)
-                buffer_window[response_seq_number - base] = (
-                    response_seq_number,
-                    payload,
-                )
-        elif response_seq_number < base:
+        else:
+            if response_seq_number >= window.base:
+                continue
+            stats.on_duplicate()
+            if trace is not None:
+                trace(Event.DATA_DUPLICATE, response_seq_number, window.base)
             # Reenviamos ACK del paquete que llego
-            verbose_print(
-                f"Received packet #{response_seq_number} left-of-window", verbose
-            )
+            if verbose:
+                verbose_print(
+                    f"Received packet #{response_seq_number} left-of-window", verbose
+                )
+
+        # Los ACK comunes no son acumulativos, cada paquete necesita el suyo
+        if sack and not ack_now:
+            pending_acks += 1
+            if pending_acks == 1:
+                first_pending_time = last_packet_time
+            if pending_acks < max_pending_acks and not ack_policy.should_ack(
+                pending_acks, first_pending_time, last_packet_time
+            ):
+                continue
+        pending_acks = 0
+
+        if sack:
+            send_sack(window.base, build_sack_bitmap(window, highest_seq_number),
+                      udp_socket, server_address, verbose)
+        else:
             send_ack(response_seq_number, udp_socket, server_address, verbose)
+        stats.on_ack_sent()
+        if trace is not None:
+            trace(
+                Event.ACK_SENT,
+                window.base if sack else response_seq_number,
+                window.base,
+            )
 
+    if trace is not None:
+        trace(Event.CLOSE, response_seq_number, window.base)
     verbose_print(f"Received CLOSE packet", verbose)
-    file.close()
+    # Un solo ida y vuelta: el ACK le confirma el CLOSE al emisor
+    send_ack(response_seq_number, udp_socket, server_address, verbose)
+    stats.on_ack_sent()
+    return True
+
+
+def recv_file_sr(
+    udp_socket,
+    filepath,
+    verbose,
+    window_size=WINDOW_SIZE,
+    sack=True,
+    payload_size=PAYLOAD_SIZE,
+    sync_policy=None,
+    offset=0,
+    length=None,
+    hasher=None,
+    compression="",
+    stats=None,
+    trace=None,
+    ack_policy=None,
+):
+    return run_task(
+        recv_file_sr_task(
+            udp_socket,
+            filepath,
+            verbose,
+            window_size,
+            sack,
+            payload_size,
+            sync_policy,
+            offset,
+            length,
+            hasher,
+            compression,
+            stats,
+            trace,
+            ack_policy=ack_policy,
+        ),
+        udp_socket,
+    )
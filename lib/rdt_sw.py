@@ -1,63 +1,291 @@
 from lib.rdt_shared import *
+from lib.compression import CompressedChunks, decompress_chunk, get_codec
+from lib.file_chunks import FileChunks
+from lib.file_sink import FileSink
+from lib.packet_trace import Event
+from lib.rtt_estimator import RttEstimator
+from lib.transfer_stats import TransferStats
+import time
 
 
-def recv_file_sw(udp_socket, filepath, verbose):
-    response_type = Type.ACK
+def recv_file_sw_task(
+    udp_socket,
+    filepath,
+    verbose,
+    payload_size=PAYLOAD_SIZE,
+    sync_policy=None,
+    offset=0,
+    length=None,
+    hasher=None,
+    compression="",
+    stats=None,
+    trace=None,
+    sink=None,
+    clock=time.monotonic,
+):
+    if stats is None:
+        stats = TransferStats(clock)
+    if sink is None:
+        sink = FileSink(
+            filepath, payload_size, sync_policy, offset, length, hasher
+        )
+    completed = False
+    try:
+        completed = yield from recv_packets_sw(
+            udp_socket, sink, verbose, get_codec(compression), stats, trace, clock
+        )
+    finally:
+        stats.finish()
+        sink.close()
+    return completed
+
+
+def recv_packets_sw(udp_socket, sink: FileSink, verbose, codec, stats, trace, clock):
+    """Receive DATA until CLOSE, return False if the sender went away"""
+    response_type = ACK_TYPE
     packet_counter = 0
-    file = open(filepath, "ab")
+    last_packet_time = clock()
 
     # Mientras el tipo no sea CLOSE
-    while response_type != Type.CLOSE:
+    while response_type != CLOSE_TYPE:
         # Leo del socket:
-        try:
-            response_from_server, server_address = udp_socket.recvfrom(PACKET_SIZE)
-            response_type, response_seq_number = get_header(response_from_server)
-
-            # Si lo que llego es tipo DATA y su secuencia es igual a counter:
-            if received_expected_data(
-                response_type, response_seq_number, packet_counter + 1, verbose
-            ):
-                # Es el que esperabamos y lo escribimos a archivo, mandamos ACK de su numero de secuencia y aumentamos counter
-                payload = get_payload(response_from_server)
-                file.write(payload)
-                file.flush()
-                send_ack(response_seq_number, udp_socket, server_address, verbose)
-                packet_counter += 1
-            else:
-                # Reenviamos ACK
-                send_ack(packet_counter, udp_socket, server_address, verbose)
-        except timeout:
+        received = yield RECEIVER_TIMEOUT_SW
+        if received is None:
+            # Si el emisor desaparece no esperamos el CLOSE para siempre
+            if clock() - last_packet_time > SESSION_IDLE_TIMEOUT:
+                verbose_print("Session timed out waiting for packets", verbose)
+                return False
             continue
 
+        last_packet_time = clock()
+        response_from_server, server_address = received
+        response_type, response_seq_number = decode_header(response_from_server)
+        response_seq_number = unwrap_seq_number(response_seq_number, packet_counter)
+
+        # Si lo que llego es tipo DATA y su secuencia es igual a counter:
+        payload = None
+        if received_expected_data(
+            response_type, response_seq_number, packet_counter + 1, verbose
+        ):
+            payload = get_payload(response_from_server)
+            stats.on_receive(len(payload), True)
+            if response_type == DATA_COMPRESSED_TYPE:
+                # Si no se puede descomprimir lo tratamos como perdido
+                payload = decompress_chunk(codec, payload, sink.payload_size)
+
+        if payload is not None:
+            # Es el que esperabamos y lo escribimos a archivo, mandamos ACK de su numero de secuencia y aumentamos counter
+            sink.write(packet_counter, payload)
+            send_ack(response_seq_number, udp_socket, server_address, verbose)
+            stats.on_ack_sent()
+            if trace is not None:
+                trace(Event.DATA, response_seq_number, packet_counter + 1)
+                trace(Event.ACK_SENT, response_seq_number, packet_counter + 1)
+            packet_counter += 1
+        else:
+            # El CLOSE se confirma con su propio numero de secuencia, abajo
+            if response_type == CLOSE_TYPE:
+                break
+            if response_type in DATA_TYPES:
+                stats.on_duplicate()
+                if trace is not None:
+                    trace(Event.DATA_DUPLICATE, response_seq_number, packet_counter + 1)
+            # Reenviamos ACK
+            send_ack(packet_counter, udp_socket, server_address, verbose)
+            stats.on_ack_sent()
+            if trace is not None:
+                trace(Event.ACK_SENT, packet_counter, packet_counter + 1)
+
+    if trace is not None:
+        trace(Event.CLOSE, response_seq_number, packet_counter + 1)
     verbose_print(f"Received CLOSE packet", verbose)
-    file.close()
+    # Un solo ida y vuelta: el ACK le confirma el CLOSE al emisor
+    send_ack(response_seq_number, udp_socket, server_address, verbose)
+    stats.on_ack_sent()
+    return True
+
+
+def recv_file_sw(
+    udp_socket,
+    filepath,
+    verbose,
+    payload_size=PAYLOAD_SIZE,
+    sync_policy=None,
+    offset=0,
+    length=None,
+    hasher=None,
+    compression="",
+    stats=None,
+    trace=None,
+):
+    return run_task(
+        recv_file_sw_task(
+            udp_socket,
+            filepath,
+            verbose,
+            payload_size,
+            sync_policy,
+            offset,
+            length,
+            hasher,
+            compression,
+            stats,
+            trace,
+        ),
+        udp_socket,
+    )
 
 
-def send_file_sw(udp_socket, filepath, receiver_address, verbose):
+def send_file_sw_task(
+    udp_socket,
+    filepath,
+    receiver_address,
+    verbose,
+    rtt=None,
+    payload_size=PAYLOAD_SIZE,
+    offset=0,
+    length=None,
+    compression="",
+    chunk_cache=None,
+    chunks=None,
+    stats=None,
+    trace=None,
+    clock=time.monotonic,
+):
+    if rtt is None:
+        rtt = RttEstimator(SENDER_TIMEOUT_SW)
+    if stats is None:
+        stats = TransferStats(clock)
     packet_counter = 1
-    file = open(filepath, "rb")
-    data_read = file.read(PAYLOAD_SIZE)
+    # Los numeros de secuencia arrancan en 1 y los chunks en 0. Un broadcast
+    # nos pasa sus chunks, compartidos con los demas receptores
+    file = None
+    if chunks is None:
+        file = open(filepath, "rb")
+        chunks = FileChunks(file, payload_size, offset, length)
+    if compression:
+        chunks = CompressedChunks(
+            chunks, get_codec(compression), cache=chunk_cache
+        )
+    data_read = chunks.get(packet_counter - 1)
+    retransmitted = False
+    last_ack_time = clock()
+    completed = True
 
     # Mientras el tipo no sea CLOSE
     while data_read:
-        send_data(packet_counter, udp_socket, receiver_address, data_read, verbose)
+        send_data(
+            packet_counter,
+            udp_socket,
+            receiver_address,
+            data_read,
+            verbose,
+            chunks.is_compressed(packet_counter - 1),
+        )
+        if retransmitted:
+            stats.on_retransmit()
+        else:
+            stats.on_send(len(data_read), 1)
+        if trace is not None:
+            trace(
+                Event.RETRANSMIT if retransmitted else Event.SEND,
+                packet_counter,
+                packet_counter,
+            )
+        sent_at = clock()
 
         # Leo del socket:
-        try:
-            response_type, response_seq_number = receive_ack(udp_socket)
-
-            # Si lo que llego es tipo ACK es ACK que esperabamos, enviamos el siguiente:
-            if received_expected_ack(
-                response_type, response_seq_number, packet_counter, verbose
-            ):
-                data_read = file.read(PAYLOAD_SIZE)
-                packet_counter += 1
-
-        except timeout:
-            verbose_print(
-                f"Wait for ACK #{packet_counter} timed out, resending previous packet #{packet_counter}",
-                verbose,
-            )
+        received = yield rtt.timeout()
+        if received is None:
+            # Si el receptor desaparece no retransmitimos para siempre
+            if clock() - last_ack_time > SESSION_IDLE_TIMEOUT:
+                verbose_print("Session timed out waiting for ACKs", verbose)
+                completed = False
+                break
+            rtt.on_timeout()
+            retransmitted = True
+            if trace is not None:
+                trace(Event.TIMEOUT, packet_counter, packet_counter)
+            if verbose:
+                verbose_print(
+                    f"Wait for ACK #{packet_counter} timed out, resending previous packet #{packet_counter}",
+                    verbose,
+                )
+            continue
+
+        last_ack_time = clock()
+        response_type, response_seq_number = decode_header(received[0])
+        response_seq_number = unwrap_seq_number(response_seq_number, packet_counter)
+
+        # Si lo que llego es tipo ACK es ACK que esperabamos, enviamos el siguiente:
+        if received_expected_ack(
+            response_type, response_seq_number, packet_counter, verbose
+        ):
+            if trace is not None:
+                trace(Event.ACK, response_seq_number, packet_counter)
+            # Solo medimos RTT de paquetes que no fueron retransmitidos (Karn)
+            if not retransmitted:
+                rtt_sample = clock() - sent_at
+                rtt.add_sample(rtt_sample)
+                stats.on_rtt_sample(rtt_sample)
+            packet_counter += 1
+            chunks.release(packet_counter - 1)
+            data_read = chunks.get(packet_counter - 1)
+            retransmitted = False
+        else:
+            stats.duplicate_acks += 1
+            if trace is not None:
+                trace(Event.DUPLICATE_ACK, response_seq_number, packet_counter)
+            retransmitted = True
+
+    stats.finish()
+    data_read = None
+    chunks.close()
+    verbose_print(f"RTT estimate: {rtt}", verbose)
+    if compression:
+        verbose_print(f"Compression: {chunks}", verbose)
+    if file is not None:
+        file.close()
+    if not completed:
+        return False
+    if trace is not None:
+        trace(Event.CLOSE, packet_counter, packet_counter)
+    yield from send_close_task(
+        packet_counter, udp_socket, receiver_address, rtt.timeout(), verbose
+    )
+    return True
+
 
-    send_close(packet_counter, udp_socket, receiver_address, verbose)
-    file.close()
+def send_file_sw(
+    udp_socket,
+    filepath,
+    receiver_address,
+    verbose,
+    rtt=None,
+    payload_size=PAYLOAD_SIZE,
+    offset=0,
+    length=None,
+    compression="",
+    chunk_cache=None,
+    chunks=None,
+    stats=None,
+    trace=None,
+):
+    return run_task(
+        send_file_sw_task(
+            udp_socket,
+            filepath,
+            receiver_address,
+            verbose,
+            rtt,
+            payload_size,
+            offset,
+            length,
+            compression,
+            chunk_cache,
+            chunks,
+            stats,
+            trace,
+        ),
+        udp_socket,
+    )
@@ -0,0 +1,55 @@
+import os
+import zlib
+
+CHECKSUM_BLOCK_SIZE = 1024 * 1024
+# El checksum cubre solo el final de lo que se tiene: leer el archivo entero
+# demoraria el handshake de un archivo de GBs
+CHECKSUM_WINDOW_SIZE = 4 * 1024 * 1024
+
+# Offset que propone el cliente de un UPLOAD cuando no sabe cuanto tiene el server
+UNKNOWN_OFFSET = -1
+
+# Subdirectorio del storage donde el server recibe las subidas hasta que terminan
+PARTIAL_DIR = ".partial"
+
+
+def partial_path(filepath):
+    """Where an upload of filepath is received until it completes"""
+    directory, filename = os.path.split(filepath)
+    return os.path.join(directory, PARTIAL_DIR, filename)
+
+
+def file_checksum(filepath, size):
+    """CRC32 of the last CHECKSUM_WINDOW_SIZE of the first size bytes of the
+    file, as hex, or None if the file is shorter than that"""
+    checksum = 0
+    start = max(0, size - CHECKSUM_WINDOW_SIZE)
+    remaining = size - start
+    try:
+        with open(filepath, "rb") as file:
+            file.seek(start)
+            while remaining > 0:
+                block = file.read(min(CHECKSUM_BLOCK_SIZE, remaining))
+                if not block:
+                    return None
+                checksum = zlib.crc32(block, checksum)
+                remaining -= len(block)
+    except FileNotFoundError:
+        return None
+    return f"{checksum:08x}"
+
+
+def get_partial_file(filepath):
+    """Size and checksum of what we already have of a file"""
+    if not os.path.exists(filepath):
+        return 0, ""
+    size = os.path.getsize(filepath)
+    return size, file_checksum(filepath, size)
+
+
+def verify_offset(filepath, offset, checksum):
+    """Return offset if our copy of the file starts with the offset bytes the
+    other side has, 0 if the transfer has to start over"""
+    if offset <= 0 or file_checksum(filepath, offset) != checksum:
+        return 0
+    return offset
@@ -0,0 +1,61 @@
+MIN_RTO = 0.01
+MAX_RTO = 2.0
+
+# Constantes de RFC 6298
+RTT_ALPHA = 1 / 8
+RTT_BETA = 1 / 4
+RTT_K = 4
+CLOCK_GRANULARITY = 0.001
+
+
+class RttEstimator:
+    """Per-session RTT estimator (SRTT/RTTVAR) with exponential backoff.
+
+    ack_delay is the longest the receiver may hold an ACK back (see
+    AckPolicy). It is added to the timeout, as QUIC does with max_ack_delay:
+    a delayed packet times out, so Karn's rule keeps it out of the samples
+    and they alone would never account for the delay.
+    """
+
+    def __init__(self, initial_rto, min_rto=MIN_RTO, max_rto=MAX_RTO, ack_delay=0):
+        self.min_rto = min_rto
+        self.max_rto = max_rto
+        self.ack_delay = ack_delay
+        self.srtt = None
+        self.rttvar = None
+        self.rto = initial_rto
+        self.backoff = 1
+        self.n_samples = 0
+
+    def add_sample(self, rtt):
+        """Add an RTT sample, only from packets that were never retransmitted (Karn)"""
+        if self.srtt is None:
+            self.srtt = rtt
+            self.rttvar = rtt / 2
+        else:
+            self.rttvar = (1 - RTT_BETA) * self.rttvar + RTT_BETA * abs(
+                self.srtt - rtt
+            )
+            self.srtt = (1 - RTT_ALPHA) * self.srtt + RTT_ALPHA * rtt
+
+        self.rto = (
+            self.srtt + max(CLOCK_GRANULARITY, RTT_K * self.rttvar) + self.ack_delay
+        )
+        self.backoff = 1
+        self.n_samples += 1
+
+    def on_timeout(self):
+        """Double the timeout after a loss, up to max_rto"""
+        if self.timeout() < self.max_rto:
+            self.backoff *= 2
+
+    def timeout(self):
+        return min(max(self.rto * self.backoff, self.min_rto), self.max_rto)
+
+    def __str__(self):
+        if self.srtt is None:
+            return f"srtt=- rttvar=- rto={self.timeout():.4f}s"
+        return (
+            f"srtt={self.srtt:.4f}s rttvar={self.rttvar:.4f}s "
+            f"rto={self.timeout():.4f}s samples={self.n_samples}"
+        )
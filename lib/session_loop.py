@@ -0,0 +1,134 @@
+import resource
+import selectors
+import time
+from lib.rdt_shared import *
+from lib.packet_io import MAX_PACKETS_PER_WAKEUP, PacketBuffer
+from lib.timer_queue import TimerQueue
+
+DEFAULT_MAX_SESSIONS = 10000
+
+# Pedidos que se atienden por cada vez que el socket de escucha esta listo
+MAX_REQUESTS_PER_WAKEUP = 256
+LISTEN_SOCKET_BUFFER_SIZE = 4 * 1024 * 1024
+
+
+class Session:
+    def __init__(self, session_id, udp_socket, task, client_address):
+        self.session_id = session_id
+        self.udp_socket = udp_socket
+        self.task = task
+        self.client_address = client_address
+
+
+class SessionLoop:
+    """Single-threaded server loop that multiplexes every session.
+
+    Each session is a protocol task (see run_task) with its own socket. The
+    loop waits on all sockets at once with a selector and on the earliest
+    task deadline, so idle sessions cost no CPU and no thread.
+    """
+
+    def __init__(self, listen_socket, on_request, max_sessions, verbose):
+        self.listen_socket = listen_socket
+        # Con miles de clientes los pedidos llegan en rafagas, asi que el socket
+        # de escucha no bloquea y tiene un buffer grande
+        self.listen_socket.setblocking(False)
+        set_receive_buffer(listen_socket, LISTEN_SOCKET_BUFFER_SIZE, verbose)
+        self.on_request = on_request
+        self.max_sessions = max_sessions
+        self.verbose = verbose
+        self.selector = selectors.DefaultSelector()
+        self.selector.register(listen_socket, selectors.EVENT_READ, None)
+        self.timers = TimerQueue()
+        self.sessions = {}
+        self.sessions_by_address = {}
+        self.next_session_id = 0
+        # Todas las sesiones reciben en el mismo buffer: cada paquete se procesa
+        # antes de leer el siguiente
+        self.packet_buffer = PacketBuffer(PACKET_SIZE)
+
+    def is_full(self):
+        return len(self.sessions) >= self.max_sessions
+
+    def has_session(self, client_address):
+        return client_address in self.sessions_by_address
+
+    def add_session(self, udp_socket, task, client_address):
+        session = Session(self.next_session_id, udp_socket, task, client_address)
+        self.next_session_id += 1
+        self.sessions[session.session_id] = session
+        self.sessions_by_address[client_address] = session
+        self.selector.register(udp_socket, selectors.EVENT_READ, session.session_id)
+        self.resume(session, None)
+
+    def close_session(self, session):
+        self.timers.cancel(session.session_id)
+        self.selector.unregister(session.udp_socket)
+        session.udp_socket.close()
+        del self.sessions[session.session_id]
+        if self.sessions_by_address.get(session.client_address) is session:
+            del self.sessions_by_address[session.client_address]
+
+    def resume(self, session, received):
+        try:
+            wait = session.task.send(received)
+        except StopIteration:
+            self.close_session(session)
+            return
+        except Exception as error:
+            verbose_print(
+                f"Session with {session.client_address} failed: {error}", True
+            )
+            self.close_session(session)
+            return
+
+        if wait is None:
+            self.timers.cancel(session.session_id)
+        else:
+            self.timers.schedule(session.session_id, time.monotonic() + wait)
+
+    def accept_requests(self):
+        for _ in range(MAX_REQUESTS_PER_WAKEUP):
+            try:
+                request, client_address = self.listen_socket.recvfrom(PACKET_SIZE)
+            except (BlockingIOError, InterruptedError):
+                return
+            self.on_request(request, client_address)
+
+    def receive_packets(self, session_id):
+        # Vaciamos los datagramas encolados en el socket de la sesion sin
+        # volver a pasar por el selector
+        for _ in range(MAX_PACKETS_PER_WAKEUP):
+            session = self.sessions.get(session_id)
+            if session is None:
+                return
+            try:
+                received = self.packet_buffer.receive_nowait(session.udp_socket)
+            except OSError:
+                return
+            if received is None:
+                return
+            self.resume(session, received)
+
+    def run(self):
+        while True:
+            wait = self.timers.time_until_next(time.monotonic(), None)
+            for key, _ in self.selector.select(wait):
+                if key.data is None:
+                    self.accept_requests()
+                    continue
+
+                self.receive_packets(key.data)
+
+            for session_id in self.timers.pop_expired(time.monotonic()):
+                session = self.sessions.get(session_id)
+                if session is not None:
+                    self.resume(session, None)
+
+
+def raise_open_files_limit():
+    """Each session has its own socket, so allow as many as the system lets us"""
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft != hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    return hard
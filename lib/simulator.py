@@ -0,0 +1,342 @@
+import heapq
+import itertools
+import random
+import time
+from lib.rdt_shared import *
+from lib.ack_policy import AckPolicy
+from lib.congestion_control import CONGESTION_CONTROLS, CongestionControl
+from lib.impairment_proxy import Link, LinkProfile
+from lib.packet_trace import PacketTrace
+from lib.rdt_sr import recv_file_sr_task, send_file_sr_task
+from lib.rdt_sw import recv_file_sw_task, send_file_sw_task
+from lib.rtt_estimator import MAX_RTO, MIN_RTO, RttEstimator
+from lib.transfer_stats import TransferStats
+
+SENDER_ADDRESS = ("10.0.0.1", 40000)
+RECEIVER_ADDRESS = ("10.0.0.2", 8080)
+# El socket simulado nunca descarta por buffer lleno, solo pierde el link
+SIMULATED_RCVBUF = 1 << 30
+# Cada chunk sintetico empieza con su indice, para verificar lo recibido
+CHUNK_INDEX_SIZE = 8
+
+
+class SyntheticChunks:
+    """Chunks of a file of size bytes that only exists in memory, with the
+    interface of FileChunks. Each chunk starts with its index and the rest
+    is zeros, so the receiver can check it got the right data without a
+    copy of the file."""
+
+    def __init__(self, size, payload_size):
+        self.size = size
+        self.payload_size = payload_size
+        self.file = None
+        self.zeros = bytes(payload_size)
+
+    def chunk_offset(self, index):
+        return index * self.payload_size
+
+    def chunk_size(self, index):
+        return max(0, min(self.payload_size, self.size - self.chunk_offset(index)))
+
+    def get(self, index):
+        size = self.chunk_size(index)
+        if not size:
+            return b""
+        prefix = index.to_bytes(CHUNK_INDEX_SIZE, "big")
+        return (prefix + self.zeros[CHUNK_INDEX_SIZE:size])[:size]
+
+    def is_compressed(self, index):
+        return False
+
+    def release(self, index):
+        pass
+
+    def close(self):
+        pass
+
+
+class VerifyingSink:
+    """Receiving end of SyntheticChunks, with the interface of FileSink: it
+    checks every payload and keeps track of which chunks arrived"""
+
+    def __init__(self, size, payload_size):
+        self.chunks = SyntheticChunks(size, payload_size)
+        self.payload_size = payload_size
+        self.n_chunks = -(-size // payload_size)
+        self.received = bytearray(self.n_chunks)
+        self.n_received = 0
+        self.corrupted = 0
+
+    def write(self, index, payload):
+        if index >= self.n_chunks or payload != self.chunks.get(index):
+            self.corrupted += 1
+            return
+        if not self.received[index]:
+            self.received[index] = 1
+            self.n_received += 1
+
+    def is_complete(self):
+        return self.n_received == self.n_chunks and not self.corrupted
+
+    def close(self, n_complete_chunks=None):
+        pass
+
+
+class SimulatedSocket:
+    """The part of a UDP socket the protocol tasks use, sending through the
+    links of a Simulator"""
+
+    def __init__(self, simulator, address):
+        self.simulator = simulator
+        self.address = address
+
+    def sendto(self, packet, address):
+        self.simulator.send(self.address, address, bytes(packet))
+        return len(packet)
+
+    def sendmsg(self, buffers, ancdata, flags, address):
+        packet = b"".join(buffers)
+        self.simulator.send(self.address, address, packet)
+        return len(packet)
+
+    def getsockopt(self, level, option):
+        return SIMULATED_RCVBUF
+
+    def setsockopt(self, level, option, value):
+        pass
+
+    def getsockname(self):
+        return self.address
+
+
+class Endpoint:
+    def __init__(self, address, link):
+        self.address = address
+        self.link = link
+        self.task = None
+        self.result = None
+        self.finish_time = None
+        # Identifica la espera actual de la tarea, las anteriores se ignoran
+        self.wait_id = 0
+
+
+class Simulator:
+    """Discrete-event simulator that runs protocol tasks (see run_task) over
+    simulated links, with a virtual clock.
+
+    Time jumps from one event to the next: a packet arriving, or the wait of
+    a task running out. Processing takes no virtual time, so a long transfer
+    over a slow path with a long RTT costs only the CPU time of the protocol
+    code. Every random decision comes from one seeded generator, so the same
+    seed gives the same run. Tasks must use clock() instead of the real one.
+    """
+
+    def __init__(self, seed=None):
+        self.now = 0.0
+        self.random = random.Random(seed)
+        # (tiempo, orden, destino, paquete, origen); un paquete None es el fin
+        # de una espera y el origen es el wait_id de esa espera
+        self.events = []
+        self.order = itertools.count()
+        self.endpoints = {}
+        self.running = 0
+        self.n_events = 0
+
+    def clock(self):
+        return self.now
+
+    def add_endpoint(self, address, profile: LinkProfile):
+        """Return the socket of a new endpoint, profile impairs what it sends"""
+        self.endpoints[address] = Endpoint(address, Link(profile, self.random))
+        return SimulatedSocket(self, address)
+
+    def start(self, address, task):
+        endpoint = self.endpoints[address]
+        endpoint.task = task
+        self.running += 1
+        self.resume(endpoint, None)
+
+    def send(self, source, destination, packet):
+        link = self.endpoints[source].link
+        for delivery_time in link.delivery_times(self.now, len(packet)):
+            heapq.heappush(
+                self.events,
+                (delivery_time, next(self.order), destination, packet, source),
+            )
+
+    def resume(self, endpoint, received):
+        try:
+            wait = endpoint.task.send(received)
+        except StopIteration as stop:
+            endpoint.task = None
+            endpoint.result = stop.value
+            endpoint.finish_time = self.now
+            self.running -= 1
+            return
+        endpoint.wait_id += 1
+        if wait is not None:
+            heapq.heappush(
+                self.events,
+                (
+                    self.now + wait,
+                    next(self.order),
+                    endpoint.address,
+                    None,
+                    endpoint.wait_id,
+                ),
+            )
+
+    def run(self, until=None):
+        """Process events until every task finished or, if given, the virtual
+        time reaches until"""
+        while self.running and self.events:
+            if until is not None and self.events[0][0] > until:
+                self.now = until
+                return
+            self.now, _, address, packet, source = heapq.heappop(self.events)
+            endpoint = self.endpoints.get(address)
+            # Lo que llega a una tarea que ya termino se pierde, como en un
+            # puerto cerrado
+            if endpoint is None or endpoint.task is None:
+                continue
+            if packet is None:
+                if source != endpoint.wait_id:
+                    continue
+                self.n_events += 1
+                self.resume(endpoint, None)
+            else:
+                self.n_events += 1
+                self.resume(endpoint, (packet, source))
+
+
+def simulate_transfer(
+    protocol,
+    size,
+    profile: LinkProfile,
+    reverse_profile: LinkProfile = None,
+    seed=None,
+    window_size=WINDOW_SIZE,
+    payload_size=PAYLOAD_SIZE,
+    cc=CongestionControl.name,
+    sack=True,
+    initial_rto=None,
+    min_rto=MIN_RTO,
+    max_rto=MAX_RTO,
+    trace_path=None,
+    verbose=False,
+    ack_policy: AckPolicy = None,
+):
+    """Simulate the transfer of a synthetic file of size bytes with stop &
+    wait ("sw") or selective repeat ("sr"). profile impairs the DATA
+    direction and reverse_profile the ACKs (the same if None). With a
+    trace_path, a packet trace with virtual timestamps is written there.
+    ack_policy applies to the selective repeat receiver. Return the results
+    as a dict"""
+    wall_start = time.perf_counter()
+    simulator = Simulator(seed)
+    sender_socket = simulator.add_endpoint(SENDER_ADDRESS, profile)
+    receiver_socket = simulator.add_endpoint(
+        RECEIVER_ADDRESS, reverse_profile if reverse_profile is not None else profile
+    )
+    chunks = SyntheticChunks(size, payload_size)
+    sink = VerifyingSink(size, payload_size)
+    sender_stats = TransferStats(simulator.clock)
+    receiver_stats = TransferStats(simulator.clock)
+    sender_trace = receiver_trace = trace = None
+    if trace_path is not None:
+        trace = PacketTrace(clock=simulator.clock)
+        info = {"protocol": protocol, "size": size, "window": window_size}
+        sender_trace = trace.session({"role": "sender", **info})
+        receiver_trace = trace.session({"role": "receiver", **info})
+
+    if protocol == "sr":
+        if ack_policy is None:
+            ack_policy = AckPolicy()
+        rtt = RttEstimator(
+            initial_rto or SENDER_TIMEOUT_SR,
+            min_rto,
+            max_rto,
+            ack_policy.max_delay() if sack else 0,
+        )
+        receiver_task = recv_file_sr_task(
+            receiver_socket,
+            None,
+            verbose,
+            window_size,
+            sack,
+            payload_size,
+            stats=receiver_stats,
+            trace=receiver_trace,
+            sink=sink,
+            clock=simulator.clock,
+            ack_policy=ack_policy,
+        )
+        sender_task = send_file_sr_task(
+            sender_socket,
+            None,
+            RECEIVER_ADDRESS,
+            verbose,
+            rtt,
+            window_size,
+            CONGESTION_CONTROLS[cc](window_size, simulator.clock),
+            payload_size,
+            chunks=chunks,
+            stats=sender_stats,
+            trace=sender_trace,
+            clock=simulator.clock,
+        )
+    else:
+        rtt = RttEstimator(initial_rto or SENDER_TIMEOUT_SW, min_rto, max_rto)
+        receiver_task = recv_file_sw_task(
+            receiver_socket,
+            None,
+            verbose,
+            payload_size,
+            stats=receiver_stats,
+            trace=receiver_trace,
+            sink=sink,
+            clock=simulator.clock,
+        )
+        sender_task = send_file_sw_task(
+            sender_socket,
+            None,
+            RECEIVER_ADDRESS,
+            verbose,
+            rtt,
+            payload_size,
+            chunks=chunks,
+            stats=sender_stats,
+            trace=sender_trace,
+            clock=simulator.clock,
+        )
+
+    simulator.start(RECEIVER_ADDRESS, receiver_task)
+    simulator.start(SENDER_ADDRESS, sender_task)
+    simulator.run()
+    if trace is not None:
+        trace.dump(trace_path)
+
+    receiver = simulator.endpoints[RECEIVER_ADDRESS]
+    # El receptor termina al recibir el CLOSE: ahi llego todo el archivo
+    duration = receiver.finish_time
+    completed = receiver.result is True and sink.is_complete()
+    wall_time = time.perf_counter() - wall_start
+    return {
+        "protocol": protocol,
+        "size": size,
+        "window": window_size if protocol == "sr" else 1,
+        "seed": seed,
+        "completed": completed,
+        "corrupted_chunks": sink.corrupted,
+        "simulated_time": round(duration, 6) if duration is not None else None,
+        "goodput": round(size / duration, 1) if completed and duration else 0,
+        "sender": sender_stats.snapshot(),
+        "receiver": receiver_stats.snapshot(),
+        "ack_policy": str(ack_policy) if protocol == "sr" and sack else "immediate",
+        "rto": round(rtt.rto, 6),
+        "data_link": simulator.endpoints[SENDER_ADDRESS].link.snapshot(),
+        "ack_link": receiver.link.snapshot(),
+        "events": simulator.n_events,
+        "wall_time": round(wall_time, 3),
+        "speedup": round(duration / wall_time, 1) if duration and wall_time else None,
+    }
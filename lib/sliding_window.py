@@ -0,0 +1,31 @@
+class SlidingWindow:
+    """Fixed-capacity circular window indexed by seq % capacity.
+
+    Each slot only has a flag (acked on the sender, received on the
+    receiver): the data lives in the file, so sliding the window is O(1) per
+    packet and its memory doesn't grow with the payloads.
+    """
+
+    def __init__(self, capacity, base=0):
+        self.capacity = capacity
+        self.base = base
+        self.flags = bytearray(capacity)
+
+    def contains(self, seq_number):
+        return self.base <= seq_number < self.base + self.capacity
+
+    def mark(self, seq_number):
+        self.flags[seq_number % self.capacity] = 1
+
+    def is_marked(self, seq_number):
+        return self.flags[seq_number % self.capacity] == 1
+
+    def advance(self):
+        """Slide the base past every marked slot, return how many it passed"""
+        start = self.base
+        pos = self.base % self.capacity
+        while self.flags[pos]:
+            self.flags[pos] = 0
+            self.base += 1
+            pos = self.base % self.capacity
+        return self.base - start
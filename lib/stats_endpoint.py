@@ -0,0 +1,71 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import threading
+
+METRICS_PREFIX = "rdt"
+# Campos de una sesion que la identifican, en Prometheus van como labels
+SESSION_LABELS = ["session", "client", "file", "type", "protocol"]
+
+
+def escape_label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_prometheus(server_stats, sessions):
+    """Prometheus text format: the server counters, then one series per
+    session for each session field, grouped by metric as the format requires"""
+    lines = [
+        f"{METRICS_PREFIX}_{field} {value}" for field, value in server_stats.items()
+    ]
+    fields = []
+    for session in sessions:
+        for field in session:
+            if field not in SESSION_LABELS and field not in fields:
+                fields.append(field)
+    for field in fields:
+        for session in sessions:
+            if field not in session:
+                continue
+            labels = ",".join(
+                f'{label}="{escape_label(session[label])}"'
+                for label in SESSION_LABELS
+                if label in session
+            )
+            lines.append(
+                f"{METRICS_PREFIX}_session_{field}{{{labels}}} {session[field]}"
+            )
+    return "\n".join(lines) + "\n"
+
+
+def start_stats_endpoint(host, port, get_server_stats, get_sessions):
+    """Serve the stats over HTTP from a background thread: /metrics in the
+    Prometheus text format, / (or /stats) as JSON"""
+
+    class StatsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path == "/metrics":
+                body = format_prometheus(get_server_stats(), get_sessions())
+                content_type = "text/plain; version=0.0.4"
+            elif self.path in ("/", "/stats"):
+                body = json.dumps(
+                    {"server": get_server_stats(), "sessions": get_sessions()}
+                )
+                content_type = "application/json"
+            else:
+                self.send_error(404)
+                return
+            body = body.encode()
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            # Los pedidos de estadisticas no ensucian la salida del servidor
+            pass
+
+    server = ThreadingHTTPServer((host, port), StatsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
@@ -0,0 +1,52 @@
+import heapq
+
+MIN_WAIT = 0.0001
+
+
+class TimerQueue:
+    """Retransmission timers ordered by deadline (min-heap with lazy deletion)"""
+
+    def __init__(self):
+        self.heap = []
+        self.deadlines = {}
+
+    def __len__(self):
+        return len(self.deadlines)
+
+    def schedule(self, seq_number, deadline):
+        self.deadlines[seq_number] = deadline
+        heapq.heappush(self.heap, (deadline, seq_number))
+
+    def cancel(self, seq_number):
+        self.deadlines.pop(seq_number, None)
+        # Las entradas canceladas quedan en el heap hasta que se compacta
+        if len(self.heap) > 2 * len(self.deadlines) + 64:
+            self.heap = [(d, s) for s, d in self.deadlines.items()]
+            heapq.heapify(self.heap)
+
+    def next_deadline(self):
+        """Return the earliest live deadline, or None if there are no timers"""
+        while self.heap:
+            deadline, seq_number = self.heap[0]
+            if self.deadlines.get(seq_number) == deadline:
+                return deadline
+            heapq.heappop(self.heap)
+        return None
+
+    def time_until_next(self, now, default):
+        """Return how long to block until the next deadline"""
+        deadline = self.next_deadline()
+        if deadline is None:
+            return default
+        return max(deadline - now, MIN_WAIT)
+
+    def pop_expired(self, now):
+        """Remove and return the seq numbers whose deadline already passed"""
+        expired = []
+        while True:
+            deadline = self.next_deadline()
+            if deadline is None or deadline > now:
+                return expired
+            _, seq_number = heapq.heappop(self.heap)
+            del self.deadlines[seq_number]
+            expired.append(seq_number)
@@ -0,0 +1,291 @@
+import math
+from lib.compression import CODECS
+from lib.rdt_shared import PAYLOAD_SIZE, WINDOW_SIZE
+
+MIN_PAYLOAD_SIZE = 512
+MAX_WINDOW_SIZE = 1024
+MAX_STREAMS = 64
+
+PROTOCOL_SW = "sw"
+PROTOCOL_SR = "sr"
+
+PARAMS_SEPARATOR = b"\x00"
+# Los campos numericos de un pedido son tamaños y offsets de archivos
+MAX_PARAM_VALUE = 1 << 63
+# El offset de un UPLOAD reanudado que todavia no sabe cuanto tiene el server
+# (UNKNOWN_OFFSET)
+MIN_OFFSET = -1
+MAX_ACK_DELAY = 1.0
+# Largo maximo de un nombre de archivo en la mayoria de los filesystems
+MAX_FILENAME_SIZE = 255
+
+
+def parse_int(value, minimum=0):
+    """Parse an int param, ValueError if it's malformed or out of range"""
+    number = int(value)
+    if not minimum <= number < MAX_PARAM_VALUE:
+        raise ValueError(f"Param value out of range: {value}")
+    return number
+
+
+def parse_ack_delay(value):
+    """Parse an ack delay in milliseconds, return it in seconds"""
+    ack_delay = float(value) / 1000
+    if not math.isfinite(ack_delay) or not 0 <= ack_delay <= MAX_ACK_DELAY:
+        raise ValueError(f"Ack delay out of range: {value}")
+    return ack_delay
+
+
+class TransferParams:
+    """Transfer parameters proposed by the client and accepted by the server.
+
+    They travel in the payload of the UPLOAD/DOWNLOAD request (after the file
+    name) and of the server's ACK as "key=value" pairs separated by ";".
+
+    A resumed transfer also carries the byte offset it continues from and the
+    checksum of the file up to that offset. Each session of a multi-stream
+    transfer carries its stream number, and the server answers with the byte
+    range (offset and length) of the file that stream transfers.
+
+    The content hash lets the receiver verify the file, and lets the server
+    finish an upload without a transfer when it already stores that content
+    (deduplicated).
+
+    Compression is the codec the client proposes for the DATA payloads. The
+    server only accepts codecs it has installed, and answers without it
+    (uncompressed) otherwise.
+
+    A fast-open UPLOAD request also carries the first bytes of the file,
+    after the params. The server writes them and answers with the offset
+    where the transfer continues, the file size if the whole file fit.
+
+    The ack delay (seconds) is the longest the receiver holds back an ACK:
+    the download client proposes its own, and the server answers an upload
+    with its own. The sender adds it to its retransmission timeout.
+    """
+
+    def __init__(
+        self,
+        protocol=PROTOCOL_SW,
+        payload_size=PAYLOAD_SIZE,
+        window_size=WINDOW_SIZE,
+        resume=False,
+        offset=0,
+        checksum="",
+        stream=0,
+        streams=1,
+        length=None,
+        file_size=None,
+        content_hash="",
+        deduplicated=False,
+        compression="",
+        fast_open=False,
+        ack_delay=0,
+    ):
+        self.protocol = protocol
+        self.payload_size = payload_size
+        self.window_size = window_size
+        self.resume = resume
+        self.offset = offset
+        self.checksum = checksum
+        self.stream = stream
+        self.streams = streams
+        # Bytes a transferir desde offset, None es hasta el final del archivo
+        self.length = length
+        self.file_size = file_size
+        self.content_hash = content_hash
+        self.deduplicated = deduplicated
+        self.compression = compression
+        self.fast_open = fast_open
+        self.ack_delay = ack_delay
+
+    def encode(self):
+        encoded = (
+            f"protocol={self.protocol};"
+            f"payload_size={self.payload_size};"
+            f"window_size={self.window_size}"
+        )
+        if self.resume:
+            encoded += f";resume=1;checksum={self.checksum}"
+        if self.offset:
+            encoded += f";offset={self.offset}"
+        if self.streams > 1:
+            encoded += f";stream={self.stream};streams={self.streams}"
+        if self.length is not None:
+            encoded += f";length={self.length}"
+        if self.file_size is not None:
+            encoded += f";file_size={self.file_size}"
+        if self.content_hash:
+            encoded += f";content_hash={self.content_hash}"
+        if self.deduplicated:
+            encoded += ";deduplicated=1"
+        if self.compression:
+            encoded += f";compression={self.compression}"
+        if self.fast_open:
+            encoded += ";fast_open=1"
+        if self.ack_delay:
+            encoded += f";ack_delay={self.ack_delay * 1000:g}"
+        return encoded.encode()
+
+    @classmethod
+    def decode(cls, data, defaults=None):
+        """Build params from an encoded payload, unknown keys are ignored.
+        The resume, range and content fields describe one file, so they never
+        come from defaults, nor do compression and the ack delay: no key means
+        uncompressed and ACKs sent at once. Raise ValueError if the payload
+        isn't text or a value is malformed or out of range"""
+        params = cls() if defaults is None else defaults.copy()
+        params.resume = False
+        params.offset = 0
+        params.checksum = ""
+        params.stream = 0
+        params.streams = 1
+        params.length = None
+        params.file_size = None
+        params.content_hash = ""
+        params.deduplicated = False
+        params.compression = ""
+        params.fast_open = False
+        params.ack_delay = 0
+        for pair in data.decode().split(";"):
+            key, _, value = pair.partition("=")
+            if key == "protocol" and value in (PROTOCOL_SW, PROTOCOL_SR):
+                params.protocol = value
+            elif key == "payload_size":
+                params.payload_size = parse_int(value, 1)
+            elif key == "window_size":
+                params.window_size = parse_int(value, 1)
+            elif key == "resume":
+                params.resume = value == "1"
+            elif key == "offset":
+                params.offset = parse_int(value, MIN_OFFSET)
+            elif key == "checksum":
+                params.checksum = value
+            elif key == "stream":
+                params.stream = parse_int(value)
+            elif key == "streams":
+                params.streams = parse_int(value, 1)
+            elif key == "length":
+                params.length = parse_int(value)
+            elif key == "file_size":
+                params.file_size = parse_int(value)
+            elif key == "content_hash":
+                params.content_hash = value
+            elif key == "deduplicated":
+                params.deduplicated = value == "1"
+            elif key == "compression":
+                params.compression = value
+            elif key == "fast_open":
+                params.fast_open = value == "1"
+            elif key == "ack_delay":
+                params.ack_delay = parse_ack_delay(value)
+        return params
+
+    def copy(self):
+        return TransferParams(
+            self.protocol,
+            self.payload_size,
+            self.window_size,
+            self.resume,
+            self.offset,
+            self.checksum,
+            self.stream,
+            self.streams,
+            self.length,
+            self.file_size,
+            self.content_hash,
+            self.deduplicated,
+            self.compression,
+            self.fast_open,
+            self.ack_delay,
+        )
+
+    def is_whole_file(self):
+        """Whether the transfer carries the file from its first byte to the end"""
+        return self.offset == 0 and self.length is None
+
+    def is_valid_stream(self):
+        return 1 <= self.streams <= MAX_STREAMS and 0 <= self.stream < self.streams
+
+    def accept(self, limits):
+        """Return the params the server accepts: the proposal capped by its limits"""
+        accepted = self.copy()
+        accepted.payload_size = max(
+            MIN_PAYLOAD_SIZE, min(self.payload_size, limits.payload_size, PAYLOAD_SIZE)
+        )
+        accepted.window_size = max(
+            1, min(self.window_size, limits.window_size, MAX_WINDOW_SIZE)
+        )
+        if self.compression not in CODECS:
+            accepted.compression = ""
+        # Los bytes del pedido son el comienzo del archivo: no aplican a un
+        # rango de otro stream ni a un archivo parcial
+        if self.resume or self.streams > 1:
+            accepted.fast_open = False
+        return accepted
+
+    def __str__(self):
+        description = (
+            f"protocol={self.protocol} payload_size={self.payload_size} "
+            f"window_size={self.window_size}"
+        )
+        if self.resume:
+            description += f" offset={self.offset}"
+        if self.streams > 1:
+            description += (
+                f" stream={self.stream}/{self.streams} offset={self.offset} "
+                f"length={self.length}"
+            )
+        if self.compression:
+            description += f" compression={self.compression}"
+        if self.ack_delay:
+            description += f" ack_delay={self.ack_delay * 1000:g}ms"
+        return description
+
+
+def get_stream_range(file_size, payload_size, stream, streams):
+    """Byte range (offset, length) of the file that stream transfers. Ranges
+    are split at chunk boundaries so every stream sends full chunks"""
+    n_chunks = -(-file_size // payload_size)
+    first_chunk = n_chunks * stream // streams
+    last_chunk = n_chunks * (stream + 1) // streams
+    offset = first_chunk * payload_size
+    return offset, min(file_size, last_chunk * payload_size) - offset
+
+
+def is_valid_filename(filename):
+    """Whether filename names a file right in the storage dir"""
+    return (
+        0 < len(filename.encode()) <= MAX_FILENAME_SIZE
+        and "/" not in filename
+        and filename not in (".", "..")
+    )
+
+
+def build_request_payload(filename, params: TransferParams, data=b""):
+    payload = filename.encode() + PARAMS_SEPARATOR + params.encode()
+    if params.fast_open:
+        payload += PARAMS_SEPARATOR + data
+    return payload
+
+
+def parse_request_payload(payload, defaults: TransferParams):
+    """Split a request into file name, proposed params and the file data of
+    a fast-open UPLOAD. Requests without params (older clients) get the
+    server defaults. Return None if the request is malformed"""
+    encoded_filename, _, encoded_params = payload.partition(PARAMS_SEPARATOR)
+    # Los pedidos vienen de cualquiera: un valor invalido no puede llegar a
+    # tirar el server (UnicodeDecodeError tambien es un ValueError)
+    try:
+        filename = encoded_filename.decode()
+        if not is_valid_filename(filename):
+            return None
+        if not encoded_params:
+            return filename, defaults.copy(), b""
+        # Los params son texto, asi que el primer separador los termina y lo
+        # que sigue son bytes del archivo
+        encoded_params, _, data = encoded_params.partition(PARAMS_SEPARATOR)
+        params = TransferParams.decode(encoded_params, defaults)
+    except ValueError:
+        return None
+    return filename, params, data if params.fast_open else b""
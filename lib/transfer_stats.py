@@ -0,0 +1,164 @@
+import threading
+import time
+
+# Contadores que se suman entre sesiones para los totales del servidor
+COUNTERS = [
+    "packets_sent",
+    "packets_retransmitted",
+    "packets_received",
+    "packets_out_of_order",
+    "packets_duplicate",
+    "duplicate_acks",
+    "acks_sent",
+    "rtt_samples",
+    "payload_bytes",
+]
+
+
+class TransferStats:
+    """Counters of one transfer, kept by its sender or receiver task.
+
+    payload_bytes are the bytes of DATA payload delivered once, as they go
+    on the wire (compressed if the transfer is), so goodput leaves out
+    headers and retransmissions. Window occupancy is sampled every time the
+    sender sends a new packet. acks_sent counts every ACK or SACK a receiver
+    sends, the packet rate of the reverse path.
+
+    Only the task updates the counters; readers from other threads may see
+    a snapshot taken in the middle of an update.
+    """
+
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        for counter in COUNTERS:
+            setattr(self, counter, 0)
+        self.rtt_min = None
+        self.rtt_max = None
+        self.rtt_sum = 0
+        self.occupancy_samples = 0
+        self.occupancy_sum = 0
+        self.occupancy_max = 0
+        self.start_time = clock()
+        self.end_time = None
+
+    def on_send(self, payload_size, in_flight):
+        self.packets_sent += 1
+        self.payload_bytes += payload_size
+        self.occupancy_samples += 1
+        self.occupancy_sum += in_flight
+        self.occupancy_max = max(self.occupancy_max, in_flight)
+
+    def on_retransmit(self):
+        self.packets_sent += 1
+        self.packets_retransmitted += 1
+
+    def on_rtt_sample(self, rtt):
+        self.rtt_samples += 1
+        self.rtt_sum += rtt
+        self.rtt_min = rtt if self.rtt_min is None else min(self.rtt_min, rtt)
+        self.rtt_max = rtt if self.rtt_max is None else max(self.rtt_max, rtt)
+
+    def on_receive(self, payload_size, in_order):
+        self.packets_received += 1
+        self.payload_bytes += payload_size
+        if not in_order:
+            self.packets_out_of_order += 1
+
+    def on_duplicate(self):
+        self.packets_received += 1
+        self.packets_duplicate += 1
+
+    def on_ack_sent(self):
+        self.acks_sent += 1
+
+    def finish(self):
+        if self.end_time is None:
+            self.end_time = self.clock()
+
+    def elapsed(self):
+        end_time = self.end_time if self.end_time is not None else self.clock()
+        return end_time - self.start_time
+
+    def goodput(self):
+        """Payload bytes per second"""
+        elapsed = self.elapsed()
+        return self.payload_bytes / elapsed if elapsed > 0 else 0
+
+    def snapshot(self):
+        snapshot = {counter: getattr(self, counter) for counter in COUNTERS}
+        snapshot["elapsed"] = round(self.elapsed(), 6)
+        snapshot["goodput"] = round(self.goodput(), 1)
+        if self.rtt_samples:
+            snapshot["rtt_min"] = round(self.rtt_min, 6)
+            snapshot["rtt_avg"] = round(self.rtt_sum / self.rtt_samples, 6)
+            snapshot["rtt_max"] = round(self.rtt_max, 6)
+        if self.occupancy_samples:
+            snapshot["window_occupancy_avg"] = round(
+                self.occupancy_sum / self.occupancy_samples, 2
+            )
+            snapshot["window_occupancy_max"] = self.occupancy_max
+        return snapshot
+
+    def __str__(self):
+        description = (
+            f"goodput={self.goodput() / 1e6:.2f}MB/s "
+            f"sent={self.packets_sent} retransmitted={self.packets_retransmitted} "
+            f"received={self.packets_received} "
+            f"out_of_order={self.packets_out_of_order} "
+            f"duplicates={self.packets_duplicate} duplicate_acks={self.duplicate_acks} "
+            f"acks_sent={self.acks_sent}"
+        )
+        if self.rtt_samples:
+            description += (
+                f" rtt_min={self.rtt_min:.4f}s "
+                f"rtt_avg={self.rtt_sum / self.rtt_samples:.4f}s "
+                f"rtt_max={self.rtt_max:.4f}s"
+            )
+        if self.occupancy_samples:
+            description += (
+                f" window_avg={self.occupancy_sum / self.occupancy_samples:.1f} "
+                f"window_max={self.occupancy_max}"
+            )
+        return description
+
+
+class SessionRegistry:
+    """Stats of the sessions a server process is running, and the totals of
+    the ones that already finished"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.sessions = {}
+        self.next_session_id = 0
+        self.totals = dict.fromkeys(COUNTERS, 0)
+
+    def add(self, info, stats):
+        """Register a session described by info (client, file...), return its id"""
+        with self.lock:
+            session_id = self.next_session_id
+            self.next_session_id += 1
+            self.sessions[session_id] = (info, stats)
+        return session_id
+
+    def remove(self, session_id):
+        with self.lock:
+            _, stats = self.sessions.pop(session_id)
+            for counter in COUNTERS:
+                self.totals[counter] += getattr(stats, counter)
+
+    def snapshot(self):
+        """Counters of every session, finished or running, added up"""
+        with self.lock:
+            totals = dict(self.totals)
+            for _, stats in self.sessions.values():
+                for counter in COUNTERS:
+                    totals[counter] += getattr(stats, counter)
+        return {f"transfer_{counter}": value for counter, value in totals.items()}
+
+    def session_snapshots(self):
+        with self.lock:
+            sessions = list(self.sessions.items())
+        return [
+            {"session": session_id, **info, **stats.snapshot()}
+            for session_id, (info, stats) in sessions
+        ]
@@ -0,0 +1,173 @@
+import multiprocessing
+import os
+import queue
+import signal
+import threading
+from lib.rdt_shared import *
+
+STATS_REPORT_TIMEOUT = 0.5
+
+
+class ServerStats:
+    """Counters of one server process, safe to update from several threads.
+    Components that keep their own counters are added as sources and their
+    snapshots are merged into this one"""
+
+    FIELDS = [
+        "requests",
+        "probes",
+        "rejected",
+        "sessions_started",
+        "sessions_completed",
+        "sessions_failed",
+        "uploads_deduplicated",
+        "uploads_fast_open",
+        "broadcasts",
+    ]
+
+    def __init__(self, worker_id=0):
+        self.worker_id = worker_id
+        self.lock = threading.Lock()
+        self.counters = dict.fromkeys(self.FIELDS, 0)
+        self.sources = []
+
+    def add_source(self, snapshot):
+        self.sources.append(snapshot)
+
+    def increment(self, field, amount=1):
+        with self.lock:
+            self.counters[field] += amount
+
+    def snapshot(self):
+        with self.lock:
+            counters = dict(self.counters)
+        counters["sessions_active"] = (
+            counters["sessions_started"]
+            - counters["sessions_completed"]
+            - counters["sessions_failed"]
+        )
+        for source in self.sources:
+            counters.update(source())
+        return counters
+
+
+def combine_stats(snapshots):
+    combined = {}
+    for snapshot in snapshots:
+        for field, value in snapshot.items():
+            combined[field] = combined.get(field, 0) + value
+    return combined
+
+
+def format_stats(stats):
+    return " ".join(f"{field}={value}" for field, value in stats.items())
+
+
+def create_listen_socket(host, port, reuse_port):
+    udp_socket = socket(AF_INET, SOCK_DGRAM)
+    if reuse_port:
+        # Todos los workers escuchan en el mismo puerto y el kernel reparte los
+        # pedidos segun la direccion del cliente, asi que los reenvios de un
+        # mismo cliente siempre llegan al mismo worker
+        udp_socket.setsockopt(SOL_SOCKET, SO_REUSEPORT, 1)
+    udp_socket.bind((host, port))
+    return udp_socket
+
+
+def stop_worker(signum, frame):
+    raise KeyboardInterrupt
+
+
+def ignore_signal(signum, frame):
+    pass
+
+
+def report_stats_on_signal(worker_id, stats, stats_queue, wakeup_fd):
+    """Send the stats to the parent each time the worker gets SIGUSR1"""
+    while True:
+        # Cada byte es el numero de una señal que recibio el proceso
+        if signal.SIGUSR1 in os.read(wakeup_fd, 64):
+            stats_queue.put((worker_id, stats.snapshot(), False))
+
+
+def worker_main(serve, worker_id, stats_queue):
+    stats = ServerStats(worker_id)
+    # El padre nos reenvia el Ctrl-C como SIGTERM
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, stop_worker)
+    # El handler de SIGUSR1 no hace nada: tomar el lock de las estadisticas o
+    # el de la cola podria interrumpir a quien los tiene. Python escribe la
+    # señal en el pipe y un thread manda las estadisticas
+    wakeup_read_fd, wakeup_write_fd = os.pipe()
+    os.set_blocking(wakeup_write_fd, False)
+    signal.set_wakeup_fd(wakeup_write_fd)
+    signal.signal(signal.SIGUSR1, ignore_signal)
+    threading.Thread(
+        target=report_stats_on_signal,
+        args=(worker_id, stats, stats_queue, wakeup_read_fd),
+        daemon=True,
+    ).start()
+    try:
+        serve(stats)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stats_queue.put((worker_id, stats.snapshot(), True))
+
+
+def run_workers(n_workers, serve):
+    """Fork n_workers processes that run serve(stats) on the same port.
+
+    SIGINT/SIGTERM stop every worker and SIGUSR1 prints the combined stats.
+    Each worker reports its final stats when it exits.
+    """
+    context = multiprocessing.get_context("fork")
+    stats_queue = context.Queue()
+    workers = [
+        context.Process(target=worker_main, args=(serve, worker_id, stats_queue))
+        for worker_id in range(n_workers)
+    ]
+    for worker in workers:
+        worker.start()
+
+    # Workers que ya reportaron desde el ultimo SIGUSR1
+    report_round = None
+
+    def forward_signal(signum, frame):
+        nonlocal report_round
+        if signum == signal.SIGUSR1:
+            report_round = set()
+        for worker in workers:
+            if worker.is_alive():
+                os.kill(worker.pid, signal.SIGTERM if signum == signal.SIGINT else signum)
+
+    signal.signal(signal.SIGINT, forward_signal)
+    signal.signal(signal.SIGTERM, forward_signal)
+    signal.signal(signal.SIGUSR1, forward_signal)
+
+    latest_stats = {}
+    finished = set()
+    while len(finished) < n_workers:
+        try:
+            worker_id, snapshot, final = stats_queue.get(timeout=STATS_REPORT_TIMEOUT)
+        except queue.Empty:
+            # Un worker que murio sin reportar no bloquea el apagado
+            if not any(worker.is_alive() for worker in workers) and stats_queue.empty():
+                break
+            continue
+
+        latest_stats[worker_id] = snapshot
+        if final:
+            finished.add(worker_id)
+        elif report_round is not None:
+            report_round.add(worker_id)
+            if len(report_round) == n_workers - len(finished):
+                print(f"Server stats: {format_stats(combine_stats(latest_stats.values()))}")
+                report_round = None
+
+    for worker in workers:
+        worker.join()
+
+    for worker_id in sorted(latest_stats):
+        print(f"Worker {worker_id} stats: {format_stats(latest_stats[worker_id])}")
+    print(f"Server stats: {format_stats(combine_stats(latest_stats.values()))}")
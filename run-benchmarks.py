@@ -0,0 +1,321 @@
+import argparse
+import filecmp
+import itertools
+import json
+import os
+import platform
+import re
+import resource
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+from lib.argument_parser import parse_list, parse_size
+from lib.impairment_proxy import (
+    ImpairmentProxy,
+    add_impairment_arguments,
+    get_link_profile,
+)
+
+HOST = "127.0.0.1"
+# Los clientes y el server se corren desde el directorio del repo
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+SERVER_START_TIMEOUT = 5
+
+
+def get_free_port(kind):
+    with socket.socket(socket.AF_INET, kind) as free_socket:
+        free_socket.bind((HOST, 0))
+        return free_socket.getsockname()[1]
+
+
+def process_cpu_time(pid):
+    """User + system CPU seconds used so far by a running process (Linux)"""
+    with open(f"/proc/{pid}/stat") as file:
+        # El nombre del proceso puede tener espacios, los campos siguen al ')'
+        fields = file.read().rsplit(")", 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+
+def children_cpu_time():
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+def get_server_stats(stats_port):
+    with urllib.request.urlopen(f"http://{HOST}:{stats_port}/") as response:
+        return json.load(response)["server"]
+
+
+def parse_transfer_stats(output):
+    """Counters of the 'Transfer stats' line a client prints"""
+    for line in output.splitlines():
+        if "Transfer stats:" in line:
+            return {
+                key: float(value)
+                for key, value in re.findall(
+                    r"(\w+)=([0-9.]+)", line.split("Transfer stats:", 1)[1]
+                )
+            }
+    return {}
+
+
+def start_server(port, storage, stats_port, max_window):
+    server = subprocess.Popen(
+        [
+            sys.executable,
+            "start-server.py",
+            "-q",
+            "-H",
+            HOST,
+            "-p",
+            str(port),
+            "-s",
+            storage,
+            "--window",
+            str(max_window),
+            "--stats-port",
+            str(stats_port),
+        ],
+        cwd=REPO_DIR,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    deadline = time.monotonic() + SERVER_START_TIMEOUT
+    while True:
+        try:
+            get_server_stats(stats_port)
+            return server
+        except OSError:
+            if time.monotonic() > deadline or server.poll() is not None:
+                server.kill()
+                raise RuntimeError("The server didn't start")
+            time.sleep(0.05)
+
+
+def run_client(args, direction, protocol, window, proxy_port, directory, name):
+    command = [
+        sys.executable,
+        f"{direction}.py",
+        "-q",
+        "-H",
+        HOST,
+        "-p",
+        str(proxy_port),
+        "-s" if direction == "upload" else "-d",
+        directory,
+        "-n",
+        name,
+        "--window",
+        str(window),
+    ]
+    if protocol == "sr":
+        command.append("-r")
+    cpu_before = children_cpu_time()
+    start_time = time.monotonic()
+    try:
+        completed = subprocess.run(
+            command, cwd=REPO_DIR, capture_output=True, text=True, timeout=args.timeout
+        )
+        output, returncode = completed.stdout, completed.returncode
+    except subprocess.TimeoutExpired as error:
+        output, returncode = error.stdout or "", None
+    return (
+        output,
+        returncode,
+        time.monotonic() - start_time,
+        children_cpu_time() - cpu_before,
+    )
+
+
+def run_benchmark(args, case, server, stats_port, proxy, proxy_port, workdir):
+    direction, protocol, window, size, repetition = case
+    name = f"{direction}_{protocol}_{window}_{size}_{repetition}.bin"
+    client_dir = os.path.join(workdir, "client")
+    storage = os.path.join(workdir, "storage")
+    source = os.path.join(workdir, f"data_{size}.bin")
+    if direction == "upload":
+        shutil.copyfile(source, os.path.join(client_dir, name))
+        received = os.path.join(storage, name)
+    else:
+        shutil.copyfile(source, os.path.join(storage, name))
+        received = os.path.join(client_dir, name)
+
+    server_stats = get_server_stats(stats_port)
+    server_cpu = process_cpu_time(server.pid)
+    proxy_stats = proxy.snapshot()
+    output, returncode, wall_time, client_cpu = run_client(
+        args, direction, protocol, window, proxy_port, client_dir, name
+    )
+    # El server puede seguir esperando el ACK del CLOSE
+    time.sleep(args.settle)
+    server_stats = {
+        field: value - server_stats.get(field, 0)
+        for field, value in get_server_stats(stats_port).items()
+    }
+    server_cpu = process_cpu_time(server.pid) - server_cpu
+    proxy_after = proxy.snapshot()
+
+    client_stats = parse_transfer_stats(output)
+    # Uno de los dos lados es el emisor, el otro no manda DATA
+    sent = client_stats.get("sent", 0) + server_stats["transfer_packets_sent"]
+    retransmitted = (
+        client_stats.get("retransmitted", 0)
+        + server_stats["transfer_packets_retransmitted"]
+    )
+    ok = (
+        returncode == 0
+        and os.path.exists(received)
+        and filecmp.cmp(source, received, shallow=False)
+    )
+    for path in (os.path.join(client_dir, name), os.path.join(storage, name)):
+        if os.path.exists(path):
+            os.remove(path)
+    return {
+        "direction": direction,
+        "protocol": protocol,
+        "window": window if protocol == "sr" else 1,
+        "size": size,
+        "repetition": repetition,
+        "ok": ok,
+        "goodput": client_stats.get("goodput", 0) * 1e6 if ok else 0,
+        "wall_time": round(wall_time, 6),
+        "packets_sent": int(sent),
+        "packets_retransmitted": int(retransmitted),
+        "retransmission_ratio": round(retransmitted / sent, 6) if sent else 0,
+        "client_cpu_time": round(client_cpu, 4),
+        "server_cpu_time": round(server_cpu, 4),
+        "proxy_drops": sum(
+            proxy_after[link][field] - proxy_stats[link][field]
+            for link in proxy_after
+            for field in ("lost", "queue_drops")
+        ),
+    }
+
+
+def get_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=REPO_DIR,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def format_result(result):
+    return (
+        f"{result['direction']:<8} {result['protocol']:<2} "
+        f"window={result['window']:<4} size={result['size']:<10} "
+        f"{'ok' if result['ok'] else 'FAILED':<6} "
+        f"goodput={result['goodput'] / 1e6:7.2f}MB/s "
+        f"retransmitted={result['retransmission_ratio']:6.1%} "
+        f"cpu={result['client_cpu_time'] + result['server_cpu_time']:.2f}s"
+    )
+
+
+parser = argparse.ArgumentParser(
+    description="Benchmark the transfers through the impairment proxy, on loopback"
+)
+parser.add_argument(
+    "--protocols", type=parse_list, default=["sw", "sr"], help="sw, sr or sw,sr"
+)
+parser.add_argument(
+    "--windows",
+    type=lambda value: parse_list(value, int),
+    default=[8, 32, 128],
+    help="selective repeat window sizes, in packets",
+)
+parser.add_argument(
+    "--sizes",
+    type=lambda value: parse_list(value, parse_size),
+    default=[1 << 20, 10 << 20],
+    help="file sizes, like 512K,10M",
+)
+parser.add_argument(
+    "--directions",
+    type=parse_list,
+    default=["upload", "download"],
+    help="upload, download or upload,download",
+)
+parser.add_argument("--repeat", type=int, default=1, help="runs of each case")
+parser.add_argument(
+    "--timeout", type=float, default=300, help="seconds before a transfer is abandoned"
+)
+parser.add_argument(
+    "--settle",
+    type=float,
+    default=0.2,
+    help="seconds to wait after each transfer before reading the server stats",
+)
+parser.add_argument(
+    "-o", "--output", default="benchmark-results.json", help="JSON results file"
+)
+add_impairment_arguments(parser)
+args = parser.parse_args()
+
+profile = get_link_profile(args)
+cases = [
+    (direction, protocol, window, size, repetition)
+    for direction, protocol, size, repetition in itertools.product(
+        args.directions, args.protocols, args.sizes, range(args.repeat)
+    )
+    # Stop & wait no tiene window, se corre una sola vez
+    for window in (args.windows if protocol == "sr" else [1])
+]
+
+workdir = tempfile.mkdtemp(prefix="rdt-benchmark-")
+os.makedirs(os.path.join(workdir, "client"))
+os.makedirs(os.path.join(workdir, "storage"))
+for size in args.sizes:
+    with open(os.path.join(workdir, f"data_{size}.bin"), "wb") as file:
+        file.write(os.urandom(size))
+
+server_port = get_free_port(socket.SOCK_DGRAM)
+stats_port = get_free_port(socket.SOCK_STREAM)
+server = start_server(
+    server_port, os.path.join(workdir, "storage"), stats_port, max(args.windows)
+)
+proxy = ImpairmentProxy((HOST, 0), (HOST, server_port), profile, args.seed)
+proxy_thread = threading.Thread(target=proxy.serve_forever, daemon=True)
+proxy_thread.start()
+
+results = []
+try:
+    for case in cases:
+        result = run_benchmark(
+            args, case, server, stats_port, proxy, proxy.address[1], workdir
+        )
+        print(format_result(result), flush=True)
+        results.append(result)
+finally:
+    proxy.stop()
+    proxy_thread.join()
+    proxy.close()
+    server.terminate()
+    server.wait()
+    shutil.rmtree(workdir)
+
+with open(args.output, "w") as file:
+    json.dump(
+        {
+            "commit": get_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "impairments": profile.as_dict(),
+            "results": results,
+        },
+        file,
+        indent=2,
+    )
+print(f"Results written to {args.output}")
+if not all(result["ok"] for result in results):
+    exit(1)
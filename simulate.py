@@ -0,0 +1,164 @@
+import argparse
+import itertools
+import json
+import platform
+from lib.ack_policy import AckPolicy
+from lib.argument_parser import parse_list, parse_size
+from lib.congestion_control import CONGESTION_CONTROLS, CongestionControl
+from lib.impairment_proxy import add_impairment_arguments, get_link_profile
+from lib.rdt_shared import PAYLOAD_SIZE
+from lib.rtt_estimator import MAX_RTO, MIN_RTO
+from lib.simulator import simulate_transfer
+
+
+def format_result(result):
+    description = (
+        f"{result['protocol']:<2} window={result['window']:<5} "
+        f"size={result['size']:<12} seed={result['seed']} "
+        f"{'ok' if result['completed'] else 'FAILED':<6} "
+    )
+    if result["simulated_time"] is None:
+        return description + f"wall={result['wall_time']:.2f}s"
+    sender = result["sender"]
+    receiver = result["receiver"]
+    # Sin delay en el link la transferencia no lleva tiempo virtual
+    goodput = "n/a"
+    if result["simulated_time"] and result["completed"]:
+        goodput = f"{result['goodput'] / 1e6:.2f}MB/s"
+    speedup = f"{result['speedup']}x" if result["speedup"] else "n/a"
+    return description + (
+        f"time={result['simulated_time']:.2f}s "
+        f"goodput={goodput:>11} "
+        f"retransmitted={sender['packets_retransmitted'] / sender['packets_sent']:6.1%} "
+        f"window_avg={sender.get('window_occupancy_avg', 0)} "
+        f"acks/packet={receiver['acks_sent'] / receiver['packets_received']:.2f} "
+        f"wall={result['wall_time']:.2f}s ({speedup})"
+    )
+
+
+parser = argparse.ArgumentParser(
+    description="Simulate transfers on a virtual clock, without sockets: "
+    "the same impairments as the proxy, faster than real time and reproducible"
+)
+parser.add_argument(
+    "--protocols", type=parse_list, default=["sr"], help="sw, sr or sw,sr"
+)
+parser.add_argument(
+    "--windows",
+    type=lambda value: parse_list(value, int),
+    default=[32],
+    help="selective repeat window sizes, in packets",
+)
+parser.add_argument(
+    "--sizes",
+    type=lambda value: parse_list(value, parse_size),
+    default=[10 << 20],
+    help="file sizes, like 512K,1G",
+)
+parser.add_argument(
+    "--payload-size", type=int, default=PAYLOAD_SIZE, help="payload bytes per packet"
+)
+parser.add_argument(
+    "--cc",
+    choices=sorted(CONGESTION_CONTROLS),
+    default=CongestionControl.name,
+    help="congestion control algorithm (selective repeat)",
+)
+parser.add_argument(
+    "--plain-ack",
+    action="store_true",
+    help="acknowledge each packet instead of sending SACKs (selective repeat)",
+)
+parser.add_argument(
+    "--ack-every",
+    type=int,
+    default=None,
+    help="acknowledge in-order packets once this many arrived (selective repeat)",
+)
+parser.add_argument(
+    "--ack-delay",
+    type=float,
+    default=None,
+    help="milliseconds an in-order packet can wait for its ACK (selective repeat)",
+)
+parser.add_argument(
+    "--initial-rto", type=float, default=None, help="initial timeout in milliseconds"
+)
+parser.add_argument(
+    "--min-rto", type=float, default=MIN_RTO * 1000, help="minimum timeout in milliseconds"
+)
+parser.add_argument(
+    "--max-rto", type=float, default=MAX_RTO * 1000, help="maximum timeout in milliseconds"
+)
+parser.add_argument(
+    "--ack-loss",
+    type=float,
+    default=None,
+    help="loss probability of the ACK direction, the same as --loss if not given",
+)
+parser.add_argument(
+    "--repeat", type=int, default=1, help="runs of each case, with seeds seed, seed+1..."
+)
+parser.add_argument("--trace", help="record a packet trace of each run to this file")
+parser.add_argument("-o", "--output", help="JSON results file")
+add_impairment_arguments(parser)
+args = parser.parse_args()
+
+profile = get_link_profile(args)
+reverse_profile = None
+if args.ack_loss is not None:
+    reverse_profile = get_link_profile(args)
+    reverse_profile.loss = args.ack_loss
+ack_policy = AckPolicy(
+    args.ack_every, args.ack_delay / 1000 if args.ack_delay is not None else None
+)
+first_seed = args.seed if args.seed is not None else 0
+cases = [
+    (protocol, window, size, first_seed + repetition)
+    for protocol, size, repetition in itertools.product(
+        args.protocols, args.sizes, range(args.repeat)
+    )
+    # Stop & wait no tiene window, se corre una sola vez
+    for window in (args.windows if protocol == "sr" else [1])
+]
+
+results = []
+for case_number, (protocol, window, size, seed) in enumerate(cases):
+    trace_path = None
+    if args.trace:
+        trace_path = args.trace if len(cases) == 1 else f"{args.trace}.{case_number}"
+    result = simulate_transfer(
+        protocol,
+        size,
+        profile,
+        reverse_profile,
+        seed,
+        window,
+        args.payload_size,
+        args.cc,
+        not args.plain_ack,
+        args.initial_rto / 1000 if args.initial_rto else None,
+        args.min_rto / 1000,
+        args.max_rto / 1000,
+        trace_path,
+        ack_policy=ack_policy,
+    )
+    print(format_result(result), flush=True)
+    results.append(result)
+
+if args.output:
+    with open(args.output, "w") as file:
+        json.dump(
+            {
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "impairments": profile.as_dict(),
+                "ack_impairments": (reverse_profile or profile).as_dict(),
+                "results": results,
+            },
+            file,
+            indent=2,
+        )
+    print(f"Results written to {args.output}")
+if not all(result["completed"] for result in results):
+    exit(1)
@@ -1,93 +1,757 @@
 from lib.argument_parser import *
 from lib.rdt_shared import *
+from lib.ack_policy import AckPolicy
+from lib.broadcast import BroadcastSession
+from lib.chunk_cache import ChunkCache
+from lib.congestion_control import CONGESTION_CONTROLS
+from lib.content_index import (
+    INDEX_FILENAME,
+    INDEX_LOCK_FILENAME,
+    ContentIndex,
+    clone_or_copy,
+    file_content_hash,
+    new_content_hasher,
+)
+from lib.file_sink import SyncPolicy
+from lib.packet_trace import PacketTrace
+from lib.parallel_upload import ParallelUpload
+from lib.rdt_sr import recv_file_sr_task, send_file_sr_task
+from lib.rdt_sw import recv_file_sw_task, send_file_sw_task
+from lib.resume import (
+    PARTIAL_DIR,
+    UNKNOWN_OFFSET,
+    get_partial_file,
+    partial_path,
+    verify_offset,
+)
+from lib.rtt_estimator import RttEstimator
+from lib.session_loop import DEFAULT_MAX_SESSIONS, SessionLoop, raise_open_files_limit
+from lib.stats_endpoint import start_stats_endpoint
+from lib.transfer_params import *
+from lib.transfer_stats import SessionRegistry, TransferStats
+from lib.worker_pool import ServerStats, create_listen_socket, format_stats, run_workers
 from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from socket import *
+import os
+import shutil
+import threading
 
 N_THREADS = 10
+# Las estadisticas solo se exponen en la maquina del server
+STATS_HOST = "127.0.0.1"
 
 
-def initial_server_response(request_type, filepath, seq_number):
-    error_packet = Type.ERROR.value.to_bytes(TYPE_SIZE, "big") + seq_number.to_bytes(
-        SEQ_NUMBER_SIZE, "big"
+def resolve_resume_offset(request_type, filepath, params):
+    """Set the byte offset a resumed transfer continues from"""
+    if request_type == Type.UPLOAD and Path(partial_path(filepath)).exists():
+        # Lo recibido de una subida cortada quedo en su archivo parcial
+        filepath = partial_path(filepath)
+    if request_type == Type.UPLOAD and params.offset == UNKNOWN_OFFSET:
+        # El cliente no sabe cuanto tenemos: le mandamos el tamaño y checksum
+        # de nuestro archivo parcial para que lo compare con el suyo
+        params.offset, params.checksum = get_partial_file(filepath)
+    else:
+        params.offset = verify_offset(filepath, params.offset, params.checksum)
+        if not params.offset:
+            params.checksum = ""
+
+
+def resolve_stream_range(request_type, filepath, params):
+    """Set the byte range of the file this stream transfers"""
+    # En DOWNLOAD el cliente no sabe el tamaño, se lo devolvemos en el ACK
+    if request_type == Type.DOWNLOAD:
+        params.file_size = Path(filepath).stat().st_size
+    params.offset, params.length = get_stream_range(
+        params.file_size, params.payload_size, params.stream, params.streams
+    )
+
+
+def deduplicate_upload(filepath, params):
+    """Finish an upload without a transfer if we already store its content"""
+    # Tambien cubre un pedido repetido cuyo ACK se perdio: el archivo ya esta
+    if content_index.get_hash(filepath) == params.content_hash:
+        return True
+    if Path(filepath).exists() or params.resume or params.streams > 1:
+        return False
+    # Otra subida de este archivo esta usando el parcial
+    if Path(partial_path(filepath)).exists():
+        return False
+    source_path = content_index.find(params.content_hash)
+    if source_path is None:
+        return False
+    # La copia aparece entera o no aparece, como una subida
+    clone_or_copy(source_path, partial_path(filepath))
+    os.replace(partial_path(filepath), filepath)
+    content_index.add(filepath, params.content_hash)
+    verbose_print(f"Upload of {filepath} deduplicated from {source_path}", args.verbose)
+    return True
+
+
+def get_ack_delay(params):
+    """Longest the server delays the ACKs of an upload with these params"""
+    if params.protocol != PROTOCOL_SR or args.plain_ack:
+        return 0
+    return ack_policy.max_delay()
+
+
+def prepare_resumed_upload(filepath, params):
+    """Copy the stored file to the partial file when a resumed upload
+    continues it, so the new bytes don't go into the file being served.
+    Return whether the copy was made"""
+    if params.offset and not Path(partial_path(filepath)).exists():
+        shutil.copyfile(filepath, partial_path(filepath))
+        return True
+    return False
+
+
+def finish_upload(filepath, params, content_hash=None):
+    """Verify a completed upload and move its partial file into place.
+    Sessions that opened the previous file keep reading it"""
+    if content_hash is not None and params.content_hash:
+        if params.content_hash != content_hash:
+            verbose_print(
+                f"ERROR: {filepath} doesn't match the client's content hash", True
+            )
+            return False
+    os.replace(partial_path(filepath), filepath)
+    if content_hash is not None:
+        content_index.add(filepath, content_hash)
+    return True
+
+
+def start_parallel_upload(filepath, client_address, params):
+    """Register a stream of a parallel upload, return False if it doesn't
+    belong to one. Stream 0 starts the upload and creates its partial file"""
+    with parallel_uploads_lock:
+        if params.stream > 0:
+            upload = parallel_uploads.get(filepath)
+            return upload is not None and upload.join(client_address[0], params)
+        parallel_uploads[filepath] = ParallelUpload(
+            client_address[0], params.file_size, params.streams
+        )
+    # Cada stream escribe su rango sin truncar: el parcial ya tiene el tamaño final
+    with open(partial_path(filepath), "wb") as file:
+        file.truncate(params.file_size)
+    return True
+
+
+def finish_parallel_upload(filepath, params, completed):
+    """Record the end of a stream of a parallel upload and, after the last
+    one, move the file into place (or drop it if a stream failed). Return
+    whether the stream completed"""
+    with parallel_uploads_lock:
+        upload = parallel_uploads.get(filepath)
+        if upload is None or not upload.finish(params.stream, completed):
+            return completed
+        del parallel_uploads[filepath]
+    if upload.failed:
+        Path(partial_path(filepath)).unlink(missing_ok=True)
+        return completed
+    os.replace(partial_path(filepath), filepath)
+    # Los rangos llegan desordenados, asi que el hash se calcula al final
+    threading.Thread(target=index_file, args=(filepath,), daemon=True).start()
+    return completed
+
+
+def index_file(filepath):
+    try:
+        content_index.add(filepath, file_content_hash(filepath))
+    except OSError:
+        # Se borro o reemplazo mientras lo leiamos
+        pass
+
+
+def expire_parallel_upload(filepath):
+    """Drop a parallel upload whose client never opened all its streams, so
+    its partial file doesn't block new uploads"""
+    with parallel_uploads_lock:
+        upload = parallel_uploads.get(filepath)
+        if upload is None or not upload.is_stale():
+            return
+        del parallel_uploads[filepath]
+    Path(partial_path(filepath)).unlink(missing_ok=True)
+
+
+def is_fast_open_retry(filepath, params, fast_open_data):
+    """A repeated fast-open request whose ACK was lost: the whole file came in
+    the request and we already wrote it"""
+    return (
+        params.file_size == len(fast_open_data)
+        and Path(filepath).is_file()
+        and Path(filepath).stat().st_size == len(fast_open_data)
+        and Path(filepath).read_bytes() == fast_open_data
     )
+
+
+def accept_fast_open(filepath, params, fast_open_data):
+    """Write the first bytes of the file that came in the request to its
+    partial file, the transfer continues from where they end"""
+    with open(partial_path(filepath), "wb") as file:
+        file.write(fast_open_data)
+    params.offset = len(fast_open_data)
+
+
+def initial_server_response(
+    request_type, filepath, seq_number, client_address, params, fast_open_data=b""
+):
+    filename = Path(filepath).name
+    error_packet = encode_header(ERROR_TYPE, seq_number)
+    # El indice y las subidas en curso son del server, no se sirven ni se pisan
+    if filename in (INDEX_FILENAME, INDEX_LOCK_FILENAME, PARTIAL_DIR):
+        return error_packet + f"Reserved file name: {filename}".encode()
     if request_type == Type.DOWNLOAD:
-        if not Path(filepath).exists():
+        if not Path(filepath).is_file():
             error_msg = f"The server storage doesn't contain the file: {filename}"
             return error_packet + error_msg.encode()
     elif request_type == Type.UPLOAD:
-        if Path(filepath).exists():
+        expire_parallel_upload(filepath)
+        if params.content_hash and deduplicate_upload(filepath, params):
+            params.deduplicated = True
+        elif params.fast_open and is_fast_open_retry(
+            filepath, params, fast_open_data
+        ):
+            pass
+        # Los demas streams de un UPLOAD en paralelo se suman a la subida que
+        # valido el stream 0, o se rechazan al resolver su rango
+        elif params.stream > 0:
+            pass
+        # Un UPLOAD reanudado continua el archivo parcial que ya tenemos
+        elif Path(filepath).exists() and not params.resume:
             error_msg = f"The server storage already contains a file named: {filename}"
             return error_packet + error_msg.encode()
-    ack_packet = Type.ACK.value.to_bytes(TYPE_SIZE, "big") + seq_number.to_bytes(
-        SEQ_NUMBER_SIZE, "big"
-    )
-    return ack_packet
+        # Otra subida lo esta recibiendo, o quedo cortada y se sigue con --resume
+        elif Path(partial_path(filepath)).exists() and not params.resume:
+            error_msg = f"The server has a partial upload of {filename}, use --resume"
+            return error_packet + error_msg.encode()
+    # Una subida deduplicada ya esta completa, no hay rango ni offset que resolver
+    if params.deduplicated:
+        pass
+    elif params.streams > 1:
+        if not params.is_valid_stream() or (
+            request_type == Type.UPLOAD and params.file_size is None
+        ):
+            return error_packet + b"Invalid stream range request"
+        if request_type == Type.UPLOAD and not start_parallel_upload(
+            filepath, client_address, params
+        ):
+            error_msg = f"No parallel upload of {filename} for this stream to join"
+            return error_packet + error_msg.encode()
+        resolve_stream_range(request_type, filepath, params)
+    elif params.resume:
+        resolve_resume_offset(request_type, filepath, params)
+    elif request_type == Type.UPLOAD and params.fast_open:
+        accept_fast_open(filepath, params, fast_open_data)
+    # Con el hash el cliente puede verificar el archivo descargado
+    if request_type == Type.DOWNLOAD and params.is_whole_file():
+        params.content_hash = content_index.get_hash(filepath) or ""
+    return encode_packet(ACK_TYPE, seq_number, params.encode())
 
 
-def handle_connection(filepath, request_type, request_seq_number, client_address):
-    new_udp_socket = socket(AF_INET, SOCK_DGRAM)
-    new_udp_socket.bind((args.host, 0))
-    new_udp_socket.settimeout(HANDSHAKE_TIMEOUT)
+def transfer_task(
+    udp_socket,
+    filepath,
+    request_type,
+    request_seq_number,
+    client_address,
+    params,
+    chunks=None,
+    transfer_stats=None,
+    trace=None,
+    fast_open_data=b"",
+):
+    if params.resume or params.content_hash:
+        # Verificar el offset o copiar un archivo deduplicado lee el archivo: no
+        # lo hacemos en el loop de sesiones
+        packet_to_send = yield from prepare_session_task(
+            lambda: initial_server_response(
+                request_type,
+                filepath,
+                request_seq_number,
+                client_address,
+                params,
+                fast_open_data,
+            ),
+            udp_socket,
+            client_address,
+            request_seq_number,
+            args.verbose,
+        )
+    else:
+        packet_to_send = initial_server_response(
+            request_type,
+            filepath,
+            request_seq_number,
+            client_address,
+            params,
+            fast_open_data,
+        )
+    accepted = decode_header(packet_to_send)[0] == ACK_TYPE
 
-    packet_to_send = initial_server_response(
-        request_type, filepath, request_seq_number)
+    # La copia del archivo guardado tiene que estar antes de recibir los datos
+    copied = False
+    if accepted and request_type == Type.UPLOAD and params.resume:
+        copied = yield from prepare_session_task(
+            lambda: prepare_resumed_upload(filepath, params),
+            udp_socket,
+            client_address,
+            request_seq_number,
+            args.verbose,
+        )
+
+    if params.deduplicated:
+        # No hay nada que transferir: si el ACK se pierde el cliente repite el
+        # pedido y lo volvemos a contestar igual
+        udp_socket.sendto(packet_to_send, client_address)
+        stats.increment("uploads_deduplicated")
+        return True
 
-    client_response = recv_handshake(
-        new_udp_socket, request_type, client_address, packet_to_send, args.verbose
+    if accepted and params.fast_open and params.offset == params.file_size:
+        # El archivo entero vino en el pedido y ya esta escrito: el ACK cierra
+        # la sesion, y si se pierde el pedido repetido se contesta igual
+        udp_socket.sendto(packet_to_send, client_address)
+        stats.increment("uploads_fast_open")
+        hasher = new_content_hasher()
+        hasher.update(fast_open_data)
+        return finish_upload(filepath, params, hasher.hexdigest())
+
+    client_response = yield from recv_handshake_task(
+        udp_socket, request_type, client_address, packet_to_send, args.verbose
     )
 
     # Si recv_handshake nos devuelve algo distinto a ACK, algo salió mal
     if client_response != Type.ACK:
-        new_udp_socket.close()
-        return
+        if accepted and (params.fast_open or copied):
+            # La subida nunca empezo: no dejamos un parcial que bloquee la proxima
+            Path(partial_path(filepath)).unlink(missing_ok=True)
+        if accepted and request_type == Type.UPLOAD and params.streams > 1:
+            finish_parallel_upload(filepath, params, False)
+        return False
+
+    verbose_print(f"Session with {client_address}: {params}", args.verbose)
 
     if request_type == Type.DOWNLOAD:
-        if args.protocol:
-            new_udp_socket.settimeout(RECEIVER_TIMEOUT_SR)
-            send_file_sr(new_udp_socket, filepath,
-                         client_address, args.verbose)
+        if params.protocol == PROTOCOL_SR:
+            congestion_control = CONGESTION_CONTROLS[args.cc](
+                params.window_size, record_history=bool(args.cwnd_log)
+            )
+            completed = yield from send_file_sr_task(
+                udp_socket,
+                filepath,
+                client_address,
+                args.verbose,
+                rtt=RttEstimator(SENDER_TIMEOUT_SR, ack_delay=params.ack_delay),
+                window_size=params.window_size,
+                congestion_control=congestion_control,
+                payload_size=params.payload_size,
+                offset=params.offset,
+                length=params.length,
+                compression=params.compression,
+                chunk_cache=chunk_cache,
+                chunks=chunks,
+                stats=transfer_stats,
+                trace=trace,
+            )
+            if args.cwnd_log:
+                # Un archivo por sesion
+                congestion_control.dump(
+                    f"{args.cwnd_log}.{client_address[0]}_{client_address[1]}"
+                )
         else:
-            new_udp_socket.settimeout(SENDER_TIMEOUT_SW)
-            send_file_sw(new_udp_socket, filepath,
-                         client_address, args.verbose)
+            completed = yield from send_file_sw_task(
+                udp_socket,
+                filepath,
+                client_address,
+                args.verbose,
+                payload_size=params.payload_size,
+                offset=params.offset,
+                length=params.length,
+                compression=params.compression,
+                chunk_cache=chunk_cache,
+                chunks=chunks,
+                stats=transfer_stats,
+                trace=trace,
+            )
+        return completed
 
     elif request_type == Type.UPLOAD:
-        if args.protocol:
-            new_udp_socket.settimeout(RECEIVER_TIMEOUT_SR)
-            recv_file_sr(new_udp_socket, filepath, args.verbose)
+        # El hash se calcula a medida que llegan los datos, sin releer el archivo
+        hasher = None
+        if params.is_whole_file():
+            hasher = new_content_hasher()
+        elif params.fast_open and params.length is None:
+            # Los bytes del pedido ya estan escritos, el resto llega en orden
+            hasher = new_content_hasher()
+            hasher.update(fast_open_data)
+        if params.protocol == PROTOCOL_SR:
+            completed = yield from recv_file_sr_task(
+                udp_socket,
+                partial_path(filepath),
+                args.verbose,
+                window_size=params.window_size,
+                sack=not args.plain_ack,
+                payload_size=params.payload_size,
+                sync_policy=sync_policy,
+                offset=params.offset,
+                length=params.length,
+                compression=params.compression,
+                hasher=hasher,
+                stats=transfer_stats,
+                trace=trace,
+                ack_policy=ack_policy,
+            )
         else:
-            new_udp_socket.settimeout(RECEIVER_TIMEOUT_SW)
-            recv_file_sw(new_udp_socket, filepath, args.verbose)
+            completed = yield from recv_file_sw_task(
+                udp_socket,
+                partial_path(filepath),
+                args.verbose,
+                payload_size=params.payload_size,
+                sync_policy=sync_policy,
+                offset=params.offset,
+                length=params.length,
+                compression=params.compression,
+                hasher=hasher,
+                stats=transfer_stats,
+                trace=trace,
+            )
+        if params.streams > 1:
+            return finish_parallel_upload(filepath, params, completed)
+        if not completed:
+            return False
+        content_hash = hasher.hexdigest() if hasher is not None else None
+        return finish_upload(filepath, params, content_hash)
+
+    return True
 
+
+def session_task(
+    udp_socket,
+    filepath,
+    request_type,
+    request_seq_number,
+    client_address,
+    params,
+    chunks=None,
+    fast_open_data=b"",
+):
+    stats.increment("sessions_started")
+    transfer_stats = TransferStats()
+    session_info = {
+        "client": f"{client_address[0]}:{client_address[1]}",
+        "file": Path(filepath).name,
+        "type": request_type.name.lower(),
+        "protocol": params.protocol,
+    }
+    session_id = sessions.add(session_info, transfer_stats)
+    trace = None
+    if packet_trace is not None:
+        trace = packet_trace.session(session_info)
+    try:
+        completed = yield from transfer_task(
+            udp_socket,
+            filepath,
+            request_type,
+            request_seq_number,
+            client_address,
+            params,
+            chunks,
+            transfer_stats,
+            trace,
+            fast_open_data,
+        )
+    except Exception:
+        stats.increment("sessions_failed")
+        raise
+    finally:
+        sessions.remove(session_id)
+    stats.increment("sessions_completed" if completed else "sessions_failed")
+
+
+def create_session_socket():
+    new_udp_socket = socket(AF_INET, SOCK_DGRAM)
+    new_udp_socket.bind((args.host, 0))
+    return new_udp_socket
+
+
+def handle_connection(
+    filepath, request_type, request_seq_number, client_address, params, fast_open_data
+):
+    new_udp_socket = create_session_socket()
+    run_task(
+        session_task(
+            new_udp_socket,
+            filepath,
+            request_type,
+            request_seq_number,
+            client_address,
+            params,
+            fast_open_data=fast_open_data,
+        ),
+        new_udp_socket,
+    )
     new_udp_socket.close()
 
 
-argsparser = ArgumentParser(ParserType.SERVER)
-args = argsparser.get_args(ParserType.SERVER)
+def is_broadcast_request(request_type, filepath, params):
+    # Las descargas reanudadas o por rangos son de un solo receptor
+    return (
+        request_type == Type.DOWNLOAD
+        and not params.resume
+        and params.streams == 1
+        and Path(filepath).is_file()
+    )
+
+
+def join_broadcast(
+    filepath, request_seq_number, client_address, params, start_broadcast
+):
+    """Add the download to the broadcast of its file, starting one if needed"""
+
+    def create_task(udp_socket, chunks):
+        return session_task(
+            udp_socket,
+            filepath,
+            Type.DOWNLOAD,
+            request_seq_number,
+            client_address,
+            params,
+            chunks,
+        )
+
+    # Los receptores comparten los chunks, asi que tienen que usar el mismo tamaño
+    key = (filepath, params.payload_size)
+    with broadcasts_lock:
+        broadcast = broadcasts.get(key)
+        if broadcast is not None and broadcast.add_member(client_address, create_task):
+            return
+        broadcast = BroadcastSession(
+            create_session_socket(),
+            filepath,
+            params.payload_size,
+            args.verbose,
+            on_close=lambda broadcast: forget_broadcast(key, broadcast),
+        )
+        broadcast.add_member(client_address, create_task)
+        broadcasts[key] = broadcast
+    stats.increment("broadcasts")
+    start_broadcast(broadcast, client_address)
 
-if args.protocol:
-    from lib.rdt_sr import recv_file_sr, send_file_sr
-else:
-    from lib.rdt_sw import recv_file_sw, send_file_sw
 
-udp_sv_socket = socket(AF_INET, SOCK_DGRAM)
-udp_sv_socket.bind((args.host, args.port))
+def forget_broadcast(key, broadcast):
+    # Un broadcast terminado suelta su mmap; si ya lo reemplazo otro no se toca
+    with broadcasts_lock:
+        if broadcasts.get(key) is broadcast:
+            del broadcasts[key]
 
-with ThreadPoolExecutor(max_workers=N_THREADS) as pool:
 
-    while True:
-        print("Listening for connections...")
-        request_from_client, client_address = udp_sv_socket.recvfrom(
-            PACKET_SIZE)
-        request_type, request_seq_number = get_header(request_from_client)
-        filename = get_payload(request_from_client).decode()
-        filepath = args.storage + "/" + filename
+def handle_broadcast(broadcast):
+    run_task(broadcast.task(), broadcast.udp_socket)
+    broadcast.udp_socket.close()
 
-        pool.submit(
-            handle_connection,
+
+def handle_request(request_from_client, client_address, start_session, start_broadcast):
+    request_type, request_seq_number = decode_header(request_from_client)
+
+    # Los PROBE de PMTU se contestan directamente, sin abrir una sesion
+    if request_type == PROBE_TYPE:
+        stats.increment("probes")
+        udp_sv_socket.sendto(request_from_client[:HEADER_SIZE], client_address)
+        return
+    # Un cliente de otra version del protocolo recibe un ERROR, que puede
+    # reconocer por la version de su header; lo demas se ignora
+    if request_type == INVALID_TYPE and len(request_from_client) >= HEADER_SIZE:
+        send_error(
+            request_seq_number,
+            udp_sv_socket,
+            client_address,
+            f"Unsupported protocol version, the server speaks {PROTOCOL_VERSION}",
+        )
+        return
+    if request_type not in (DOWNLOAD_TYPE, UPLOAD_TYPE):
+        return
+    request_type = Type(request_type)
+
+    stats.increment("requests")
+    request = parse_request_payload(get_payload(request_from_client), server_params)
+    if request is None:
+        stats.increment("rejected")
+        send_error(
+            request_seq_number, udp_sv_socket, client_address, "Malformed request"
+        )
+        return
+    filename, proposed_params, fast_open_data = request
+    filepath = args.storage + "/" + filename
+    params = proposed_params.accept(server_params)
+    if request_type == Type.UPLOAD:
+        # El server es el receptor: le avisa al cliente cuanto demora sus ACK
+        params.ack_delay = get_ack_delay(params)
+
+    if args.fanout and is_broadcast_request(request_type, filepath, params):
+        join_broadcast(
+            filepath, request_seq_number, client_address, params, start_broadcast
+        )
+        return
+
+    start_session(
+        filepath,
+        request_type,
+        request_seq_number,
+        client_address,
+        params,
+        fast_open_data if params.fast_open else b"",
+    )
+
+
+def run_with_threads():
+    # Clientes con una sesion abierta, como SessionLoop.has_session
+    active_clients = set()
+    active_clients_lock = threading.Lock()
+
+    def run_session(client_address, *session_args):
+        try:
+            handle_connection(*session_args)
+        finally:
+            with active_clients_lock:
+                active_clients.discard(client_address)
+
+    with ThreadPoolExecutor(max_workers=N_THREADS) as pool:
+
+        def start_session(*session_args):
+            client_address = session_args[3]
+            with active_clients_lock:
+                active_clients.add(client_address)
+            pool.submit(run_session, client_address, *session_args)
+
+        def start_broadcast(broadcast, client_address):
+            pool.submit(handle_broadcast, broadcast)
+
+        while True:
+            print("Listening for connections...")
+            request_from_client, client_address = udp_sv_socket.recvfrom(PACKET_SIZE)
+            # Un pedido repetido de un cliente con sesion abierta es un reenvio:
+            # la sesion ya esta reenviando su respuesta
+            with active_clients_lock:
+                if client_address in active_clients:
+                    continue
+            handle_request(
+                request_from_client, client_address, start_session, start_broadcast
+            )
+
+
+def run_with_event_loop():
+    max_open_files = raise_open_files_limit()
+    # Cada sesion usa un socket, dejamos margen para los archivos abiertos
+    max_sessions = min(args.max_sessions, max_open_files // 2)
+
+    def start_session(
+        filepath,
+        request_type,
+        request_seq_number,
+        client_address,
+        params,
+        fast_open_data,
+    ):
+        new_udp_socket = create_session_socket()
+        task = session_task(
+            new_udp_socket,
             filepath,
             request_type,
             request_seq_number,
             client_address,
+            params,
+            fast_open_data=fast_open_data,
+        )
+        session_loop.add_session(new_udp_socket, task, client_address)
+
+    def start_broadcast(broadcast, client_address):
+        session_loop.add_session(broadcast.udp_socket, broadcast.task(), client_address)
+
+    def on_request(request_from_client, client_address):
+        # Un pedido repetido de un cliente con sesion abierta es un reenvio:
+        # la sesion ya esta reenviando su respuesta
+        if session_loop.has_session(client_address):
+            return
+        if session_loop.is_full():
+            stats.increment("rejected")
+            send_error(0, udp_sv_socket, client_address, "The server is busy")
+            return
+        handle_request(
+            request_from_client, client_address, start_session, start_broadcast
         )
+
+    session_loop = SessionLoop(udp_sv_socket, on_request, max_sessions, args.verbose)
+    print(f"Listening for connections (up to {max_sessions} sessions)...")
+    session_loop.run()
+
+
+argsparser = ArgumentParser(ParserType.SERVER)
+args = argsparser.get_args(ParserType.SERVER)
+
+# Limites del server, y parametros para clientes que no los negocian
+server_params = TransferParams(
+    PROTOCOL_SR if args.protocol else PROTOCOL_SW, args.payload_size, args.window
+)
+sync_policy = SyncPolicy(args.sync_bytes, args.sync_interval)
+ack_policy = AckPolicy(
+    args.ack_every, args.ack_delay / 1000 if args.ack_delay is not None else None
+)
+
+os.makedirs(os.path.join(args.storage, PARTIAL_DIR), exist_ok=True)
+
+# Se carga antes de crear los workers, que heredan una copia cada uno. Lo que
+# no esta en el indice guardado se hashea en un thread desde el primer pedido
+content_index = ContentIndex(args.storage)
+verbose_print(f"Loaded {content_index.load()} indexed files", args.verbose)
+
+# Broadcast en curso de cada archivo, para sumarle las descargas que llegan
+broadcasts = {}
+broadcasts_lock = threading.Lock()
+# Subida en paralelo en curso de cada archivo, para sumarle sus demas streams
+parallel_uploads = {}
+parallel_uploads_lock = threading.Lock()
+
+
+def serve(server_stats):
+    global stats, udp_sv_socket, chunk_cache, sessions, packet_trace
+    stats = server_stats
+    # Cada worker tiene su propio cache, compartido por todas sus sesiones
+    chunk_cache = None
+    if args.chunk_cache > 0:
+        chunk_cache = ChunkCache(args.chunk_cache * 1024 * 1024)
+        stats.add_source(chunk_cache.snapshot)
+    sessions = SessionRegistry()
+    stats.add_source(sessions.snapshot)
+    if args.stats_port:
+        # Cada worker expone sus estadisticas en su propio puerto
+        stats_port = args.stats_port + stats.worker_id
+        start_stats_endpoint(
+            STATS_HOST, stats_port, stats.snapshot, sessions.session_snapshots
+        )
+        verbose_print(f"Stats available at http://{STATS_HOST}:{stats_port}", True)
+    packet_trace = PacketTrace() if args.trace else None
+    udp_sv_socket = create_listen_socket(
+        args.host, args.port, reuse_port=args.workers > 1
+    )
+
+    try:
+        if args.event_loop:
+            run_with_event_loop()
+        else:
+            run_with_threads()
+    finally:
+        if packet_trace is not None:
+            # Un archivo por worker
+            trace_path = args.trace
+            if args.workers > 1:
+                trace_path += f".{stats.worker_id}"
+            packet_trace.dump(trace_path)
+
+
+if args.workers > 1:
+    run_workers(args.workers, serve)
+else:
+    single_stats = ServerStats()
+    try:
+        serve(single_stats)
+    except KeyboardInterrupt:
+        print(f"Server stats: {format_stats(single_stats.snapshot())}")
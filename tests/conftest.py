@@ -0,0 +1,105 @@
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import wait
+from socket import AF_INET, SOCK_DGRAM, socket
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from lib.packet_codec import PROBE_TYPE, decode_header, encode_header
+
+HOST = "127.0.0.1"
+SERVER_START_TIMEOUT = 30
+
+
+def pytest_configure(config):
+    config.addinivalue_line(
+        "markers", "slow: multi-GB loopback transfers (deselect with -m 'not slow')"
+    )
+
+
+def free_port():
+    with socket(AF_INET, SOCK_DGRAM) as probe:
+        probe.bind((HOST, 0))
+        return probe.getsockname()[1]
+
+
+def wait_until_listening(port, process):
+    """Wait until the server answers a PMTU probe, which it does without a session"""
+    deadline = time.monotonic() + SERVER_START_TIMEOUT
+    with socket(AF_INET, SOCK_DGRAM) as probe:
+        probe.settimeout(0.2)
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                raise RuntimeError(f"Server exited with {process.returncode}")
+            probe.sendto(encode_header(PROBE_TYPE, 0), (HOST, port))
+            try:
+                response, _ = probe.recvfrom(64)
+            except OSError:
+                continue
+            if decode_header(response)[0] == PROBE_TYPE:
+                return
+    raise RuntimeError("Server didn't start listening")
+
+
+def read_chunks(chunks, n_chunks):
+    """What a sender sends for each chunk of a CompressedChunks, letting every
+    compression finish first so the result doesn't depend on timing"""
+    sent = []
+    for index in range(n_chunks):
+        chunks.submit_ahead(index)
+        wait(list(chunks.pending.values()))
+        sent.append((bytes(chunks.get(index)), chunks.is_compressed(index)))
+    return sent
+
+
+def run_script(script, *script_args, timeout=120):
+    return subprocess.run(
+        [sys.executable, os.path.join(ROOT, script), *map(str, script_args)],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+        timeout=timeout,
+    )
+
+
+@pytest.fixture
+def start_server(tmp_path):
+    """Start servers on free loopback ports, return (port, storage, process).
+    Files the server should find at startup go in by setup(storage)"""
+    processes = []
+
+    def start(*server_args, setup=None):
+        port = free_port()
+        storage = tmp_path / f"storage{len(processes)}"
+        storage.mkdir()
+        if setup is not None:
+            setup(storage)
+        process = subprocess.Popen(
+            [
+                sys.executable,
+                os.path.join(ROOT, "start-server.py"),
+                "-H",
+                HOST,
+                "-p",
+                str(port),
+                "-s",
+                str(storage),
+                *map(str, server_args),
+            ],
+            cwd=ROOT,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        processes.append(process)
+        wait_until_listening(port, process)
+        return port, storage, process
+
+    yield start
+    for process in processes:
+        process.kill()
+        process.wait()
@@ -0,0 +1,78 @@
+from lib.broadcast import BroadcastSession
+from lib.impairment_proxy import LinkProfile
+from lib.rdt_sr import recv_file_sr_task, send_file_sr_task
+from lib.simulator import SENDER_ADDRESS, Simulator, SyntheticChunks, VerifyingSink
+
+PAYLOAD_SIZE = 1024
+FILE_SIZE = 200_000
+FAST_RECEIVER = ("10.0.0.2", 8080)
+SLOW_RECEIVER = ("10.0.0.3", 8080)
+
+
+def test_broadcast_to_a_fast_and_a_slow_lossy_receiver(tmp_path):
+    # El contenido sintetico permite verificar cada chunk en el receptor
+    chunks = SyntheticChunks(FILE_SIZE, PAYLOAD_SIZE)
+    filepath = tmp_path / "file"
+    filepath.write_bytes(
+        b"".join(chunks.get(index) for index in range(-(-FILE_SIZE // PAYLOAD_SIZE)))
+    )
+
+    simulator = Simulator(seed=3)
+    sender_socket = simulator.add_endpoint(SENDER_ADDRESS, LinkProfile(delay=0.01))
+    sinks = {}
+    profiles = {
+        FAST_RECEIVER: LinkProfile(delay=0.01),
+        SLOW_RECEIVER: LinkProfile(delay=0.2, loss=0.2),
+    }
+    for address, profile in profiles.items():
+        receiver_socket = simulator.add_endpoint(address, profile)
+        sinks[address] = VerifyingSink(FILE_SIZE, PAYLOAD_SIZE)
+        simulator.start(
+            address,
+            recv_file_sr_task(
+                receiver_socket,
+                None,
+                False,
+                payload_size=PAYLOAD_SIZE,
+                sink=sinks[address],
+                clock=simulator.clock,
+            ),
+        )
+
+    closed = []
+    broadcast = BroadcastSession(
+        sender_socket,
+        filepath,
+        PAYLOAD_SIZE,
+        False,
+        on_close=closed.append,
+        clock=simulator.clock,
+    )
+
+    def member_task(address):
+        def create_task(udp_socket, member_chunks):
+            return send_file_sr_task(
+                udp_socket,
+                None,
+                address,
+                False,
+                payload_size=PAYLOAD_SIZE,
+                chunks=member_chunks,
+                clock=simulator.clock,
+            )
+
+        return create_task
+
+    for address in profiles:
+        assert broadcast.add_member(address, member_task(address))
+    simulator.start(SENDER_ADDRESS, broadcast.task())
+    simulator.run()
+
+    assert all(sink.is_complete() for sink in sinks.values())
+    # El receptor lento no frena al rapido
+    fast = simulator.endpoints[FAST_RECEIVER].finish_time
+    slow = simulator.endpoints[SLOW_RECEIVER].finish_time
+    assert fast < slow / 3
+    # Al terminar el ultimo receptor el broadcast se cierra y avisa una vez
+    assert closed == [broadcast]
+    assert not broadcast.add_member(FAST_RECEIVER, member_task(FAST_RECEIVER))
@@ -0,0 +1,69 @@
+import os
+
+from conftest import read_chunks
+from lib.chunk_cache import ENTRY_OVERHEAD, ChunkCache
+from lib.compression import CompressedChunks, get_codec
+from lib.file_chunks import FileChunks
+
+PAYLOAD_SIZE = 4096
+CHUNK = b"x" * 100
+
+
+def test_least_recently_used_chunk_is_evicted(tmp_path):
+    (tmp_path / "file").write_bytes(b"data")
+    # Entran tres chunks
+    cache = ChunkCache(3 * (len(CHUNK) + ENTRY_OVERHEAD))
+    prefix = cache.open_file(os.stat(tmp_path / "file"))
+    for offset in (0, 100, 200):
+        cache.put((prefix, offset), CHUNK)
+
+    # Usar el primero lo salva: se va el segundo
+    assert cache.get((prefix, 0)) == CHUNK
+    cache.put((prefix, 300), CHUNK)
+
+    assert cache.get((prefix, 100)) is None
+    assert all(cache.get((prefix, offset)) == CHUNK for offset in (0, 200, 300))
+    snapshot = cache.snapshot()
+    assert snapshot["chunk_cache_evictions"] == 1
+    assert snapshot["chunk_cache_bytes"] == 3 * (len(CHUNK) + ENTRY_OVERHEAD)
+
+
+def test_chunks_of_a_changed_file_are_dropped(tmp_path):
+    (tmp_path / "file").write_bytes(b"data")
+    cache = ChunkCache(1 << 20)
+    old_prefix = cache.open_file(os.stat(tmp_path / "file"))
+    cache.put((old_prefix, 0), CHUNK)
+
+    # Se reescribe en el lugar: mismo inodo, otro contenido
+    with open(tmp_path / "file", "r+b") as file:
+        file.write(b"new data")
+    new_prefix = cache.open_file(os.stat(tmp_path / "file"))
+
+    assert new_prefix != old_prefix
+    assert cache.get((old_prefix, 0)) is None
+    assert cache.snapshot()["chunk_cache_bytes"] == 0
+    assert cache.snapshot()["chunk_cache_invalidations"] == 1
+    # Un chunk que se termino de codificar con la version vieja no entra
+    cache.put((old_prefix, 100), CHUNK)
+    assert cache.get((old_prefix, 100)) is None
+
+
+def test_sessions_share_compressed_chunks(tmp_path):
+    data = b"compressible " * 4000
+    (tmp_path / "file").write_bytes(data)
+    n_chunks = -(-len(data) // PAYLOAD_SIZE)
+    cache = ChunkCache(1 << 20)
+
+    sent = []
+    for _ in range(2):
+        with open(tmp_path / "file", "rb") as file:
+            chunks = CompressedChunks(
+                FileChunks(file, PAYLOAD_SIZE), get_codec("zlib"), cache=cache
+            )
+            sent.append(read_chunks(chunks, n_chunks))
+            chunks.close()
+
+    # La segunda sesion manda lo mismo sin comprimir nada
+    assert sent[0] == sent[1]
+    assert chunks.n_cached == n_chunks
+    assert cache.snapshot()["chunk_cache_hits"] == n_chunks
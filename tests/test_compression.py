@@ -0,0 +1,88 @@
+import os
+
+import pytest
+
+from conftest import HOST, read_chunks, run_script
+from lib import compression
+from lib.compression import (
+    CODECS,
+    INCOMPRESSIBLE_SAMPLE_INTERVAL,
+    INCOMPRESSIBLE_STREAK,
+    CompressedChunks,
+    decompress_chunk,
+    get_codec,
+)
+from lib.file_chunks import FileChunks
+
+PAYLOAD_SIZE = 4096
+
+
+@pytest.mark.parametrize("name", list(CODECS))
+def test_codec_round_trip(name):
+    codec = get_codec(name)
+    data = b"compressible " * 300
+
+    compressed = codec.compress(data)
+
+    assert len(compressed) < len(data)
+    assert decompress_chunk(codec, compressed, len(data)) == data
+    # Un chunk que no decodifica, o que se expande de mas, se descarta
+    assert decompress_chunk(codec, b"\xff" * 64, len(data)) is None
+    assert decompress_chunk(codec, compressed, len(data) - 1) is None
+
+
+def test_compressible_chunks_are_sent_compressed(tmp_path):
+    data = b"compressible " * 4000
+    (tmp_path / "file").write_bytes(data)
+    n_chunks = -(-len(data) // PAYLOAD_SIZE)
+    codec = get_codec("zlib")
+
+    with open(tmp_path / "file", "rb") as file:
+        chunks = CompressedChunks(FileChunks(file, PAYLOAD_SIZE), codec)
+        sent = read_chunks(chunks, n_chunks)
+        chunks.close()
+
+    assert all(is_compressed for _, is_compressed in sent)
+    received = b"".join(
+        decompress_chunk(codec, payload, PAYLOAD_SIZE) for payload, _ in sent
+    )
+    assert received == data
+
+
+def test_incompressible_chunks_are_only_sampled(tmp_path, monkeypatch):
+    n_chunks = 4 * INCOMPRESSIBLE_SAMPLE_INTERVAL
+    (tmp_path / "file").write_bytes(os.urandom(n_chunks * PAYLOAD_SIZE))
+    attempts = []
+    compress_if_smaller = compression.compress_if_smaller
+
+    def counting_compress(codec, data):
+        attempts.append(len(data))
+        return compress_if_smaller(codec, data)
+
+    monkeypatch.setattr(compression, "compress_if_smaller", counting_compress)
+
+    with open(tmp_path / "file", "rb") as file:
+        chunks = CompressedChunks(FileChunks(file, PAYLOAD_SIZE), get_codec("zlib"))
+        sent = read_chunks(chunks, n_chunks)
+        chunks.close()
+
+    # Se mandan crudos y, despues de la racha, solo se prueba una muestra
+    assert not any(is_compressed for _, is_compressed in sent)
+    assert b"".join(payload for payload, _ in sent) == (tmp_path / "file").read_bytes()
+    assert len(attempts) < INCOMPRESSIBLE_STREAK + n_chunks // 4
+
+
+def test_compressed_download(start_server, tmp_path):
+    data = b"compressible " * 30_000
+    port, _, _ = start_server(
+        setup=lambda storage: (storage / "file.txt").write_bytes(data)
+    )
+    (tmp_path / "downloads").mkdir()
+
+    download = run_script(
+        "download.py", "-H", HOST, "-p", port, "-d", tmp_path / "downloads",
+        "-n", "file.txt", "-r", "--compress",
+    )
+
+    assert download.returncode == 0, download.stdout + download.stderr
+    assert (tmp_path / "downloads" / "file.txt").read_bytes() == data
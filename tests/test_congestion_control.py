@@ -0,0 +1,32 @@
+import pytest
+
+from lib.congestion_control import CONGESTION_CONTROLS
+from lib.rtt_estimator import RttEstimator
+
+
+def sampled_rtt():
+    rtt = RttEstimator(0.1)
+    rtt.add_sample(0.01)
+    return rtt
+
+
+@pytest.mark.parametrize("name", sorted(CONGESTION_CONTROLS))
+def test_history_is_only_kept_when_requested(name):
+    congestion_control = CONGESTION_CONTROLS[name](64)
+    rtt = sampled_rtt()
+    for _ in range(1000):
+        congestion_control.on_ack(1, rtt)
+        congestion_control.on_loss()
+
+    assert congestion_control.history is None
+
+
+def test_recorded_history_is_dumped(tmp_path):
+    congestion_control = CONGESTION_CONTROLS["reno"](64, record_history=True)
+    congestion_control.on_ack(4, sampled_rtt())
+    congestion_control.on_timeout()
+    congestion_control.dump(tmp_path / "cwnd.csv")
+
+    lines = (tmp_path / "cwnd.csv").read_text().splitlines()
+    assert lines[0] == "time,cwnd,ssthresh"
+    assert [float(line.split(",")[1]) for line in lines[1:]] == [4, 8, 1]
@@ -0,0 +1,84 @@
+import os
+import threading
+
+import pytest
+
+from lib import content_index
+from lib.content_index import ContentIndex, file_content_hash
+
+
+@pytest.fixture
+def hashed_paths(monkeypatch):
+    """Paths hashed by the index, in order"""
+    paths = []
+
+    def counting_hash(path):
+        paths.append(path)
+        return file_content_hash(path)
+
+    monkeypatch.setattr(content_index, "file_content_hash", counting_hash)
+    return paths
+
+
+def test_files_are_hashed_in_the_background(tmp_path, hashed_paths):
+    (tmp_path / "a.bin").write_bytes(b"a")
+    path = str(tmp_path / "a.bin")
+    index = ContentIndex(str(tmp_path))
+
+    assert index.load() == 0
+    assert hashed_paths == []
+    # El primer pedido arranca el indexado y no lo espera
+    index.get_hash(path)
+    index.build_thread.join()
+    assert index.get_hash(path) == file_content_hash(path)
+    assert hashed_paths == [path]
+
+
+def test_saved_index_is_reused_until_the_file_changes(tmp_path, hashed_paths):
+    (tmp_path / "a.bin").write_bytes(b"a")
+    (tmp_path / "b.bin").write_bytes(b"b")
+    ContentIndex(str(tmp_path)).build()
+    hashed_paths.clear()
+
+    index = ContentIndex(str(tmp_path))
+    assert index.load() == 2
+    assert index.find(file_content_hash(str(tmp_path / "b.bin"))) is not None
+    index.build_thread.join()
+    assert hashed_paths == []
+
+    # Un archivo nuevo reemplaza al guardado: otro inodo
+    (tmp_path / "new.bin").write_bytes(b"c")
+    os.replace(tmp_path / "new.bin", tmp_path / "a.bin")
+    index = ContentIndex(str(tmp_path))
+    assert index.load() == 1
+    assert index.build() == 2
+    assert hashed_paths == [str(tmp_path / "a.bin")]
+
+
+def test_workers_hash_the_storage_once(tmp_path, hashed_paths):
+    for filename in ("a.bin", "b.bin", "c.bin"):
+        (tmp_path / filename).write_bytes(filename.encode())
+    # Cada worker tiene su propio indice sobre el mismo storage
+    indexes = [ContentIndex(str(tmp_path)) for _ in range(4)]
+
+    threads = [threading.Thread(target=index.build) for index in indexes]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(hashed_paths) == sorted(
+        str(tmp_path / filename) for filename in ("a.bin", "b.bin", "c.bin")
+    )
+    assert all(len(index.entries) == 3 for index in indexes)
+
+
+def test_saves_of_different_workers_are_merged(tmp_path):
+    (tmp_path / "a.bin").write_bytes(b"a")
+    (tmp_path / "b.bin").write_bytes(b"b")
+    first, second = ContentIndex(str(tmp_path)), ContentIndex(str(tmp_path))
+
+    first.add(str(tmp_path / "a.bin"), file_content_hash(str(tmp_path / "a.bin")))
+    second.add(str(tmp_path / "b.bin"), file_content_hash(str(tmp_path / "b.bin")))
+
+    assert ContentIndex(str(tmp_path)).load() == 2
@@ -0,0 +1,40 @@
+import threading
+import time
+from socket import AF_INET, SOCK_DGRAM, socket
+
+from conftest import HOST
+from lib.packet_codec import ACK_TYPE, Type, encode_packet
+from lib.rdt_shared import (
+    HANDSHAKE_TIMEOUT,
+    MAX_TRIES,
+    establish_connection,
+    send_handshake_pending,
+)
+
+
+def test_client_waits_while_the_server_prepares_the_session():
+    server = socket(AF_INET, SOCK_DGRAM)
+    server.bind((HOST, 0))
+    # Mas de lo que el cliente espera a un server que no contesta
+    preparation_time = MAX_TRIES * HANDSHAKE_TIMEOUT + 1
+
+    def serve():
+        _, client_address = server.recvfrom(4096)
+        deadline = time.monotonic() + preparation_time
+        while time.monotonic() < deadline:
+            send_handshake_pending(0, server, client_address, False)
+            time.sleep(HANDSHAKE_TIMEOUT / 2)
+        server.sendto(encode_packet(ACK_TYPE, 0, b"protocol=sw"), client_address)
+
+    thread = threading.Thread(target=serve)
+    thread.start()
+    with socket(AF_INET, SOCK_DGRAM) as client:
+        client.settimeout(HANDSHAKE_TIMEOUT)
+        response_type, _, payload = establish_connection(
+            client, Type.UPLOAD, server.getsockname(), b"file.bin\x00", False
+        )
+    thread.join()
+    server.close()
+
+    assert response_type == Type.ACK
+    assert payload == b"protocol=sw"
@@ -0,0 +1,84 @@
+import os
+import random
+import threading
+
+import pytest
+
+from conftest import HOST, run_script
+from lib.impairment_proxy import ImpairmentProxy, Link, LinkProfile
+
+N_PACKETS = 20_000
+PACKET_SIZE = 1000
+
+
+def send_packets(profile, seed, n_packets=N_PACKETS, interval=0.0):
+    """Delivery times of n_packets sent through a link every interval"""
+    link = Link(profile, random.Random(seed))
+    return link, [
+        link.delivery_times(index * interval, PACKET_SIZE) for index in range(n_packets)
+    ]
+
+
+@pytest.mark.parametrize("burst", [1.0, 4.0])
+def test_loss_rate(burst):
+    link, deliveries = send_packets(LinkProfile(loss=0.1, burst=burst), seed=1)
+
+    lost = [not times for times in deliveries]
+    assert sum(lost) == link.lost
+    assert 0.09 < link.lost / N_PACKETS < 0.11
+    # Largo medio de las rachas de perdidas
+    runs = "".join("x" if is_lost else "." for is_lost in lost).split(".")
+    lengths = [len(run) for run in runs if run]
+    assert sum(lengths) / len(lengths) == pytest.approx(burst, rel=0.15)
+
+
+def test_same_seed_same_losses():
+    profile = LinkProfile(loss=0.2, jitter=0.01, reorder=0.1, duplicate=0.05)
+
+    assert send_packets(profile, seed=5)[1] == send_packets(profile, seed=5)[1]
+    assert send_packets(profile, seed=5)[1] != send_packets(profile, seed=6)[1]
+
+
+def test_bandwidth_cap():
+    # 1 MB/s: un paquete por milisegundo, con lugar para 10 en la cola
+    profile = LinkProfile(delay=0.05, rate=1e6, queue_size=10 * PACKET_SIZE)
+    link, deliveries = send_packets(profile, seed=1, n_packets=20)
+
+    # Llegan todos juntos: los que no entran en la cola se descartan
+    delivered = [times[0] for times in deliveries if times]
+    assert link.queue_drops == len(deliveries) - len(delivered) > 0
+    assert delivered == pytest.approx(
+        [0.05 + (index + 1) * 0.001 for index in range(len(delivered))]
+    )
+
+    # Al ritmo del link no se descarta nada
+    link, deliveries = send_packets(profile, seed=1, n_packets=1000, interval=0.001)
+    assert link.queue_drops == 0
+    assert deliveries[-1][0] == pytest.approx(1.0 + 0.05)
+
+
+def test_download_through_a_lossy_proxy(start_server, tmp_path):
+    data = os.urandom(500_000)
+    port, _, _ = start_server(
+        setup=lambda storage: (storage / "file.bin").write_bytes(data)
+    )
+    proxy = ImpairmentProxy(
+        (HOST, 0), (HOST, port), LinkProfile(loss=0.05, delay=0.005), seed=3
+    )
+    thread = threading.Thread(target=proxy.serve_forever)
+    thread.start()
+    (tmp_path / "downloads").mkdir()
+
+    try:
+        download = run_script(
+            "download.py", "-H", HOST, "-p", proxy.address[1],
+            "-d", tmp_path / "downloads", "-n", "file.bin", "-r",
+        )
+    finally:
+        proxy.stop()
+        thread.join()
+        proxy.close()
+
+    assert download.returncode == 0, download.stdout + download.stderr
+    assert (tmp_path / "downloads" / "file.bin").read_bytes() == data
+    assert proxy.downlink.lost > 0
@@ -0,0 +1,202 @@
+import hashlib
+import os
+import subprocess
+import sys
+import time
+
+import pytest
+
+from conftest import HOST, ROOT, run_script
+from lib.rdt_shared import SESSION_IDLE_TIMEOUT
+
+# Mas de 2^16 paquetes de PAYLOAD_SIZE: con el numero de secuencia de 16
+# bits esto no se podia transferir
+LARGE_FILE_SIZE = int(os.environ.get("RDT_LARGE_FILE_SIZE", 3 << 30))
+LARGE_TRANSFER_TIMEOUT = 900
+
+
+def file_hash(path):
+    hasher = hashlib.sha256()
+    with open(path, "rb") as file:
+        while chunk := file.read(1 << 20):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def make_sparse_file(path, size):
+    """A sparse file of size bytes with some data, so a shifted or missing
+    chunk changes its hash"""
+    with open(path, "wb") as file:
+        file.truncate(size)
+        for offset in range(0, size, max(size // 64, 1)):
+            file.seek(offset)
+            file.write(offset.to_bytes(8, "big") * 16)
+
+
+@pytest.mark.parametrize("protocol_args", [[], ["-r"]], ids=["sw", "sr"])
+def test_upload_and_download(start_server, tmp_path, protocol_args):
+    data = os.urandom(300_000)
+    (tmp_path / "source").mkdir()
+    (tmp_path / "source" / "file.bin").write_bytes(data)
+    port, storage, _ = start_server()
+
+    server_args = ["-H", HOST, "-p", port]
+    upload = run_script(
+        "upload.py", *server_args, "-s", tmp_path / "source", "-n", "file.bin",
+        *protocol_args
+    )
+    assert upload.returncode == 0, upload.stdout + upload.stderr
+    assert (storage / "file.bin").read_bytes() == data
+
+    (tmp_path / "downloads").mkdir()
+    download = run_script(
+        "download.py", *server_args, "-d", tmp_path / "downloads", "-n", "file.bin",
+        *protocol_args
+    )
+    assert download.returncode == 0, download.stdout + download.stderr
+    assert (tmp_path / "downloads" / "file.bin").read_bytes() == data
+
+
+@pytest.mark.slow
+def test_multi_gigabyte_sparse_download(start_server, tmp_path):
+    port, storage, _ = start_server(
+        "--window",
+        256,
+        setup=lambda storage: make_sparse_file(storage / "large.bin", LARGE_FILE_SIZE),
+    )
+    (tmp_path / "downloads").mkdir()
+
+    client_args = ["-H", HOST, "-p", port, "-d", tmp_path / "downloads"]
+    download = run_script(
+        "download.py",
+        *client_args,
+        "-n",
+        "large.bin",
+        "-r",
+        "--window",
+        256,
+        timeout=LARGE_TRANSFER_TIMEOUT,
+    )
+
+    assert download.returncode == 0, download.stdout + download.stderr
+    received = tmp_path / "downloads" / "large.bin"
+    assert received.stat().st_size == LARGE_FILE_SIZE
+    assert file_hash(received) == file_hash(storage / "large.bin")
+
+
+@pytest.mark.slow
+def test_interrupted_download_fails(start_server, tmp_path):
+    port, _, server = start_server(
+        setup=lambda storage: make_sparse_file(storage / "large.bin", 1 << 30)
+    )
+    (tmp_path / "downloads").mkdir()
+    client = subprocess.Popen(
+        [sys.executable, os.path.join(ROOT, "download.py"), "-H", HOST, "-p", str(port)]
+        + ["-d", str(tmp_path / "downloads"), "-n", "large.bin"],
+        cwd=ROOT,
+        stdout=subprocess.PIPE,
+        text=True,
+    )
+    # El server se cae en medio de la descarga
+    time.sleep(1)
+    server.kill()
+
+    output, _ = client.communicate(timeout=SESSION_IDLE_TIMEOUT + 30)
+
+    assert client.returncode == 1
+    assert "--resume" in output
+    assert "Download time" not in output
+
+
+@pytest.mark.slow
+def test_resumed_upload_of_a_large_stored_file(start_server, tmp_path):
+    port, storage, _ = start_server(
+        setup=lambda storage: make_sparse_file(storage / "large.bin", LARGE_FILE_SIZE)
+    )
+    (tmp_path / "source").mkdir()
+    source = tmp_path / "source" / "large.bin"
+    make_sparse_file(source, LARGE_FILE_SIZE)
+    with open(source, "ab") as file:
+        file.write(os.urandom(100_000))
+
+    # El server copia lo guardado antes de aceptar: el cliente lo espera
+    upload = run_script(
+        "upload.py", "-H", HOST, "-p", port, "-s", tmp_path / "source",
+        "-n", "large.bin", "--resume", timeout=LARGE_TRANSFER_TIMEOUT,
+    )
+
+    assert upload.returncode == 0, upload.stdout + upload.stderr
+    assert f"Resuming upload from byte {LARGE_FILE_SIZE}" in upload.stdout
+    assert file_hash(source) == file_hash(storage / "large.bin")
+
+
+def test_resumed_upload_never_truncates_the_served_file(start_server, tmp_path):
+    stored = os.urandom(300_000)
+    port, storage, _ = start_server(
+        setup=lambda storage: (storage / "file.bin").write_bytes(stored)
+    )
+    (tmp_path / "source").mkdir()
+    upload_args = ["-H", HOST, "-p", port, "-s", tmp_path / "source", "-n", "file.bin"]
+
+    # Una descarga en curso tiene el archivo abierto mientras llega la subida
+    with open(storage / "file.bin", "rb") as served:
+        # No coincide con lo guardado: la subida empieza de cero
+        replacement = os.urandom(200_000)
+        (tmp_path / "source" / "file.bin").write_bytes(replacement)
+        upload = run_script("upload.py", *upload_args, "-r", "--resume")
+        assert upload.returncode == 0, upload.stdout + upload.stderr
+        assert served.read() == stored
+    assert (storage / "file.bin").read_bytes() == replacement
+
+    # Continua lo guardado sin reescribirlo
+    extended = replacement + os.urandom(100_000)
+    (tmp_path / "source" / "file.bin").write_bytes(extended)
+    with open(storage / "file.bin", "rb") as served:
+        upload = run_script("upload.py", *upload_args, "--resume")
+        assert upload.returncode == 0, upload.stdout + upload.stderr
+        assert "Resuming upload from byte 200000" in upload.stdout
+        assert served.read() == replacement
+    assert (storage / "file.bin").read_bytes() == extended
+    assert not list((storage / ".partial").iterdir())
+
+
+def test_deduplicated_upload_is_a_separate_file(start_server, tmp_path):
+    data = os.urandom(300_000)
+    (tmp_path / "source").mkdir()
+    for filename in ("a.bin", "b.bin"):
+        (tmp_path / "source" / filename).write_bytes(data)
+    port, storage, _ = start_server()
+    upload_args = ["-H", HOST, "-p", port, "-s", tmp_path / "source", "--dedup"]
+
+    assert run_script("upload.py", *upload_args, "-n", "a.bin").returncode == 0
+    upload = run_script("upload.py", *upload_args, "-n", "b.bin")
+
+    assert upload.returncode == 0, upload.stdout + upload.stderr
+    assert "already stores this content" in upload.stdout
+    # Otro inodo: truncar uno no trunca el que se sirve con el otro nombre
+    assert (storage / "a.bin").stat().st_ino != (storage / "b.bin").stat().st_ino
+    os.truncate(storage / "a.bin", 0)
+    assert (storage / "b.bin").read_bytes() == data
+
+
+def test_parallel_upload_is_moved_into_place_and_indexed(start_server, tmp_path):
+    data = os.urandom(1_000_000)
+    (tmp_path / "source").mkdir()
+    for filename in ("a.bin", "b.bin"):
+        (tmp_path / "source" / filename).write_bytes(data)
+    port, storage, _ = start_server()
+    upload_args = ["-H", HOST, "-p", port, "-s", tmp_path / "source", "-r"]
+
+    upload = run_script("upload.py", *upload_args, "-n", "a.bin", "--streams", 4)
+
+    assert upload.returncode == 0, upload.stdout + upload.stderr
+    assert (storage / "a.bin").read_bytes() == data
+    assert not list((storage / ".partial").iterdir())
+    # El hash se calcula despues de moverlo: la otra copia se deduplica
+    deadline = time.monotonic() + 5
+    while True:
+        upload = run_script("upload.py", *upload_args, "-n", "b.bin", "--dedup")
+        if "already stores this content" in upload.stdout:
+            break
+        assert time.monotonic() < deadline
+        (storage / "b.bin").unlink()
@@ -0,0 +1,41 @@
+import pytest
+
+from lib.packet_codec import (
+    HEADER_SIZE,
+    INVALID_TYPE,
+    PROTOCOL_VERSION,
+    SEQ_NUMBER_SPACE,
+    Type,
+    decode_header,
+    encode_packet,
+)
+
+
+@pytest.mark.parametrize("packet_type", list(Type))
+@pytest.mark.parametrize("seq_number", [0, 1, SEQ_NUMBER_SPACE - 1])
+def test_round_trip(packet_type, seq_number):
+    packet = encode_packet(packet_type, seq_number, b"payload")
+
+    assert decode_header(packet) == (packet_type, seq_number)
+    assert packet[HEADER_SIZE:] == b"payload"
+
+
+def test_seq_number_travels_modulo_the_space():
+    packet = encode_packet(Type.DATA, SEQ_NUMBER_SPACE + 5)
+
+    assert decode_header(packet) == (Type.DATA, 5)
+
+
+def test_other_version_is_invalid():
+    packet = encode_packet(Type.DOWNLOAD, 42, b"file.bin")
+    other_version = bytes([PROTOCOL_VERSION + 1]) + packet[1:]
+
+    # El seq number se conserva para poder contestarle con un ERROR
+    assert decode_header(other_version) == (INVALID_TYPE, 42)
+
+
+def test_short_packet_is_invalid():
+    packet = encode_packet(Type.ACK, 42)
+
+    assert decode_header(packet[: HEADER_SIZE - 1]) == (INVALID_TYPE, 0)
+    assert decode_header(b"") == (INVALID_TYPE, 0)
@@ -0,0 +1,77 @@
+import itertools
+
+import pytest
+
+from conftest import run_script
+from lib.impairment_proxy import LinkProfile
+from lib.packet_trace import Event, PacketTrace, load_trace
+from lib.simulator import simulate_transfer
+
+
+def test_dump_and_load_give_back_the_events(tmp_path):
+    ticks = itertools.count()
+    trace = PacketTrace(capacity=16, clock=lambda: next(ticks) / 1000)
+    sender = trace.session({"role": "sender"})
+    receiver = trace.session({"role": "receiver", "file": "a.bin"})
+    sender(Event.SEND, 0, 0)
+    receiver(Event.DATA, 0, 0)
+    receiver(Event.ACK_SENT, 0, 1)
+    sender(Event.ACK, 0, 1)
+    sender(Event.CLOSE, 1 << 40, 1 << 40)
+
+    trace.dump(tmp_path / "trace")
+    sessions, events = load_trace(tmp_path / "trace")
+
+    assert sessions == [{"role": "sender"}, {"role": "receiver", "file": "a.bin"}]
+    assert events == [
+        (0.0, 0, Event.SEND, 0, 0),
+        (0.001, 1, Event.DATA, 0, 0),
+        (0.002, 1, Event.ACK_SENT, 0, 1),
+        (0.003, 0, Event.ACK, 0, 1),
+        (0.004, 0, Event.CLOSE, 1 << 40, 1 << 40),
+    ]
+
+
+def test_full_buffer_keeps_the_newest_events(tmp_path):
+    trace = PacketTrace(capacity=4)
+    recorder = trace.session({})
+    for seq_number in range(10):
+        recorder(Event.SEND, seq_number, 0)
+
+    trace.dump(tmp_path / "trace")
+    _, events = load_trace(tmp_path / "trace")
+
+    # Lo mas viejo se piso, y lo que queda sale en orden
+    assert [event[3] for event in events] == [6, 7, 8, 9]
+
+
+def test_other_files_are_rejected(tmp_path):
+    (tmp_path / "trace").write_bytes(b"not a trace at all")
+
+    with pytest.raises(ValueError):
+        load_trace(tmp_path / "trace")
+
+
+def test_simulated_transfer_trace_matches_its_stats(tmp_path):
+    result = simulate_transfer(
+        "sr",
+        200_000,
+        LinkProfile(delay=0.01, loss=0.05),
+        seed=2,
+        trace_path=tmp_path / "trace",
+    )
+
+    assert result["sender"]["packets_retransmitted"] > 0
+    sessions, events = load_trace(tmp_path / "trace")
+    assert [session["role"] for session in sessions] == ["sender", "receiver"]
+    sent = [event for _, session_id, event, _, _ in events if session_id == 0]
+    assert sent.count(Event.SEND) + sent.count(Event.RETRANSMIT) == (
+        result["sender"]["packets_sent"]
+    )
+    assert sent.count(Event.RETRANSMIT) == result["sender"]["packets_retransmitted"]
+
+    analysis = run_script("analyze-trace.py", tmp_path / "trace")
+    assert analysis.returncode == 0, analysis.stderr
+    assert f"retransmitted={result['sender']['packets_retransmitted']}" in (
+        analysis.stdout
+    )
@@ -0,0 +1,81 @@
+import pytest
+
+from lib.packet_codec import (
+    DATA_TYPE,
+    SEQ_NUMBER_SPACE,
+    decode_header,
+    encode_header,
+)
+from lib.rdt_shared import unwrap_seq_number
+from lib.rdt_sr import build_sack_bitmap, get_sacked_seq_numbers
+from lib.sliding_window import SlidingWindow
+from lib.timer_queue import TimerQueue
+
+
+@pytest.mark.parametrize(
+    "seq_number",
+    [0, 1, SEQ_NUMBER_SPACE - 1, SEQ_NUMBER_SPACE, 5 * SEQ_NUMBER_SPACE + 7],
+)
+def test_seq_number_wraps_on_the_wire(seq_number):
+    packet_type, wire_seq_number = decode_header(encode_header(DATA_TYPE, seq_number))
+
+    assert packet_type == DATA_TYPE
+    assert wire_seq_number == seq_number % SEQ_NUMBER_SPACE
+
+
+@pytest.mark.parametrize(
+    "reference, seq_number",
+    [
+        (0, 0),
+        (100, 90),
+        (100, 130),
+        (SEQ_NUMBER_SPACE - 2, SEQ_NUMBER_SPACE + 3),
+        (SEQ_NUMBER_SPACE + 3, SEQ_NUMBER_SPACE - 2),
+        (3 * SEQ_NUMBER_SPACE + 10, 3 * SEQ_NUMBER_SPACE - 10),
+    ],
+)
+def test_unwrap_recovers_the_full_seq_number(reference, seq_number):
+    assert unwrap_seq_number(seq_number % SEQ_NUMBER_SPACE, reference) == seq_number
+
+
+def test_window_across_the_wrap():
+    base = SEQ_NUMBER_SPACE - 2
+    window = SlidingWindow(4, base)
+    for seq_number in (base + 1, base + 2):
+        window.mark(unwrap_seq_number(seq_number % SEQ_NUMBER_SPACE, window.base))
+
+    assert window.advance() == 0
+    window.mark(base)
+    assert window.advance() == 3
+    assert window.base == SEQ_NUMBER_SPACE + 1
+    assert window.contains(SEQ_NUMBER_SPACE + 4)
+    assert not window.contains(SEQ_NUMBER_SPACE + 5)
+
+
+def test_sack_bitmap_round_trip():
+    receiver_window = SlidingWindow(32, 10)
+    for seq_number in (10, 11, 14, 20):
+        receiver_window.mark(seq_number)
+    receiver_window.advance()
+    bitmap = build_sack_bitmap(receiver_window, 20)
+
+    sender_window = SlidingWindow(32, 8)
+    sacked = get_sacked_seq_numbers(receiver_window.base, bitmap, sender_window, 25)
+
+    assert receiver_window.base == 12
+    assert sacked == [8, 9, 10, 11, 14, 20]
+
+
+def test_timer_queue_pops_expired_in_deadline_order():
+    timers = TimerQueue()
+    timers.schedule(1, 3.0)
+    timers.schedule(2, 1.0)
+    timers.schedule(3, 2.0)
+    timers.cancel(3)
+    # Reprogramar un timer deja su entrada vieja en el heap
+    timers.schedule(1, 5.0)
+
+    assert timers.pop_expired(4.0) == [2]
+    assert timers.next_deadline() == 5.0
+    assert timers.pop_expired(5.0) == [1]
+    assert len(timers) == 0
@@ -0,0 +1,136 @@
+import os
+import signal
+import subprocess
+import sys
+import time
+from socket import AF_INET, SOCK_DGRAM, socket
+
+import pytest
+
+from conftest import HOST, ROOT, free_port, wait_until_listening
+from lib.packet_codec import (
+    ACK_TYPE,
+    DOWNLOAD_TYPE,
+    ERROR_TYPE,
+    PROTOCOL_VERSION,
+    UPLOAD_TYPE,
+    decode_header,
+    encode_packet,
+)
+from lib.rdt_shared import HANDSHAKE_TIMEOUT, MAX_TRIES, get_payload
+from lib.transfer_params import TransferParams, build_request_payload
+
+
+def request(port, packet_type, payload):
+    with socket(AF_INET, SOCK_DGRAM) as client:
+        client.settimeout(2)
+        client.sendto(encode_packet(packet_type, 0, payload), (HOST, port))
+        response, _ = client.recvfrom(4096)
+    return response
+
+
+@pytest.mark.parametrize("server_args", [[], ["--event-loop"]], ids=["threads", "loop"])
+def test_malformed_request_gets_an_error(start_server, server_args):
+    port, storage, process = start_server(*server_args)
+    (storage / "file.bin").write_bytes(b"data")
+
+    response = request(port, DOWNLOAD_TYPE, b"log.txt\x00protocol=sr;payload_size=abc")
+
+    assert decode_header(response)[0] == ERROR_TYPE
+    # El server sigue atendiendo pedidos
+    valid_request = build_request_payload("file.bin", TransferParams())
+    assert decode_header(request(port, DOWNLOAD_TYPE, valid_request))[0] != ERROR_TYPE
+    assert process.poll() is None
+
+
+@pytest.mark.parametrize("server_args", [[], ["--event-loop"]], ids=["threads", "loop"])
+def test_other_protocol_version_gets_an_error(start_server, server_args):
+    port, _, _ = start_server(*server_args)
+    packet = encode_packet(DOWNLOAD_TYPE, 7, b"file.bin")
+
+    with socket(AF_INET, SOCK_DGRAM) as client:
+        client.settimeout(2)
+        client.sendto(bytes([PROTOCOL_VERSION + 1]) + packet[1:], (HOST, port))
+        response, _ = client.recvfrom(4096)
+
+    # El ERROR viaja con la version del server, que el cliente puede mostrar
+    assert decode_header(response) == (ERROR_TYPE, 7)
+    assert b"Unsupported protocol version" in get_payload(response)
+
+
+def test_fast_open_upload_appears_only_when_complete(start_server):
+    port, storage, _ = start_server()
+    params = TransferParams(fast_open=True, file_size=10_000)
+    fast_open_request = build_request_payload("file.bin", params, b"x" * 100)
+
+    # El cliente manda el comienzo del archivo y nunca sigue con los datos
+    response = request(port, UPLOAD_TYPE, fast_open_request)
+
+    assert decode_header(response)[0] == ACK_TYPE
+    assert not (storage / "file.bin").exists()
+    # Sin handshake el server descarta el parcial, y la subida se puede repetir
+    time.sleep(MAX_TRIES * HANDSHAKE_TIMEOUT + 1)
+    assert not list((storage / ".partial").iterdir())
+    assert decode_header(request(port, UPLOAD_TYPE, fast_open_request))[0] == ACK_TYPE
+
+
+@pytest.mark.parametrize("server_args", [[], ["--event-loop"]], ids=["threads", "loop"])
+def test_repeated_fast_open_request_reaches_the_same_session(start_server, server_args):
+    port, _, _ = start_server(*server_args)
+    params = TransferParams(fast_open=True, file_size=10_000)
+    fast_open_request = encode_packet(
+        UPLOAD_TYPE, 0, build_request_payload("file.bin", params, b"x" * 100)
+    )
+
+    with socket(AF_INET, SOCK_DGRAM) as client:
+        client.settimeout(2)
+        client.sendto(fast_open_request, (HOST, port))
+        _, session_address = client.recvfrom(4096)
+        # El ACK se perdio: el cliente repite el pedido desde el mismo socket
+        client.sendto(fast_open_request, (HOST, port))
+        client.settimeout(HANDSHAKE_TIMEOUT * 3)
+        responses = []
+        while len(responses) < 3:
+            responses.append(client.recvfrom(4096))
+
+    # Solo la sesion que ya existe contesta, reenviando su ACK
+    assert all(decode_header(response)[0] == ACK_TYPE for response, _ in responses)
+    assert {address for _, address in responses} == {session_address}
+
+
+def test_stream_without_a_parallel_upload_is_rejected(start_server):
+    port, storage, _ = start_server()
+    (storage / "file.bin").write_bytes(b"stored")
+    params = TransferParams(stream=1, streams=2, file_size=12_000)
+
+    response = request(port, UPLOAD_TYPE, build_request_payload("file.bin", params))
+
+    # Solo se puede sumar a una subida que empezo su stream 0
+    assert decode_header(response)[0] == ERROR_TYPE
+    assert (storage / "file.bin").read_bytes() == b"stored"
+
+
+def test_workers_report_stats_on_sigusr1(tmp_path):
+    port = free_port()
+    server = subprocess.Popen(
+        [sys.executable, os.path.join(ROOT, "start-server.py"), "-H", HOST]
+        + ["-p", str(port), "-s", str(tmp_path), "--workers", "2"],
+        cwd=ROOT,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        text=True,
+    )
+    try:
+        wait_until_listening(port, server)
+        missing_file = build_request_payload("missing.bin", TransferParams())
+        request(port, DOWNLOAD_TYPE, missing_file)
+        server.send_signal(signal.SIGUSR1)
+        time.sleep(1)
+        server.send_signal(signal.SIGINT)
+        output, errors = server.communicate(timeout=10)
+    finally:
+        server.kill()
+
+    # Una linea por el SIGUSR1 y otra al apagarse, las dos con el pedido
+    assert output.count("Server stats: requests=1 ") == 2
+    assert "Traceback" not in errors
@@ -0,0 +1,112 @@
+import pytest
+
+from conftest import run_script
+from lib.ack_policy import AckPolicy
+from lib.impairment_proxy import LinkProfile
+from lib.rdt_shared import SESSION_IDLE_TIMEOUT, send_handshake_confirmation
+from lib.rdt_sr import send_file_sr_task
+from lib.rdt_sw import send_file_sw_task
+from lib.simulator import (
+    RECEIVER_ADDRESS,
+    SENDER_ADDRESS,
+    Simulator,
+    SyntheticChunks,
+    simulate_transfer,
+)
+
+
+@pytest.mark.parametrize("protocol", ["sw", "sr"])
+@pytest.mark.parametrize("loss", [0.0, 0.1])
+def test_transfer_completes_over_a_lossy_link(protocol, loss):
+    result = simulate_transfer(
+        protocol, 300_000, LinkProfile(delay=0.01, loss=loss), seed=1
+    )
+
+    assert result["completed"]
+    assert result["corrupted_chunks"] == 0
+
+
+def test_same_seed_same_run():
+    profile = LinkProfile(delay=0.01, jitter=0.005, loss=0.05)
+    first = simulate_transfer("sr", 500_000, profile, seed=7)
+    second = simulate_transfer("sr", 500_000, profile, seed=7)
+
+    assert first["simulated_time"] == second["simulated_time"]
+    assert first["sender"]["packets_sent"] == second["sender"]["packets_sent"]
+
+
+def test_delayed_acks_send_fewer_acks():
+    profile = LinkProfile(delay=0.01)
+    immediate = simulate_transfer("sr", 1_000_000, profile, seed=1)
+    delayed = simulate_transfer(
+        "sr", 1_000_000, profile, seed=1, ack_policy=AckPolicy(ack_every=8)
+    )
+
+    assert delayed["completed"]
+    assert delayed["receiver"]["acks_sent"] < immediate["receiver"]["acks_sent"] / 4
+
+
+@pytest.mark.parametrize(
+    "send_file_task", [send_file_sw_task, send_file_sr_task], ids=["sw", "sr"]
+)
+def test_sender_gives_up_when_the_receiver_disappears(send_file_task):
+    simulator = Simulator(seed=1)
+    sender_socket = simulator.add_endpoint(SENDER_ADDRESS, LinkProfile(delay=0.01))
+    # Nadie escucha en RECEIVER_ADDRESS: ningun ACK vuelve
+    simulator.start(
+        SENDER_ADDRESS,
+        send_file_task(
+            sender_socket,
+            None,
+            RECEIVER_ADDRESS,
+            False,
+            chunks=SyntheticChunks(300_000, 1024),
+            clock=simulator.clock,
+        ),
+    )
+    simulator.run()
+
+    sender = simulator.endpoints[SENDER_ADDRESS]
+    assert sender.result is False
+    assert SESSION_IDLE_TIMEOUT < sender.finish_time < 2 * SESSION_IDLE_TIMEOUT
+
+
+def test_late_handshake_confirmation_does_not_ack_data():
+    simulator = Simulator(seed=1)
+    sender_socket = simulator.add_endpoint(SENDER_ADDRESS, LinkProfile(delay=0.01))
+    receiver_socket = simulator.add_endpoint(RECEIVER_ADDRESS, LinkProfile(delay=0.01))
+
+    def confirm_and_vanish():
+        # Un reenvio del ACK del handshake se cruza con DATA #0, que se pierde
+        _, sender_address = yield None
+        send_handshake_confirmation(0, receiver_socket, sender_address, False)
+        while True:
+            yield None
+
+    simulator.start(RECEIVER_ADDRESS, confirm_and_vanish())
+    simulator.start(
+        SENDER_ADDRESS,
+        send_file_sr_task(
+            sender_socket,
+            None,
+            RECEIVER_ADDRESS,
+            False,
+            chunks=SyntheticChunks(1000, 1024),
+            clock=simulator.clock,
+        ),
+    )
+    simulator.run()
+
+    # DATA #0 nunca se confirmo: el emisor no puede dar el envio por completo
+    assert simulator.endpoints[SENDER_ADDRESS].result is False
+
+
+def test_simulate_script_without_delay_prints_no_rates():
+    # Sin delay la transferencia no lleva tiempo virtual: no hay goodput ni speedup
+    result = run_script("simulate.py", "--sizes", "100K", "--protocols", "sw,sr")
+
+    assert result.returncode == 0, result.stderr
+    lines = result.stdout.splitlines()
+    assert len(lines) == 2
+    assert all("goodput=        n/a" in line and "(n/a)" in line for line in lines)
+    assert "None" not in result.stdout
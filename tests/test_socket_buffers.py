@@ -0,0 +1,19 @@
+from socket import AF_INET, SOCK_DGRAM, socket
+
+from lib.rdt_shared import PACKET_SIZE, SKB_OVERHEAD, set_receive_buffer
+
+
+def test_receive_buffer_fits_the_window():
+    size = 32 * (PACKET_SIZE + SKB_OVERHEAD)
+    with socket(AF_INET, SOCK_DGRAM) as udp_socket:
+        assert set_receive_buffer(udp_socket, size, True) >= size
+
+
+def test_capped_receive_buffer_warns_once(capsys):
+    # Mas de lo que cualquier net.core.rmem_max permite
+    size = (1 << 31) - 1
+    with socket(AF_INET, SOCK_DGRAM) as udp_socket:
+        assert set_receive_buffer(udp_socket, size, True) < size
+        set_receive_buffer(udp_socket, size, True)
+
+    assert capsys.readouterr().out.count("WARNING") == 1
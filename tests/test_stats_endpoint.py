@@ -0,0 +1,99 @@
+import json
+import os
+import urllib.error
+import urllib.request
+
+import pytest
+
+from conftest import HOST, free_port, run_script
+from lib.stats_endpoint import start_stats_endpoint
+from lib.transfer_stats import SessionRegistry, TransferStats
+
+
+@pytest.fixture
+def endpoint():
+    """A stats endpoint with two running sessions, return its base URL"""
+    sessions = SessionRegistry()
+    stats = TransferStats()
+    for _ in range(3):
+        stats.on_send(1000, 2)
+    stats.on_retransmit()
+    sessions.add(
+        {"client": "10.0.0.2:8080", "file": 'a "quoted" name', "type": "download"},
+        stats,
+    )
+    sessions.add(
+        {"client": "10.0.0.3:8080", "file": "b", "type": "upload"}, TransferStats()
+    )
+    server = start_stats_endpoint(
+        HOST, 0, lambda: {"requests": 7}, sessions.session_snapshots
+    )
+    yield f"http://{HOST}:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+def get(url):
+    with urllib.request.urlopen(url, timeout=5) as response:
+        return response.headers["Content-Type"], response.read().decode()
+
+
+def test_json_stats(endpoint):
+    content_type, body = get(endpoint + "/stats")
+
+    assert content_type == "application/json"
+    stats = json.loads(body)
+    assert stats["server"] == {"requests": 7}
+    session, _ = stats["sessions"]
+    assert session["file"] == 'a "quoted" name'
+    assert session["packets_sent"] == 4
+    assert session["packets_retransmitted"] == 1
+    assert session["payload_bytes"] == 3000
+
+
+def test_prometheus_metrics(endpoint):
+    content_type, body = get(endpoint + "/metrics")
+
+    assert content_type.startswith("text/plain")
+    lines = body.splitlines()
+    assert "rdt_requests 7" in lines
+    labels = (
+        'session="0",client="10.0.0.2:8080",'
+        'file="a \\"quoted\\" name",type="download"'
+    )
+    assert f"rdt_session_packets_sent{{{labels}}} 4" in lines
+    assert f"rdt_session_payload_bytes{{{labels}}} 3000" in lines
+    labels = 'session="1",client="10.0.0.3:8080",file="b",type="upload"'
+    assert f"rdt_session_packets_sent{{{labels}}} 0" in lines
+    # Las series de cada metrica van juntas, como pide el formato
+    names = [line.split("{")[0].split(" ")[0] for line in lines]
+    groups = [name for i, name in enumerate(names) if i == 0 or name != names[i - 1]]
+    assert len(groups) == len(set(groups))
+
+
+def test_unknown_path_is_not_found(endpoint):
+    with pytest.raises(urllib.error.HTTPError) as error:
+        get(endpoint + "/other")
+    assert error.value.code == 404
+
+
+def test_server_counts_its_sessions(start_server, tmp_path):
+    stats_port = free_port()
+    port, _, _ = start_server(
+        "--stats-port",
+        stats_port,
+        setup=lambda storage: (storage / "file.bin").write_bytes(os.urandom(50_000)),
+    )
+    (tmp_path / "downloads").mkdir()
+
+    download = run_script(
+        "download.py", "-H", HOST, "-p", port, "-d", tmp_path / "downloads",
+        "-n", "file.bin", "-r",
+    )
+    assert download.returncode == 0, download.stdout + download.stderr
+
+    _, body = get(f"http://{HOST}:{stats_port}/stats")
+    server_stats = json.loads(body)["server"]
+    assert server_stats["requests"] == 1
+    assert server_stats["sessions_started"] == 1
+    assert server_stats["transfer_payload_bytes"] == 50_000
@@ -0,0 +1,113 @@
+import pytest
+
+from lib.transfer_params import (
+    MAX_WINDOW_SIZE,
+    MIN_PAYLOAD_SIZE,
+    PROTOCOL_SR,
+    TransferParams,
+    build_request_payload,
+    get_stream_range,
+    parse_request_payload,
+)
+
+
+def test_encode_decode_round_trip():
+    params = TransferParams(PROTOCOL_SR, 2048, 64)
+    params.resume = True
+    params.offset = 4096
+    params.checksum = "abc"
+    params.stream = 1
+    params.streams = 3
+    params.length = 100
+    params.file_size = 10000
+    params.compression = "zlib"
+    params.ack_delay = 0.005
+
+    decoded = TransferParams.decode(params.encode())
+
+    assert decoded.encode() == params.encode()
+
+
+def test_decode_doesnt_inherit_file_fields_from_defaults():
+    defaults = TransferParams(PROTOCOL_SR, 2048, 64)
+    defaults.offset = 10
+    defaults.compression = "zlib"
+
+    decoded = TransferParams.decode(b"window_size=8", defaults)
+
+    assert (decoded.protocol, decoded.payload_size, decoded.window_size) == (
+        PROTOCOL_SR,
+        2048,
+        8,
+    )
+    assert decoded.offset == 0
+    assert decoded.compression == ""
+
+
+def test_accept_caps_the_proposal():
+    limits = TransferParams(PROTOCOL_SR, 4096, 32)
+    proposal = TransferParams(PROTOCOL_SR, 1, 100000)
+    proposal.compression = "unknown"
+
+    accepted = proposal.accept(limits)
+
+    assert accepted.payload_size == MIN_PAYLOAD_SIZE
+    assert accepted.window_size == min(32, MAX_WINDOW_SIZE)
+    assert accepted.compression == ""
+
+
+def test_request_payload_round_trip():
+    params = TransferParams(PROTOCOL_SR)
+    params.fast_open = True
+    params.file_size = 5
+
+    payload = build_request_payload("file.bin", params, b"he\x00lo")
+    filename, parsed, data = parse_request_payload(payload, TransferParams())
+
+    assert (filename, parsed.protocol, parsed.file_size, data) == (
+        "file.bin",
+        PROTOCOL_SR,
+        5,
+        b"he\x00lo",
+    )
+
+
+def test_stream_ranges_cover_the_file():
+    ranges = [get_stream_range(10000, 1024, stream, 3) for stream in range(3)]
+
+    assert ranges[0][0] == 0
+    for (offset, length), (next_offset, _) in zip(ranges, ranges[1:]):
+        assert offset + length == next_offset
+        assert offset % 1024 == 0
+    assert sum(length for _, length in ranges) == 10000
+
+
+@pytest.mark.parametrize(
+    "payload",
+    [
+        b"log.txt\x00protocol=sr;payload_size=abc",
+        b"log.txt\x00window_size=-4",
+        b"log.txt\x00offset=-2",
+        b"log.txt\x00length=-1",
+        b"log.txt\x00file_size=99999999999999999999999",
+        b"log.txt\x00stream=-1;streams=2",
+        b"log.txt\x00streams=0",
+        b"log.txt\x00ack_delay=nan",
+        b"log.txt\x00ack_delay=-5",
+        b"log.txt\x00protocol=sr\xff",
+        b"log\xff.txt\x00protocol=sr",
+        b"../etc/passwd\x00protocol=sr",
+        b"\x00protocol=sr",
+        b"a" * 300,
+    ],
+)
+def test_malformed_requests_are_rejected(payload):
+    assert parse_request_payload(payload, TransferParams()) is None
+
+
+def test_unknown_upload_offset_is_accepted():
+    _, params, _ = parse_request_payload(
+        b"file.bin\x00resume=1;offset=-1", TransferParams()
+    )
+
+    assert params.offset == -1
@@ -2,43 +2,246 @@ from lib.argument_parser import *
 from pathlib import Path
 from socket import *
 from lib.rdt_shared import *
+from lib.congestion_control import CONGESTION_CONTROLS
+from lib.content_index import file_content_hash
+from lib.packet_trace import PacketTrace
+from lib.pmtu import probe_path_mtu
+from lib.rdt_sr import send_file_sr
+from lib.rdt_sw import send_file_sw
+from lib.resume import UNKNOWN_OFFSET, verify_offset
+from lib.rtt_estimator import RttEstimator
+from lib.transfer_params import *
+from lib.transfer_stats import TransferStats
+import threading
 import time
 
+
+def request_upload(udp_socket, params, data=b""):
+    return send_handshake(
+        udp_socket,
+        Type.UPLOAD,
+        (args.host, args.port),
+        build_request_payload(args.name, params, data),
+        args.verbose,
+    )
+
+
+def read_fast_open_data(params):
+    """The first bytes of the file that fit in the UPLOAD request"""
+    request_size = len(build_request_payload(args.name, params))
+    # El server recibe los pedidos en un buffer de PACKET_SIZE
+    size = min(params.payload_size, PAYLOAD_SIZE) - request_size - len(PARAMS_SEPARATOR)
+    with open(filepath, "rb") as file:
+        return file.read(max(size, 0))
+
+
+def upload(udp_socket, receiver_address, params):
+    """Send the file, or the range of one stream, to the server session"""
+    transfer_stats = TransferStats()
+    trace = None
+    if packet_trace is not None:
+        trace = packet_trace.session(
+            {
+                "file": args.name,
+                "type": "upload",
+                "protocol": params.protocol,
+                "stream": params.stream,
+            }
+        )
+    if params.protocol == PROTOCOL_SR:
+        rtt = RttEstimator(SENDER_TIMEOUT_SR, ack_delay=params.ack_delay)
+        congestion_control = CONGESTION_CONTROLS[args.cc](
+            params.window_size, record_history=bool(args.cwnd_log)
+        )
+        udp_socket.settimeout(rtt.timeout())
+        if params.stream == 0:
+            verbose_print(f"Upload using SELECTIVE REPEAT started", True)
+        completed = send_file_sr(
+            udp_socket,
+            filepath,
+            receiver_address,
+            args.verbose,
+            rtt,
+            window_size=params.window_size,
+            congestion_control=congestion_control,
+            payload_size=params.payload_size,
+            offset=params.offset,
+            length=params.length,
+            compression=params.compression,
+            stats=transfer_stats,
+            trace=trace,
+        )
+        if args.cwnd_log:
+            # Un archivo por stream
+            cwnd_log = args.cwnd_log
+            if params.streams > 1:
+                cwnd_log += f".{params.stream}"
+            congestion_control.dump(cwnd_log)
+    else:
+        rtt = RttEstimator(SENDER_TIMEOUT_SW)
+        udp_socket.settimeout(rtt.timeout())
+        if params.stream == 0:
+            verbose_print(f"Upload using STOP AND WAIT started", True)
+        completed = send_file_sw(
+            udp_socket,
+            filepath,
+            receiver_address,
+            args.verbose,
+            rtt,
+            payload_size=params.payload_size,
+            offset=params.offset,
+            length=params.length,
+            compression=params.compression,
+            stats=transfer_stats,
+            trace=trace,
+        )
+    prefix = f"Stream {params.stream} " if params.streams > 1 else ""
+    verbose_print(f"{prefix}Transfer stats: {transfer_stats}", True)
+    if not completed:
+        verbose_print(f"ERROR: The {prefix.lower()}upload was interrupted", True)
+    return completed, rtt
+
+
+def upload_stream(udp_socket, receiver_address, params, results, rtts):
+    results[params.stream], rtts[params.stream] = upload(
+        udp_socket, receiver_address, params
+    )
+    udp_socket.close()
+
+
 argsparser = ArgumentParser(ParserType.UPLOAD)
 args = argsparser.get_args(ParserType.UPLOAD)
-
-if args.protocol:
-    from lib.rdt_sr import send_file_sr
-else:
-    from lib.rdt_sw import send_file_sw
+filepath = args.src + "/" + args.name
+file_size = Path(filepath).stat().st_size
+packet_trace = PacketTrace() if args.trace else None
 
 verbose_print(f"Establishing connection to server...", True)
 
 udp_socket = socket(AF_INET, SOCK_DGRAM)
 udp_socket.settimeout(HANDSHAKE_TIMEOUT)
 
-response_type, receiver_address = send_handshake(
-    udp_socket, Type.UPLOAD, (args.host, args.port), args.name, args.verbose
+params = TransferParams(
+    PROTOCOL_SR if args.protocol else PROTOCOL_SW, args.payload_size, args.window
 )
+params.compression = args.compress
+if args.pmtu:
+    probed_payload_size = probe_path_mtu(
+        udp_socket, (args.host, args.port), args.verbose
+    )
+    if probed_payload_size is not None:
+        params.payload_size = min(params.payload_size, probed_payload_size)
+if args.resume:
+    # El server nos dice cuanto tiene del archivo y lo comparamos con el nuestro
+    params.resume = True
+    params.offset = UNKNOWN_OFFSET
+if args.dedup:
+    # Si el server ya tiene este contenido no hace falta transferirlo
+    params.content_hash = file_content_hash(filepath)
+# No tiene sentido abrir streams que se quedarian sin chunks para enviar
+n_streams = max(1, min(args.streams, -(-file_size // params.payload_size)))
+if n_streams > 1:
+    params.streams = n_streams
+    params.file_size = file_size
+fast_open_data = b""
+if args.fast_open:
+    # Con el tamaño el server sabe si el archivo entero entro en el pedido
+    params.fast_open = True
+    params.file_size = file_size
+    fast_open_data = read_fast_open_data(params)
+
+# El stream 0 se conecta primero: es el que el server valida como un UPLOAD
+# nuevo, los demas escriben en el archivo que ese stream crea
+response_type, receiver_address, response_payload = request_upload(
+    udp_socket, params, fast_open_data
+)
+
+if response_type == Type.ACK and args.resume:
+    accepted_params = TransferParams.decode(response_payload, params)
+    if verify_offset(filepath, accepted_params.offset, accepted_params.checksum) != (
+        accepted_params.offset
+    ):
+        verbose_print(
+            "The server's partial file doesn't match ours, uploading from the start",
+            True,
+        )
+        # La sesion anterior espera DATA desde su offset, pedimos otra desde
+        # otro socket para que el server la trate como un pedido nuevo
+        udp_socket.close()
+        udp_socket = socket(AF_INET, SOCK_DGRAM)
+        udp_socket.settimeout(HANDSHAKE_TIMEOUT)
+        params.offset = 0
+        response_type, receiver_address, response_payload = request_upload(
+            udp_socket, params
+        )
 
 if response_type == Type.ACK:
-    # Server nos devolvió el ACK, y podemos continuar normalmente
+    # Server nos devolvió el ACK con los parametros aceptados, y podemos continuar normalmente
+    accepted_params = TransferParams.decode(response_payload, params)
+    verbose_print(f"Transfer params: {accepted_params}", args.verbose)
+    if accepted_params.deduplicated:
+        verbose_print(
+            f"The server already stores this content, nothing to upload", True
+        )
+        udp_socket.close()
+        exit(0)
+    if accepted_params.resume and accepted_params.offset:
+        verbose_print(f"Resuming upload from byte {accepted_params.offset}", True)
+    if accepted_params.resume and accepted_params.offset >= file_size > 0:
+        verbose_print(f"The server already has the whole file", True)
+        udp_socket.close()
+        exit(0)
+    if accepted_params.fast_open:
+        if accepted_params.offset >= file_size:
+            verbose_print(f"The whole file fit in the upload request", True)
+            udp_socket.close()
+            exit(0)
+        verbose_print(
+            f"The upload request carried the first {accepted_params.offset} bytes",
+            args.verbose,
+        )
     start_time = time.time()
-    if args.protocol:
-        udp_socket.settimeout(SENDER_TIMEOUT_SR)
-        verbose_print(f"Upload using SELECTIVE REPEAT started", True)
-        send_file_sr(
-            udp_socket, args.src + "/" + args.name, receiver_address, args.verbose
+
+    results = [False] * n_streams
+    rtts = [None] * n_streams
+    threads = [
+        threading.Thread(
+            target=upload_stream,
+            args=(udp_socket, receiver_address, accepted_params, results, rtts),
         )
-    else:
-        udp_socket.settimeout(SENDER_TIMEOUT_SW)
-        verbose_print(f"Upload using STOP AND WAIT started", True)
-        send_file_sw(
-            udp_socket, args.src + "/" + args.name, receiver_address, args.verbose
+    ]
+    threads[0].start()
+    for stream in range(1, n_streams):
+        # Cada stream es una sesion aparte, con su propio socket
+        stream_socket = socket(AF_INET, SOCK_DGRAM)
+        stream_socket.settimeout(HANDSHAKE_TIMEOUT)
+        params.stream = stream
+        response_type, stream_address, response_payload = request_upload(
+            stream_socket, params
+        )
+        if response_type != Type.ACK:
+            stream_socket.close()
+            break
+        stream_params = TransferParams.decode(response_payload, params)
+        verbose_print(f"Transfer params: {stream_params}", args.verbose)
+        thread = threading.Thread(
+            target=upload_stream,
+            args=(stream_socket, stream_address, stream_params, results, rtts),
         )
+        thread.start()
+        threads.append(thread)
+    for thread in threads:
+        thread.join()
+    if response_type == Type.ACK and not all(results):
+        response_type = Type.ERROR
 
-    end_time = time.time()
-    verbose_print(f"Upload time: {end_time - start_time}", True)
+    if response_type == Type.ACK:
+        end_time = time.time()
+        verbose_print(f"Upload time: {end_time - start_time}", True)
+        for stream, rtt in enumerate(rtts):
+            prefix = f"Stream {stream} " if n_streams > 1 else ""
+            verbose_print(f"{prefix}RTT estimate: {rtt}", True)
+        if packet_trace is not None:
+            packet_trace.dump(args.trace)
 
 if response_type == Type.ERROR:
     # Hubo algún error